@@ -4,3 +4,16 @@ from django.apps import AppConfig
 class PurchaseOrderConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'purchase_order'
+
+    def ready(self):
+        from django.db.backends.signals import connection_created
+        from django.db.models.signals import post_delete
+        from . import checks  # noqa: F401
+        from .changes import record_deleted_order
+        from .instrumentation import install_query_recorder
+        from .models import PurchaseOrder
+        from .reporting import remove_deleted_order
+
+        connection_created.connect(install_query_recorder)
+        post_delete.connect(remove_deleted_order, sender=PurchaseOrder)
+        post_delete.connect(record_deleted_order, sender=PurchaseOrder)
@@ -0,0 +1,78 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.utils import timezone
+
+from .models import ArchivedLineItem, ArchivedPurchaseOrder, LineItem, PurchaseOrder
+
+ARCHIVE_BATCH_SIZE = 1000
+
+
+def archive_cutoff(days=None):
+    """
+        Returns the order_time before which orders are archived, PURCHASE_ORDER_ARCHIVE_AFTER_DAYS ago by default
+    """
+    days = getattr(settings, 'PURCHASE_ORDER_ARCHIVE_AFTER_DAYS', 90) if days is None else days
+    return timezone.now() - timedelta(days=days)
+
+
+def copy_rows(cursor, connection, source, target, key_column, ids):
+    """
+        Copies the rows of source whose key_column is in ids to target with one INSERT ... SELECT,
+        target having the same column names as source
+    """
+    quote_name = connection.ops.quote_name
+    columns = ', '.join(quote_name(field.column) for field in target._meta.concrete_fields)
+    cursor.execute(
+        f"INSERT INTO {quote_name(target._meta.db_table)} ({columns}) "
+        f"SELECT {columns} FROM {quote_name(source._meta.db_table)} "
+        f"WHERE {quote_name(key_column)} IN ({', '.join(['%s'] * len(ids))})",
+        ids,
+    )
+    return cursor.rowcount
+
+
+def delete_rows(cursor, connection, model, ids):
+    """
+        Deletes the rows of model whose primary key is in ids with one DELETE ... WHERE IN, without loading them.
+        No delete signal is sent and no relation is cascaded: the callers delete the related rows first and do
+        the work of the post_delete receivers themselves. Returns the number of rows deleted.
+    """
+    quote_name = connection.ops.quote_name
+    cursor.execute(
+        f"DELETE FROM {quote_name(model._meta.db_table)} "
+        f"WHERE {quote_name(model._meta.pk.column)} IN ({', '.join(['%s'] * len(ids))})",
+        ids,
+    )
+    return cursor.rowcount
+
+
+def archive_orders(before, batch_size=ARCHIVE_BATCH_SIZE, using='default'):
+    """
+        Moves the orders placed before the given time and their line items to the archive tables, oldest first,
+        one transaction per batch of orders. Returns the number of orders and line items archived.
+        The rows keep their ids, versions and totals, and the spend rollup still counts them.
+    """
+    connection = connections[using]
+    orders_archived = line_items_archived = 0
+    while True:
+        with transaction.atomic(using=using):
+            order_ids = list(
+                PurchaseOrder.objects.using(using).select_for_update(of=('self',)).filter(order_time__lt=before)
+                .order_by('order_time', 'id').values_list('id', flat=True)[:batch_size]
+            )
+            if not order_ids:
+                break
+            with connection.cursor() as cursor:
+                copy_rows(cursor, connection, PurchaseOrder, ArchivedPurchaseOrder, 'id', order_ids)
+                line_items_archived += copy_rows(cursor, connection, LineItem, ArchivedLineItem, 'purchase_order_id', order_ids)
+                LineItem.objects.using(using).filter(purchase_order_id__in=order_ids).delete()
+                # The orders are moved and not deleted, the post_delete receivers must not run
+                orders_archived += delete_rows(cursor, connection, PurchaseOrder, order_ids)
+    return orders_archived, line_items_archived
+
+
+def count_archivable_orders(before, using='default'):
+    orders = PurchaseOrder.objects.using(using).filter(order_time__lt=before)
+    return orders.count(), LineItem.objects.using(using).filter(purchase_order__in=orders).count()
@@ -0,0 +1,324 @@
+import asyncio
+import functools
+import json
+import time
+
+from asgiref.sync import sync_to_async
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.decorators import method_decorator
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework import status
+from rest_framework.utils.encoders import JSONEncoder
+
+from .cache import get_response_cache
+from .changes import CursorExpired, alog_bounds, aread_changes, feed_setting, parse_cursor, parse_limit, serialize_change, start_cursor
+from .filters import filter_purchase_orders, include_archived
+from .models import LineItem, PurchaseOrder, ArchivedLineItem, ArchivedPurchaseOrder, VERSION_FIELDS
+from .pagination import PurchaseOrderCursorPagination, parse_ordering
+from .serializers import bulk_delete_purchase_orders
+from .read_serializers import FIELDS, order_rows, line_item_rows, selected_fields, serialize_purchase_orders
+from .idempotency import REPLAYED_HEADER, idempotent_response, stored_headers
+from .instrumentation import timed
+from .views import ARCHIVED_ORDER_ERROR, create_purchase_order, update_purchase_order, validator_headers
+
+
+def json_response(data, status=status.HTTP_200_OK, headers=None):
+    """
+        Renders the data like DRF's JSONRenderer does
+    """
+    with timed('render'):
+        return JsonResponse(
+            data, status=status, headers=headers, safe=False, encoder=JSONEncoder,
+            json_dumps_params={'separators': (',', ':'), 'ensure_ascii': False},
+        )
+
+
+def parse_json(request):
+    try:
+        return json.loads(request.body or b'null')
+    except ValueError:
+        return None
+
+
+def render_response(response):
+    """
+        Renders the DRF Response of a write run in a thread, with the headers stored for idempotent replays
+    """
+    headers = dict(stored_headers(response))
+    if response.has_header(REPLAYED_HEADER):
+        headers[REPLAYED_HEADER] = response[REPLAYED_HEADER]
+    return json_response(response.data, status=response.status_code, headers=headers)
+
+
+class RequestQueryParams:
+    """
+        Gives a Django request the query_params attribute expected by the DRF paginator
+    """
+    def __init__(self, request):
+        self._request = request
+        self.query_params = request.GET
+
+    def __getattr__(self, name):
+        return getattr(self._request, name)
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class AsyncPurchaseOrderListCreateView(View):
+    """
+        Async version of PurchaseOrderListCreateView for ASGI deployments
+    """
+
+    async def get(self, request, *args, **kwargs):
+        """
+            This method gets the PurchaseOrders matching the filters one page at a time in the ?ordering= order,
+            with only the fields selected by ?fields= and ?expand=. The archived orders are only read
+            with ?include_archived=1.
+        """
+        try:
+            fields = selected_fields(request.GET)
+            ordering = parse_ordering(request.GET)
+            queryset = filter_purchase_orders(PurchaseOrder.objects.all(), request.GET)
+            archived_queryset = None
+            if include_archived(request.GET):
+                archived_queryset = filter_purchase_orders(ArchivedPurchaseOrder.objects.all(), request.GET)
+        except ValueError as error:
+            return json_response({"error": str(error)}, status=status.HTTP_400_BAD_REQUEST)
+
+        paginator = PurchaseOrderCursorPagination()
+        rows = order_rows(queryset, ordering[0].lstrip('-'), fields=fields)
+        if archived_queryset is None:
+            page = await paginator.apaginate_queryset(rows, RequestQueryParams(request), view=self)
+            line_item_models = (LineItem,)
+        else:
+            archived_rows = order_rows(archived_queryset, ordering[0].lstrip('-'), fields=fields)
+            page = await paginator.apaginate_querysets([rows, archived_rows], RequestQueryParams(request), view=self)
+            line_item_models = (LineItem, ArchivedLineItem)
+        line_items = []
+        if 'line_items' in fields:
+            order_ids = [row['id'] for row in page]
+            for model in line_item_models:
+                line_items += [row async for row in line_item_rows(order_ids, using=queryset.db, model=model)]
+
+        return json_response({
+            'next': paginator.get_next_link(),
+            'previous': paginator.get_previous_link(),
+            'results': serialize_purchase_orders(page, line_items, fields),
+        })
+
+    async def post(self, request, *args, **kwargs):
+        """
+            This method creates new PurchaseOrder.
+            The write runs in a thread with the Idempotency-Key check, the async ORM has no transaction support.
+        """
+        response = await sync_to_async(idempotent_response)(
+            request, functools.partial(create_purchase_order, request, parse_json(request))
+        )
+        return render_response(response)
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class AsyncPurchaseOrderDetailsView(View):
+    """
+        Async version of PurchaseOrderDetailsView for ASGI deployments
+    """
+
+    async def get(self, request, id, *args, **kwargs):
+        """
+            This method returns the specific purchase order with given id, from the archive when it was archived,
+            or 304 when the client has its version. Like the sync view it only reads the version of the order
+            when its serialized form is in the response cache.
+            Only the fields selected by ?fields= and ?expand= are read and returned.
+        """
+        try:
+            fields = selected_fields(request.GET)
+        except ValueError as error:
+            return json_response({"error": str(error)}, status=status.HTTP_400_BAD_REQUEST)
+
+        order_model, line_item_model = PurchaseOrder, LineItem
+        version = await PurchaseOrder.objects.filter(pk=id).values('version', 'updated_at').afirst()
+        if version is None:
+            order_model, line_item_model = ArchivedPurchaseOrder, ArchivedLineItem
+            version = await ArchivedPurchaseOrder.objects.filter(pk=id).values('version', 'updated_at').afirst()
+        if version is None:
+            return json_response({'error': 'Purchase Order not found'}, status=status.HTTP_404_NOT_FOUND)
+
+        headers = validator_headers(id, **version)
+        not_modified = get_conditional_response(
+            request, etag=headers['ETag'], last_modified=int(version['updated_at'].timestamp())
+        )
+        if not_modified is not None:
+            for header, value in headers.items():
+                not_modified[header] = value
+            return not_modified
+
+        # Only the full representation is cached
+        response_cache = get_response_cache() if fields == FIELDS else None
+        data = response_cache and await response_cache.aget(id, (version['version'], version['updated_at']))
+        if data is None:
+            queryset = order_model.objects.filter(pk=id)
+            row = await order_rows(queryset, *VERSION_FIELDS, fields=fields).afirst()
+            if row is None:
+                return json_response({'error': 'Purchase Order not found'}, status=status.HTTP_404_NOT_FOUND)
+            line_items = []
+            if 'line_items' in fields:
+                line_items = [line_item async for line_item in line_item_rows([id], using=queryset.db, model=line_item_model)]
+
+            headers = validator_headers(id, row['version'], row['updated_at'])
+            [data] = serialize_purchase_orders([row], line_items, fields)
+            if response_cache is not None:
+                await response_cache.aset(id, (row['version'], row['updated_at']), data)
+
+        return json_response(data, headers=headers)
+
+    async def put(self, request, id, *args, **kwargs):
+        """
+            This method updates a specific purchase order with given id.
+            The write runs in a thread with the Idempotency-Key check, the async ORM has no transaction support.
+        """
+        response = await sync_to_async(idempotent_response)(
+            request, functools.partial(update_purchase_order, request, id, parse_json(request))
+        )
+        return render_response(response)
+
+    async def delete(self, request, id, *args, **kwargs):
+        """
+            This method deletes a specific purchase order with given id and its line items like the sync view,
+            the transactional delete runs in a thread
+        """
+        deleted, _ = await sync_to_async(bulk_delete_purchase_orders)(PurchaseOrder.objects.filter(pk=id), max_count=1)
+        if not deleted:
+            if await ArchivedPurchaseOrder.objects.filter(pk=id).aexists():
+                return json_response({'error': ARCHIVED_ORDER_ERROR}, status=status.HTTP_409_CONFLICT)
+            return json_response({"detail": "Purchase Order with given ID does not exist"}, status=status.HTTP_404_NOT_FOUND)
+
+        return HttpResponse(status=status.HTTP_204_NO_CONTENT)
+
+
+def parse_timeout(value):
+    """
+        Parses the seconds a long-poll waits for changes, capped by LONG_POLL_TIMEOUT
+    """
+    longest = feed_setting('LONG_POLL_TIMEOUT')
+    if value is None or value == '':
+        return longest
+    try:
+        timeout = float(value)
+    except ValueError:
+        timeout = -1
+    if not 0 <= timeout < float('inf'):
+        raise ValueError("timeout must be a number of seconds.")
+    return min(timeout, longest)
+
+
+def change_event(change):
+    return f"id: {change.sequence}\nevent: change\ndata: {json.dumps(serialize_change(change), separators=(',', ':'))}\n\n"
+
+
+class ChangeStreams:
+    """
+        Counts the SSE streams open in this process, at most MAX_STREAMS are served at once.
+        A slot is taken by the stream itself once it starts, a response dropped before its first chunk holds none.
+    """
+    def __init__(self):
+        self.open = 0
+
+    def full(self):
+        return self.open >= feed_setting('MAX_STREAMS')
+
+    def acquire(self):
+        if self.full():
+            return False
+        self.open += 1
+        return True
+
+    def release(self):
+        self.open -= 1
+
+
+change_streams = ChangeStreams()
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class AsyncPurchaseOrderChangesView(View):
+    """
+        Change feed of the purchase orders, as a Server-Sent Events stream when the client accepts
+        text/event-stream and as a long-poll otherwise
+    """
+
+    async def get(self, request, *args, **kwargs):
+        """
+            This method returns the changes logged after the ?after= sequence number, or after the Last-Event-ID
+            header of a reconnecting SSE client. Without a cursor the feed starts at the end of the log.
+        """
+        stream = 'text/event-stream' in request.headers.get('Accept', '')
+        cursor = request.headers.get('Last-Event-ID') if stream else None
+        try:
+            after = parse_cursor(request.GET.get('after') if cursor is None else cursor)
+            limit = parse_limit(request.GET.get('limit'))
+            timeout = parse_timeout(request.GET.get('timeout'))
+            after = start_cursor(after, await alog_bounds())
+        except ValueError as error:
+            return json_response({"error": str(error)}, status=status.HTTP_400_BAD_REQUEST)
+        except CursorExpired as error:
+            return json_response({"error": str(error)}, status=status.HTTP_410_GONE)
+
+        if not stream:
+            return await self.long_poll(after, limit, timeout)
+
+        if change_streams.full():
+            retry_after = str(max(1, int(feed_setting('POLL_INTERVAL'))))
+            return json_response(
+                {"error": "Too many open change streams."}, status=status.HTTP_503_SERVICE_UNAVAILABLE,
+                headers={'Retry-After': retry_after},
+            )
+        return StreamingHttpResponse(
+            self.events(after, limit), content_type='text/event-stream',
+            headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'},
+        )
+
+    async def long_poll(self, after, limit, timeout):
+        """
+            Waits up to timeout seconds for changes and returns them with the cursor to pass as ?after= next
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            changes, cursor = await aread_changes(after, limit)
+            if changes or time.monotonic() >= deadline:
+                break
+            await asyncio.sleep(min(feed_setting('POLL_INTERVAL'), max(deadline - time.monotonic(), 0)))
+        return json_response({"changes": [serialize_change(change) for change in changes], "cursor": cursor})
+
+    async def events(self, after, limit):
+        """
+            Yields the changes as SSE events, one batch at a time: the next batch is only read once the previous
+            one was sent, so a slow client slows its own reads instead of buffering changes in the server.
+            The stream ends after MAX_STREAM_DURATION seconds, the client reconnects with Last-Event-ID.
+        """
+        poll_interval = feed_setting('POLL_INTERVAL')
+        if not change_streams.acquire():
+            # The last slots were taken since get() checked them, the client retries later
+            yield f"retry: {int(poll_interval * 1000)}\n\n"
+            return
+        try:
+            heartbeat_interval = feed_setting('HEARTBEAT_INTERVAL')
+            deadline = time.monotonic() + feed_setting('MAX_STREAM_DURATION')
+            yield f"retry: {int(poll_interval * 1000)}\n\n"
+            sent_at = time.monotonic()
+            while True:
+                changes, after = await aread_changes(after, limit)
+                if changes:
+                    yield ''.join(change_event(change) for change in changes)
+                    sent_at = time.monotonic()
+                if time.monotonic() >= deadline:
+                    break
+                if len(changes) == limit:
+                    # Behind the end of the log, read the next batch right away
+                    continue
+                if time.monotonic() - sent_at >= heartbeat_interval:
+                    yield ": keepalive\n\n"
+                    sent_at = time.monotonic()
+                await asyncio.sleep(poll_interval)
+        finally:
+            change_streams.release()
@@ -0,0 +1,170 @@
+import threading
+from collections import OrderedDict
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+
+class ResponseCache:
+    """
+        Caches serialized purchase orders by id. Every entry remembers the version of the order it was
+        built from and is only served for that version, so a missed invalidation can never serve stale data.
+        The version is the (version, updated_at) pair of the order, which also tells apart orders reusing an id.
+    """
+    def __init__(self, **options):
+        self.options = options
+        self._stats_lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0, 'stores': 0, 'invalidations': 0}
+
+    def _count(self, name):
+        with self._stats_lock:
+            self.stats[name] += 1
+
+    def get(self, purchase_order_id, version):
+        return self._lookup(self._get(purchase_order_id), version)
+
+    async def aget(self, purchase_order_id, version):
+        return self._lookup(await self._aget(purchase_order_id), version)
+
+    def _lookup(self, entry, version):
+        if entry is not None and entry[0] == version:
+            self._count('hits')
+            return entry[1]
+        self._count('misses')
+        return None
+
+    def set(self, purchase_order_id, version, data):
+        self._count('stores')
+        self._set(purchase_order_id, (version, data))
+
+    async def aset(self, purchase_order_id, version, data):
+        self._count('stores')
+        await self._aset(purchase_order_id, (version, data))
+
+    def invalidate(self, *purchase_order_ids):
+        for purchase_order_id in purchase_order_ids:
+            self._count('invalidations')
+            self._delete(purchase_order_id)
+
+    def get_stats(self):
+        with self._stats_lock:
+            stats = dict(self.stats)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_ratio'] = stats['hits'] / lookups if lookups else 0.0
+        stats['backend'] = type(self).__name__
+        return stats
+
+    def _get(self, purchase_order_id):
+        raise NotImplementedError
+
+    def _set(self, purchase_order_id, entry):
+        raise NotImplementedError
+
+    def _delete(self, purchase_order_id):
+        raise NotImplementedError
+
+    async def _aget(self, purchase_order_id):
+        return await sync_to_async(self._get)(purchase_order_id)
+
+    async def _aset(self, purchase_order_id, entry):
+        await sync_to_async(self._set)(purchase_order_id, entry)
+
+
+class LocalMemoryResponseCache(ResponseCache):
+    """
+        Per process LRU cache holding at most MAX_ENTRIES orders
+    """
+    def __init__(self, **options):
+        super().__init__(**options)
+        self.max_entries = options.get('MAX_ENTRIES', 10000)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _get(self, purchase_order_id):
+        with self._lock:
+            entry = self._entries.get(purchase_order_id)
+            if entry is not None:
+                self._entries.move_to_end(purchase_order_id)
+            return entry
+
+    def _set(self, purchase_order_id, entry):
+        with self._lock:
+            self._entries[purchase_order_id] = entry
+            self._entries.move_to_end(purchase_order_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _delete(self, purchase_order_id):
+        with self._lock:
+            self._entries.pop(purchase_order_id, None)
+
+    # The entries are in memory, the async views read them without a thread
+    async def _aget(self, purchase_order_id):
+        return self._get(purchase_order_id)
+
+    async def _aset(self, purchase_order_id, entry):
+        self._set(purchase_order_id, entry)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class DjangoResponseCache(ResponseCache):
+    """
+        Stores the orders in one of the Django CACHES, so that they are shared between processes
+    """
+    def __init__(self, **options):
+        super().__init__(**options)
+        self.cache = caches[options.get('ALIAS', 'default')]
+        self.timeout = options.get('TIMEOUT', 300)
+
+    def _key(self, purchase_order_id):
+        return f'purchase_order:{purchase_order_id}'
+
+    def _get(self, purchase_order_id):
+        return self.cache.get(self._key(purchase_order_id))
+
+    def _set(self, purchase_order_id, entry):
+        self.cache.set(self._key(purchase_order_id), entry, self.timeout)
+
+    def _delete(self, purchase_order_id):
+        self.cache.delete(self._key(purchase_order_id))
+
+    async def _aget(self, purchase_order_id):
+        return await self.cache.aget(self._key(purchase_order_id))
+
+    async def _aset(self, purchase_order_id, entry):
+        await self.cache.aset(self._key(purchase_order_id), entry, self.timeout)
+
+    def clear(self):
+        self.cache.clear()
+
+
+_response_cache = None
+_response_cache_lock = threading.Lock()
+
+
+def get_response_cache():
+    """
+        Returns the response cache configured by settings.PURCHASE_ORDER_RESPONSE_CACHE
+    """
+    global _response_cache
+    with _response_cache_lock:
+        if _response_cache is None:
+            options = dict(getattr(settings, 'PURCHASE_ORDER_RESPONSE_CACHE', {}))
+            backend = options.pop('BACKEND', 'purchase_order.cache.LocalMemoryResponseCache')
+            _response_cache = import_string(backend)(**options)
+        return _response_cache
+
+
+@receiver(setting_changed)
+def reset_response_cache(*, setting, **kwargs):
+    global _response_cache
+    if setting == 'PURCHASE_ORDER_RESPONSE_CACHE':
+        with _response_cache_lock:
+            _response_cache = None
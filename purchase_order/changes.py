@@ -0,0 +1,179 @@
+import threading
+import time
+from collections import OrderedDict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Max, Min
+from django.utils import timezone
+
+from .models import OrderChange
+from .read_serializers import datetime_string
+
+CHANGE_FEED_DEFAULTS = {
+    'BATCH_SIZE': 500,
+    'POLL_INTERVAL': 1.0,
+    'GAP_TIMEOUT': 10,
+    'LONG_POLL_TIMEOUT': 25,
+    'HEARTBEAT_INTERVAL': 15,
+    'MAX_STREAM_DURATION': 300,
+    'MAX_STREAMS': 100,
+    'RETENTION_DAYS': 7,
+}
+
+
+class CursorExpired(Exception):
+    """
+        Raised when the changes following a cursor were purged from the log, the client has to read the orders again
+    """
+
+
+def feed_setting(name):
+    return getattr(settings, 'PURCHASE_ORDER_CHANGE_FEED', {}).get(name, CHANGE_FEED_DEFAULTS[name])
+
+
+def record_deleted_order(sender, instance, **kwargs):
+    """
+        Connected to the post_delete signal of PurchaseOrder, it logs the deletions
+        done outside of bulk_delete_purchase_orders, such as the cascade of a supplier delete
+    """
+    OrderChange.objects.using(instance._state.db).record(OrderChange.DELETED, [(instance.pk, None)])
+
+
+def serialize_change(change):
+    return {
+        'sequence': change.sequence,
+        'purchase_order_id': change.purchase_order_id,
+        'action': change.action,
+        'version': change.version,
+        'changed_at': datetime_string(change.changed_at),
+    }
+
+
+def parse_cursor(value):
+    """
+        Parses the sequence number after which changes are returned, None stands for the current end of the log
+    """
+    if value is None or value == '':
+        return None
+    if not value.isdigit():
+        raise ValueError("after must be a change sequence number.")
+    return int(value)
+
+
+def parse_limit(value):
+    """
+        Parses the maximum number of changes returned at once, capped by BATCH_SIZE
+    """
+    batch_size = feed_setting('BATCH_SIZE')
+    if value is None or value == '':
+        return batch_size
+    if not value.isdigit() or int(value) < 1:
+        raise ValueError("limit must be a positive integer.")
+    return min(int(value), batch_size)
+
+
+def changes_query(after, limit):
+    return OrderChange.objects.filter(sequence__gt=after).order_by('sequence')[:limit]
+
+
+class SequenceGaps:
+    """
+        Remembers when this process first saw each gap of the log, keyed by its first missing sequence number.
+        Gaps are timed from then and not from the changes after them: a transaction may commit long after it took
+        its sequence number, while the changes of later transactions are already visible.
+    """
+    def __init__(self, max_entries=10000):
+        self.max_entries = max_entries
+        self._first_seen = OrderedDict()
+        self._lock = threading.Lock()
+
+    def first_seen(self, sequence, now):
+        with self._lock:
+            first_seen = self._first_seen.setdefault(sequence, now)
+            while len(self._first_seen) > self.max_entries:
+                self._first_seen.popitem(last=False)
+        return first_seen
+
+    def filled(self, sequence):
+        if sequence in self._first_seen:
+            with self._lock:
+                self._first_seen.pop(sequence, None)
+
+    def clear(self):
+        with self._lock:
+            self._first_seen.clear()
+
+
+sequence_gaps = SequenceGaps()
+
+
+def settled_changes(changes, after):
+    """
+        Returns the leading changes that can be sent without skipping one. Sequence numbers are allocated before
+        commit, so a missing number may belong to a transaction still in flight: the changes after it are held back
+        until it shows up, or until GAP_TIMEOUT seconds after this process first saw it missing, when it is taken
+        for a rolled back transaction. Every gap of the batch is timed at once, so a batch waits once.
+    """
+    gap_timeout = feed_setting('GAP_TIMEOUT')
+    now = time.monotonic()
+    settled = []
+    held_back = False
+    expected = after + 1
+    for change in changes:
+        if change.sequence != expected and now - sequence_gaps.first_seen(expected, now) < gap_timeout:
+            held_back = True
+        sequence_gaps.filled(change.sequence)
+        if not held_back:
+            settled.append(change)
+        expected = change.sequence + 1
+    return settled
+
+
+def log_bounds():
+    return OrderChange.objects.aggregate(first=Min('sequence'), last=Max('sequence'))
+
+
+async def alog_bounds():
+    return await OrderChange.objects.aaggregate(first=Min('sequence'), last=Max('sequence'))
+
+
+def start_cursor(after, bounds):
+    """
+        Returns the cursor to read from: the end of the log when no cursor is given, the start of the log for 0.
+        Raises CursorExpired when the changes following the cursor were purged.
+    """
+    if after is None:
+        return bounds['last'] or 0
+    if bounds['first'] is not None and after < bounds['first'] - 1:
+        if after:
+            raise CursorExpired(f"Changes after {after} were purged, the oldest change is {bounds['first']}.")
+        return bounds['first'] - 1
+    return after
+
+
+def read_changes(after, limit):
+    """
+        Returns the settled changes after the cursor and the cursor following them
+    """
+    changes = settled_changes(changes_query(after, limit), after)
+    return changes, changes[-1].sequence if changes else after
+
+
+async def aread_changes(after, limit):
+    changes = settled_changes([change async for change in changes_query(after, limit)], after)
+    return changes, changes[-1].sequence if changes else after
+
+
+def purge_order_changes(days=None, batch_size=1000):
+    """
+        Deletes the changes older than RETENTION_DAYS and returns how many were deleted
+    """
+    days = feed_setting('RETENTION_DAYS') if days is None else days
+    expired = OrderChange.objects.filter(changed_at__lt=timezone.now() - timedelta(days=days))
+    deleted = 0
+    while True:
+        batch = list(expired.values_list('pk', flat=True)[:batch_size])
+        if not batch:
+            return deleted
+        deleted += OrderChange.objects.filter(pk__in=batch).delete()[0]
@@ -0,0 +1,20 @@
+from django.core.checks import Error, register
+
+from .schema import get_schema, schema_file
+
+
+@register('schema', deploy=True)
+def check_schema_drift(app_configs, **kwargs):
+    """
+        Fails when the served OpenAPI schema no longer matches the one generated from the views and serializers
+    """
+    drifted = get_schema().drift()
+    if not drifted:
+        return []
+    return [
+        Error(
+            f"The OpenAPI schema in {schema_file()} is out of date: {', '.join(drifted)}.",
+            hint="Regenerate it with `python manage.py spectacular --file schema.yml`.",
+            id='purchase_order.E001',
+        )
+    ]
@@ -0,0 +1,73 @@
+import csv
+
+from rest_framework.utils.encoders import JSONEncoder
+
+from .serializers import PurchaseOrderSerializer
+
+EXPORT_CHUNK_SIZE = 500
+
+CSV_HEADER = (
+    'order_id', 'order_number', 'order_time', 'supplier_id', 'supplier_name', 'supplier_email',
+    'total_quantity', 'total_amount', 'total_tax',
+    'line_item_id', 'item_name', 'quantity', 'price_without_tax', 'tax_name', 'tax_amount', 'line_total',
+)
+
+
+class Echo:
+    """
+        File-like object whose write returns the value instead of buffering it, used to stream csv rows
+    """
+    def write(self, value):
+        return value
+
+
+def iterate_orders(queryset, chunk_size=EXPORT_CHUNK_SIZE, progress=None):
+    """
+        Iterates the orders with a server-side cursor where supported, prefetching
+        the suppliers and line items one chunk at a time. progress is called with the number of orders read so far.
+    """
+    purchase_orders = queryset.with_details().order_by('id').iterator(chunk_size=chunk_size)
+    if progress is None:
+        return purchase_orders
+    return counted(purchase_orders, progress)
+
+
+def counted(purchase_orders, progress):
+    for count, purchase_order in enumerate(purchase_orders, 1):
+        yield purchase_order
+        progress(count)
+
+
+def export_ndjson(queryset, progress=None):
+    """
+        Yields one json document per order, in the same shape as the API responses
+    """
+    encoder = JSONEncoder()
+    for purchase_order in iterate_orders(queryset, progress=progress):
+        yield encoder.encode(PurchaseOrderSerializer(purchase_order).data) + '\n'
+
+
+def export_csv(queryset, progress=None):
+    """
+        Yields a header and then one csv row per line item, repeating the order columns on each row
+    """
+    writer = csv.writer(Echo())
+    yield writer.writerow(CSV_HEADER)
+    for purchase_order in iterate_orders(queryset, progress=progress):
+        supplier = purchase_order.supplier
+        order_columns = (
+            purchase_order.id, purchase_order.order_number, purchase_order.order_time.isoformat(),
+            supplier.id, supplier.name, supplier.email,
+            purchase_order.total_quantity, purchase_order.total_amount, purchase_order.total_tax,
+        )
+        for line_item in purchase_order.line_items.all():
+            yield writer.writerow(order_columns + (
+                line_item.id, line_item.item_name, line_item.quantity, line_item.price_without_tax,
+                line_item.tax_name, line_item.tax_amount, line_item.line_total,
+            ))
+
+
+EXPORTERS = {
+    'ndjson': (export_ndjson, 'application/x-ndjson'),
+    'csv': (export_csv, 'text/csv'),
+}
@@ -0,0 +1,44 @@
+from decimal import Decimal
+
+import factory
+from factory.django import DjangoModelFactory
+
+from .models import Supplier, LineItem, PurchaseOrder
+
+TAX_RATES = {'GST 5%': Decimal('0.05'), 'GST 12%': Decimal('0.12'), 'GST 18%': Decimal('0.18')}
+
+
+class SupplierFactory(DjangoModelFactory):
+    class Meta:
+        model = Supplier
+        django_get_or_create = ('email',)
+
+    name = factory.Faker('company')
+    email = factory.Sequence(lambda n: f'supplier{n}@example.com')
+
+
+class PurchaseOrderFactory(DjangoModelFactory):
+    """
+        Creates an order with line_items__count line items (3 by default)
+    """
+    class Meta:
+        model = PurchaseOrder
+
+    supplier = factory.SubFactory(SupplierFactory)
+
+    @factory.post_generation
+    def line_items(self, create, extracted, count=3, **kwargs):
+        if create:
+            LineItemFactory.create_batch(count, purchase_order=self, **kwargs)
+
+
+class LineItemFactory(DjangoModelFactory):
+    class Meta:
+        model = LineItem
+
+    item_name = factory.Faker('catch_phrase')
+    quantity = factory.Faker('random_int', min=1, max=20)
+    price_without_tax = factory.Faker('pydecimal', left_digits=3, right_digits=2, min_value=1, max_value=999)
+    tax_name = factory.Iterator(TAX_RATES)
+    tax_amount = factory.LazyAttribute(lambda line_item: (line_item.price_without_tax * TAX_RATES[line_item.tax_name]).quantize(Decimal('0.01')))
+    purchase_order = factory.SubFactory(PurchaseOrderFactory, line_items__count=0)
@@ -0,0 +1,91 @@
+from datetime import datetime, time
+
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from .search import item_name_matches
+
+
+def filter_purchase_orders(queryset, query_params):
+    """
+        Applies the filters supported by the purchase order list endpoint to the given queryset,
+        raises ValueError when one is invalid
+    """
+    supplier_name = query_params.get('supplier_name', None)
+    item_name = query_params.get('item_name', None)
+    supplier_ids = parse_ids(query_params.get('supplier', None), 'supplier')
+
+    if supplier_name:
+        queryset = queryset.filter(supplier__name__icontains=supplier_name)
+
+    if item_name:
+        # The line items of the archived orders are in their own table
+        queryset = queryset.filter(item_name_matches(item_name, queryset.model.line_items.rel.related_model))
+
+    if supplier_ids is not None:
+        queryset = queryset.filter(supplier_id__in=supplier_ids)
+
+    for param, lookup in (('order_time_after', 'order_time__gte'), ('order_time_before', 'order_time__lt')):
+        value = query_params.get(param, None)
+        if value:
+            queryset = queryset.filter(**{lookup: parse_order_time(value, param)})
+
+    return queryset
+
+
+def include_archived(query_params):
+    """
+        Returns whether ?include_archived=1 asks for the archived orders too, raises ValueError for other values
+    """
+    value = query_params.get('include_archived', None)
+    if value in (None, '', '0', 'false'):
+        return False
+    if value in ('1', 'true'):
+        return True
+    raise ValueError("include_archived must be 1 or 0.")
+
+
+def parse_ids(value, param):
+    """
+        Parses a comma separated string or a list of ids, returns None when the parameter is not given
+    """
+    if value is None or value == '':
+        return None
+    if isinstance(value, str):
+        value = [part.strip() for part in value.split(',') if part.strip()]
+    if not isinstance(value, list) or not all(
+        type(part) is int or isinstance(part, str) and part.isdigit() for part in value
+    ):
+        raise ValueError(f"{param} must be a comma separated list of ids.")
+    return [int(part) for part in value]
+
+
+def parse_order_time(value, param):
+    """
+        Parses an ISO 8601 datetime, or a date which stands for its midnight in the current time zone
+    """
+    try:
+        parsed = parse_datetime(value) if isinstance(value, str) else None
+        if parsed is None and isinstance(value, str):
+            day = parse_date(value)
+            parsed = datetime.combine(day, time.min) if day is not None else None
+    except ValueError:
+        parsed = None
+    if parsed is None:
+        raise ValueError(f"{param} must be an ISO 8601 date or datetime.")
+    return timezone.make_aware(parsed) if timezone.is_naive(parsed) else parsed
+
+
+def filter_selected_orders(queryset, params):
+    """
+        Applies the list filters and the ids selection of the bulk endpoints, raises ValueError when a parameter is invalid
+    """
+    queryset = filter_purchase_orders(queryset, params)
+
+    ids = params.get('ids')
+    if ids is not None:
+        if not isinstance(ids, list) or not all(isinstance(order_id, int) and not isinstance(order_id, bool) for order_id in ids):
+            raise ValueError("ids must be a list of purchase order ids.")
+        queryset = queryset.filter(id__in=ids)
+
+    return queryset
@@ -0,0 +1,99 @@
+import functools
+import hashlib
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+
+from .models import IdempotencyKey
+
+IDEMPOTENCY_KEY_HEADER = 'Idempotency-Key'
+REPLAYED_HEADER = 'Idempotent-Replayed'
+REPLAYED_RESPONSE_HEADERS = ('ETag', 'Last-Modified', 'Location')
+MAX_KEY_LENGTH = IdempotencyKey._meta.get_field('key').max_length
+
+
+def request_fingerprint(request):
+    """
+        Identifies the content of a request, so that a key reused for a different request can be rejected
+    """
+    return hashlib.sha256(request.get_full_path().encode() + b'\n' + request.body).hexdigest()
+
+
+def replay(record):
+    headers = dict(record.response_headers, **{REPLAYED_HEADER: 'true'})
+    return Response(record.response_body, status=record.status_code, headers=headers)
+
+
+def stored_headers(response):
+    return {header: response[header] for header in REPLAYED_RESPONSE_HEADERS if response.has_header(header)}
+
+
+def idempotent_response(request, handler):
+    """
+        Returns the response of handler(), a DRF Response, or the stored response of the first request sent with
+        the same Idempotency-Key header when the request is a retry.
+        The key is inserted in the transaction of the write: a concurrent retry blocks on its unique constraint
+        until the first request commits (and is then replayed) or rolls back (and is then processed).
+    """
+    key = request.headers.get(IDEMPOTENCY_KEY_HEADER)
+    if key is None:
+        return handler()
+    if not key or len(key) > MAX_KEY_LENGTH:
+        return Response(
+            {"error": f"{IDEMPOTENCY_KEY_HEADER} must be between 1 and {MAX_KEY_LENGTH} characters."},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+
+    fingerprint = request_fingerprint(request)
+    now = timezone.now()
+    records = IdempotencyKey.objects.filter(key=key, method=request.method, path=request.path)
+    records.filter(expires_at__lte=now).delete()
+
+    ttl = getattr(settings, 'PURCHASE_ORDER_IDEMPOTENCY_KEY_TTL', 24 * 60 * 60)
+    with transaction.atomic():
+        try:
+            with transaction.atomic():
+                record = IdempotencyKey.objects.create(
+                    key=key, method=request.method, path=request.path,
+                    request_fingerprint=fingerprint, expires_at=now + timedelta(seconds=ttl),
+                )
+        except IntegrityError:
+            record = records.get()
+            if record.request_fingerprint != fingerprint:
+                return Response(
+                    {"error": f"{IDEMPOTENCY_KEY_HEADER} was already used for a different request."},
+                    status=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                )
+            if record.status_code is None:
+                return Response(
+                    {"error": f"A request with this {IDEMPOTENCY_KEY_HEADER} is still being processed."},
+                    status=status.HTTP_409_CONFLICT,
+                )
+            return replay(record)
+
+        response = handler()
+        if response.status_code >= 500:
+            # Server errors are not stored, the client may retry them
+            record.delete()
+        else:
+            record.status_code = response.status_code
+            record.response_body = response.data
+            record.response_headers = stored_headers(response)
+            record.save(update_fields=['status_code', 'response_body', 'response_headers'])
+    return response
+
+
+def idempotent(handler):
+    """
+        Decorates a write handler of an APIView so that a request retried with the same Idempotency-Key header
+        gets the stored response of the first one instead of being processed again, see idempotent_response
+    """
+    @functools.wraps(handler)
+    def wrapper(view, request, *args, **kwargs):
+        return idempotent_response(request, functools.partial(handler, view, request, *args, **kwargs))
+
+    return wrapper
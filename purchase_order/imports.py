@@ -0,0 +1,342 @@
+import csv
+import io
+import json
+from decimal import Decimal, InvalidOperation
+
+from django.core.exceptions import ValidationError
+from django.core.validators import DecimalValidator, EmailValidator
+from django.db import connections, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import LineItem, OrderChange, PurchaseOrder, Supplier
+from .reporting import SpendDelta
+from .suppliers import touch_supplier_orders
+
+MAX_NAME_LENGTH = 255
+# Largest value of the quantity column, an integer on every database
+MAX_QUANTITY = 2147483647
+LINE_ITEM_COLUMNS = ('item_name', 'quantity', 'price_without_tax', 'tax_name', 'tax_amount', 'purchase_order_id')
+
+# Columns read from csv files, the other columns of the csv export are ignored
+CSV_ORDER_KEYS = ('order_id', 'order_number')
+CSV_REQUIRED_COLUMNS = ('supplier_name', 'supplier_email', 'item_name', 'quantity', 'price_without_tax', 'tax_name', 'tax_amount')
+
+validate_email = EmailValidator()
+validate_price = DecimalValidator(max_digits=10, decimal_places=2)
+
+
+class InvalidOrder(ValueError):
+    pass
+
+
+class LineReader:
+    """
+        Iterates the decoded lines of a binary file and keeps the byte offset of the end of the last line read
+    """
+    def __init__(self, file, offset=0):
+        self.file = file
+        self.offset = offset
+        file.seek(offset)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        line = self.file.readline()
+        if not line:
+            raise StopIteration
+        self.offset += len(line)
+        return line.decode('utf-8-sig' if self.offset == len(line) else 'utf-8')
+
+
+def read_ndjson(file, offset=0):
+    """
+        Yields (line number, offset after the order, order) for each line of an ndjson file,
+        in the shape of the API requests and of the ndjson export
+    """
+    lines = LineReader(file, offset)
+    for number, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        try:
+            yield number, lines.offset, json.loads(line)
+        except ValueError as error:
+            yield number, lines.offset, InvalidOrder(f"Invalid json: {error}")
+
+
+def read_csv(file, offset=0):
+    """
+        Yields (line number, offset after the order, order) for a csv file with one row per line item,
+        in the format of the csv export. Consecutive rows with the same order_id (or order_number) form an order.
+    """
+    lines = LineReader(file)
+    reader = csv.reader(lines)
+    header = next(reader, None)
+    if header is None:
+        return
+    missing = [column for column in CSV_REQUIRED_COLUMNS if column not in header]
+    if missing:
+        raise InvalidOrder(f"Missing csv columns: {', '.join(missing)}")
+    key_column = next((header.index(column) for column in CSV_ORDER_KEYS if column in header), None)
+
+    if offset > lines.offset:
+        lines.file.seek(offset)
+        lines.offset = offset
+
+    order = None
+    order_key = None
+    order_line = None
+    row_offset = lines.offset
+    for row in reader:
+        row = dict(zip(header, row))
+        key = row[header[key_column]] if key_column is not None else None
+        if order is not None and (key is None or key != order_key):
+            yield order_line, row_offset, order
+            order = None
+        if order is None:
+            order = {
+                'supplier': {'name': row['supplier_name'], 'email': row['supplier_email']},
+                'line_items': [],
+            }
+            if row.get('order_time'):
+                order['order_time'] = row['order_time']
+            order_key = key
+            order_line = reader.line_num
+        order['line_items'].append({column: row[column] for column in CSV_REQUIRED_COLUMNS[2:]})
+        row_offset = lines.offset
+    if order is not None:
+        yield order_line, row_offset, order
+
+
+READERS = {
+    'ndjson': read_ndjson,
+    'csv': read_csv,
+}
+
+
+def text(value, field):
+    if not isinstance(value, str) or not value.strip():
+        raise InvalidOrder(f"{field} is required.")
+    if len(value) > MAX_NAME_LENGTH:
+        raise InvalidOrder(f"{field} has more than {MAX_NAME_LENGTH} characters.")
+    return value
+
+
+def price(value, field):
+    try:
+        value = Decimal(str(value))
+        validate_price(value)
+    except (InvalidOperation, ValidationError):
+        raise InvalidOrder(f"{field} must be a decimal with at most 10 digits and 2 decimal places.")
+    if value < 0:
+        raise InvalidOrder(f"{field} must not be negative.")
+    return value
+
+
+def clean_order(data):
+    """
+        Validates an imported order against the constraints of the models, without going through the serializers,
+        and returns (supplier name, supplier email, order time, line items as tuples)
+    """
+    if isinstance(data, InvalidOrder):
+        raise data
+    if not isinstance(data, dict) or not isinstance(data.get('supplier'), dict):
+        raise InvalidOrder("supplier is required.")
+
+    supplier = data['supplier']
+    email = text(supplier.get('email'), 'supplier email')
+    try:
+        validate_email(email)
+    except ValidationError:
+        raise InvalidOrder(f"Invalid supplier email {email!r}.")
+    name = text(supplier.get('name'), 'supplier name')
+
+    order_time = data.get('order_time')
+    if order_time:
+        order_time = parse_datetime(order_time) if isinstance(order_time, str) else None
+        if order_time is None:
+            raise InvalidOrder("order_time must be an ISO 8601 datetime.")
+        if timezone.is_naive(order_time):
+            order_time = timezone.make_aware(order_time)
+    else:
+        order_time = timezone.now()
+
+    line_items = data.get('line_items')
+    if not isinstance(line_items, list) or not line_items:
+        raise InvalidOrder("line_items are required.")
+    cleaned_line_items = []
+    for line_item in line_items:
+        if not isinstance(line_item, dict):
+            raise InvalidOrder("line_items must be objects.")
+        try:
+            quantity = int(line_item.get('quantity'))
+        except (TypeError, ValueError):
+            quantity = -1
+        if quantity < 0 or str(quantity) != str(line_item.get('quantity')).strip():
+            raise InvalidOrder("quantity must be a positive integer.")
+        if quantity > MAX_QUANTITY:
+            raise InvalidOrder(f"quantity must be at most {MAX_QUANTITY}.")
+        cleaned_line_items.append((
+            text(line_item.get('item_name'), 'item_name'),
+            quantity,
+            price(line_item.get('price_without_tax'), 'price_without_tax'),
+            text(line_item.get('tax_name'), 'tax_name'),
+            price(line_item.get('tax_amount'), 'tax_amount'),
+        ))
+
+    return name, email, order_time, cleaned_line_items
+
+
+class OrderLoader:
+    """
+        Writes batches of cleaned orders: suppliers are upserted by email, then orders and line items are inserted
+        with COPY on PostgreSQL. On the other databases orders are inserted with bulk_create, which returns their ids,
+        followed by one bulk_update of their order times, and line items with executemany.
+    """
+    def __init__(self, using='default', method=None, chunk_size=1000):
+        self.using = using
+        self.connection = connections[using]
+        self.method = method or ('copy' if self.connection.vendor == 'postgresql' else 'bulk_create')
+        self.chunk_size = chunk_size
+        self.supplier_ids = {}
+
+    def upsert_suppliers(self, orders):
+        """
+            Creates the suppliers that do not exist yet and renames the existing ones, once per email and import.
+            The orders of renamed suppliers get a new version, like when a supplier is renamed through the API.
+        """
+        names = {}
+        for name, email, _, _ in orders:
+            if email not in self.supplier_ids:
+                names[email] = name
+        if not names:
+            return
+
+        suppliers = Supplier.objects.using(self.using)
+        renamed_ids = []
+        for email_chunk in chunked(list(names), self.chunk_size):
+            for supplier_id, email, name in suppliers.filter(email__in=email_chunk).values_list('id', 'email', 'name'):
+                if names[email] != name:
+                    renamed_ids.append(supplier_id)
+
+        suppliers.bulk_create(
+            [Supplier(name=name, email=email) for email, name in names.items()],
+            batch_size=self.chunk_size, update_conflicts=True, unique_fields=['email'], update_fields=['name'],
+        )
+        for email_chunk in chunked(list(names), self.chunk_size):
+            self.supplier_ids.update(suppliers.filter(email__in=email_chunk).values_list('email', 'id'))
+
+        if renamed_ids:
+            touch_supplier_orders(*renamed_ids, using=self.using)
+
+    def load(self, orders):
+        """
+            Inserts the cleaned orders and their line items, adds them to the spend rollup and to the change log,
+            returns the number of line items
+        """
+        self.upsert_suppliers(orders)
+        order_numbers = PurchaseOrder.reserve_order_numbers(len(orders), using=self.using)
+        if self.method == 'copy':
+            order_ids, line_items = self.copy(orders, order_numbers)
+        else:
+            order_ids, line_items = self.bulk_create(orders, order_numbers)
+
+        spend = SpendDelta(self.using)
+        for _, email, order_time, order_line_items in orders:
+            spend.add(self.supplier_ids[email], order_time, *self.totals(order_line_items))
+        spend.apply()
+        OrderChange.objects.using(self.using).record(OrderChange.CREATED, [(order_id, 1) for order_id in order_ids])
+        return line_items
+
+    def totals(self, line_items):
+        return (
+            sum(quantity for _, quantity, _, _, _ in line_items),
+            sum(quantity * (price_without_tax + tax_amount) for _, quantity, price_without_tax, _, tax_amount in line_items),
+            sum(tax_amount for _, _, _, _, tax_amount in line_items),
+        )
+
+    def bulk_create(self, orders, order_numbers):
+        purchase_orders = []
+        for (_, email, order_time, line_items), order_number in zip(orders, order_numbers):
+            total_quantity, total_amount, total_tax = self.totals(line_items)
+            purchase_orders.append(PurchaseOrder(
+                supplier_id=self.supplier_ids[email], order_time=order_time, order_number=order_number,
+                total_quantity=total_quantity, total_amount=total_amount, total_tax=total_tax,
+            ))
+        purchase_order_rows = PurchaseOrder.objects.using(self.using)
+        purchase_order_rows.bulk_create(purchase_orders, batch_size=self.chunk_size)
+        # bulk_create sets the auto_now_add order_time to the current time, the imported order times are written back
+        for purchase_order, (_, _, order_time, _) in zip(purchase_orders, orders):
+            purchase_order.order_time = order_time
+        purchase_order_rows.bulk_update(purchase_orders, ['order_time'], batch_size=self.chunk_size)
+
+        line_item_rows = [
+            line_item + (purchase_order.pk,)
+            for purchase_order, (_, _, _, order_line_items) in zip(purchase_orders, orders)
+            for line_item in order_line_items
+        ]
+        # Line items are most of the rows, they skip the per field overhead of bulk_create
+        with self.connection.cursor() as cursor:
+            for rows in chunked(line_item_rows, self.chunk_size):
+                self.insert_rows(cursor, LineItem, LINE_ITEM_COLUMNS, rows)
+        return [purchase_order.pk for purchase_order in purchase_orders], len(line_item_rows)
+
+    def insert_rows(self, cursor, model, columns, rows):
+        quote_name = self.connection.ops.quote_name
+        cursor.executemany(
+            f"INSERT INTO {quote_name(model._meta.db_table)} ({', '.join(map(quote_name, columns))}) "
+            f"VALUES ({', '.join(['%s'] * len(columns))})",
+            rows,
+        )
+
+    def copy(self, orders, order_numbers):
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT nextval(pg_get_serial_sequence(%s, 'id')) FROM generate_series(1, %s)",
+                [PurchaseOrder._meta.db_table, len(orders)],
+            )
+            order_ids = [order_id for order_id, in cursor.fetchall()]
+            now = timezone.now()
+
+            order_rows = []
+            line_item_rows = []
+            for order_id, order_number, (_, email, order_time, line_items) in zip(order_ids, order_numbers, orders):
+                order_rows.append((order_id, self.supplier_ids[email], order_time, order_number, *self.totals(line_items), 1, now))
+                line_item_rows.extend(line_item + (order_id,) for line_item in line_items)
+
+            self.copy_rows(cursor, PurchaseOrder, (
+                'id', 'supplier_id', 'order_time', 'order_number', 'total_quantity', 'total_amount', 'total_tax',
+                'version', 'updated_at',
+            ), order_rows)
+            self.copy_rows(cursor, LineItem, LINE_ITEM_COLUMNS, line_item_rows)
+        return order_ids, len(line_item_rows)
+
+    def copy_rows(self, cursor, model, columns, rows):
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(rows)
+        buffer.seek(0)
+        quote_name = self.connection.ops.quote_name
+        cursor.cursor.copy_expert(
+            f"COPY {quote_name(model._meta.db_table)} ({', '.join(map(quote_name, columns))}) FROM STDIN WITH (FORMAT csv)",
+            buffer,
+        )
+
+
+def chunked(values, size):
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+
+def load_batch(loader, orders, checkpoint, offset, rejected):
+    """
+        Loads a batch of cleaned orders and moves the checkpoint past them in the same transaction
+    """
+    with transaction.atomic(using=loader.using):
+        line_items = loader.load(orders) if orders else 0
+        checkpoint.offset = offset
+        checkpoint.orders += len(orders)
+        checkpoint.line_items += line_items
+        checkpoint.rejected += rejected
+        checkpoint.save(using=loader.using)
+    return line_items
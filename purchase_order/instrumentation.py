@@ -0,0 +1,169 @@
+import contextvars
+import json
+import logging
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+from django.http import HttpResponse
+
+# Metrics of the request being handled, set by InstrumentationMiddleware
+current_metrics = contextvars.ContextVar('current_metrics', default=None)
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+
+class RequestMetrics:
+    """
+        Time spent by one request in SQL, in the serializers and in rendering
+    """
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.db_time = 0.0
+        self.queries = []
+        self.sections = {'serialize': 0.0, 'render': 0.0}
+
+    @property
+    def total_time(self):
+        return time.perf_counter() - self.started
+
+    def top_queries(self, count):
+        return sorted(self.queries, key=lambda query: query[1], reverse=True)[:count]
+
+
+def record_query(execute, sql, params, many, context):
+    """
+        Execute wrapper installed on every database connection, adds the query to the current request metrics
+    """
+    metrics = current_metrics.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        elapsed = time.perf_counter() - started
+        metrics.db_time += elapsed
+        metrics.queries.append((sql, elapsed))
+
+
+def install_query_recorder(sender, connection, **kwargs):
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+@contextmanager
+def timed(section):
+    """
+        Adds the time spent in the block to the given section of the current request metrics
+    """
+    metrics = current_metrics.get()
+    if metrics is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.sections[section] += time.perf_counter() - started
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class MetricsRegistry:
+    """
+        Per process histograms of the request metrics, by endpoint, rendered in the Prometheus text format
+    """
+    histograms = (
+        ('purchase_order_request_duration_seconds', "Time spent handling the request", DURATION_BUCKETS),
+        ('purchase_order_request_db_seconds', "Time spent running SQL queries", DURATION_BUCKETS),
+        ('purchase_order_request_db_queries', "Number of SQL queries", QUERY_COUNT_BUCKETS),
+        ('purchase_order_request_serialize_seconds', "Time spent in the serializers", DURATION_BUCKETS),
+        ('purchase_order_request_render_seconds', "Time spent rendering the response", DURATION_BUCKETS),
+    )
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._histograms = {name: {} for name, _, _ in self.histograms}
+            self._responses = {}
+
+    def observe(self, method, endpoint, status_code, metrics):
+        labels = (method, endpoint)
+        values = {
+            'purchase_order_request_duration_seconds': metrics.total_time,
+            'purchase_order_request_db_seconds': metrics.db_time,
+            'purchase_order_request_db_queries': len(metrics.queries),
+            'purchase_order_request_serialize_seconds': metrics.sections['serialize'],
+            'purchase_order_request_render_seconds': metrics.sections['render'],
+        }
+        with self._lock:
+            for name, _, buckets in self.histograms:
+                self._histograms[name].setdefault(labels, Histogram(buckets)).observe(values[name])
+            key = labels + (str(status_code),)
+            self._responses[key] = self._responses.get(key, 0) + 1
+
+    def render(self):
+        lines = []
+        with self._lock:
+            for name, description, buckets in self.histograms:
+                lines.append(f'# HELP {name} {description}')
+                lines.append(f'# TYPE {name} histogram')
+                for (method, endpoint), histogram in sorted(self._histograms[name].items()):
+                    labels = f'method="{method}",endpoint="{endpoint}"'
+                    cumulative = 0
+                    for bound, count in zip(buckets + ('+Inf',), histogram.counts):
+                        cumulative += count
+                        lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+                    lines.append(f'{name}_sum{{{labels}}} {histogram.sum}')
+                    lines.append(f'{name}_count{{{labels}}} {histogram.count}')
+            lines.append('# HELP purchase_order_responses_total Responses sent, by status code')
+            lines.append('# TYPE purchase_order_responses_total counter')
+            for (method, endpoint, status_code), count in sorted(self._responses.items()):
+                lines.append(f'purchase_order_responses_total{{method="{method}",endpoint="{endpoint}",status="{status_code}"}} {count}')
+        return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
+
+
+def metrics_view(request):
+    """
+        Exposes the request metrics of this process in the Prometheus text format
+    """
+    return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+class StructuredFormatter(logging.Formatter):
+    """
+        Formats log records as one JSON object per line, including the values passed with extra=
+    """
+    reserved = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+    def format(self, record):
+        data = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        data.update({key: value for key, value in vars(record).items() if key not in self.reserved})
+        if record.exc_info:
+            data['exception'] = self.formatException(record.exc_info)
+        return json.dumps(data, default=str)
@@ -0,0 +1,280 @@
+import csv
+import logging
+import os
+import socket
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import DatabaseError, connections, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .exports import EXPORTERS
+from .filters import filter_purchase_orders
+from .models import Job, PurchaseOrder
+from .reporting import spend_report, spend_report_params
+
+logger = logging.getLogger(__name__)
+
+# Minimum seconds between two saves of the progress of a running job, which are also its heartbeat
+PROGRESS_INTERVAL = 2
+
+ORDER_FILTERS = ('supplier_name', 'item_name', 'supplier', 'order_time_after', 'order_time_before')
+SPEND_REPORT_HEADER = (
+    'period', 'supplier_id', 'supplier_name', 'order_count', 'total_quantity', 'total_amount', 'total_tax',
+)
+
+
+class JobLost(Exception):
+    """
+        Raised in a worker whose job was given to another worker after it stopped sending heartbeats
+    """
+
+
+class OrderExportJob:
+    """
+        Writes the orders matching the list filters as csv or ndjson, like the export endpoint
+    """
+    def clean(self, params):
+        file_format = params.get('format') or 'csv'
+        if file_format not in EXPORTERS:
+            raise ValueError(f"format must be one of {', '.join(EXPORTERS)}.")
+        cleaned = {'format': file_format}
+        for name in ORDER_FILTERS:
+            value = params.get(name)
+            if value is not None and not isinstance(value, str):
+                raise ValueError(f"{name} must be a string.")
+            if value:
+                cleaned[name] = value
+        filter_purchase_orders(PurchaseOrder.objects.none(), cleaned)
+        return cleaned
+
+    def file_name(self, params):
+        return f"purchase_orders.{params['format']}"
+
+    def content_type(self, params):
+        return EXPORTERS[params['format']][1]
+
+    def run(self, params, file, progress):
+        exporter, _ = EXPORTERS[params['format']]
+        queryset = filter_purchase_orders(PurchaseOrder.objects.all(), params)
+        progress.set_total(queryset.count())
+        for chunk in exporter(queryset, progress=progress):
+            file.write(chunk)
+
+
+class SpendReportJob:
+    """
+        Writes the spend report of the report endpoint as csv, one row per period and supplier
+    """
+    def clean(self, params):
+        report_params = spend_report_params(params)
+        cleaned = {'period': report_params['period']}
+        for name in ('start', 'end'):
+            if report_params[name] is not None:
+                cleaned[name] = report_params[name].isoformat()
+        if report_params['supplier_ids']:
+            cleaned['supplier'] = ','.join(map(str, report_params['supplier_ids']))
+        return cleaned
+
+    def file_name(self, params):
+        return f"spend_report_{params['period']}.csv"
+
+    def content_type(self, params):
+        return 'text/csv'
+
+    def run(self, params, file, progress):
+        rows = spend_report(**spend_report_params(params))
+        progress.set_total(len(rows))
+        writer = csv.writer(file)
+        writer.writerow(SPEND_REPORT_HEADER)
+        for count, row in enumerate(rows, 1):
+            writer.writerow((
+                row['period'].isoformat(), row['supplier_id'], row['supplier__name'], row['order_count'],
+                row['total_quantity'], row['total_amount'], row['total_tax'],
+            ))
+            progress(count)
+
+
+JOB_TYPES = {
+    'order_export': OrderExportJob(),
+    'spend_report': SpendReportJob(),
+}
+
+
+def clean_job(job_type, params):
+    """
+        Validates a submitted job and returns its normalized params, raises ValueError when it is invalid
+    """
+    if job_type not in JOB_TYPES:
+        raise ValueError(f"job_type must be one of {', '.join(JOB_TYPES)}.")
+    if params is None:
+        params = {}
+    if not isinstance(params, dict):
+        raise ValueError("params must be an object.")
+    return JOB_TYPES[job_type].clean(params)
+
+
+def results_dir():
+    return str(getattr(settings, 'PURCHASE_ORDER_JOB_RESULTS_DIR', os.path.join(settings.BASE_DIR, 'job_results')))
+
+
+def result_path(job):
+    return os.path.join(results_dir(), job.result_name) if job.result_name else None
+
+
+def worker_name():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+class JobProgress:
+    """
+        Saves the number of items a running job has processed, at most every PROGRESS_INTERVAL seconds.
+        The save is conditional on the job still belonging to the worker, so that a worker whose job was
+        requeued stops instead of racing the new one.
+    """
+    def __init__(self, job):
+        self.job = job
+        self.saved_at = time.monotonic()
+
+    def set_total(self, total):
+        self.job.total = total
+        self.save(total=total)
+
+    def __call__(self, count):
+        self.job.progress = count
+        now = time.monotonic()
+        if now - self.saved_at >= PROGRESS_INTERVAL:
+            self.saved_at = now
+            self.save(progress=count)
+
+    def save(self, **fields):
+        updated = Job.objects.filter(pk=self.job.pk, status=Job.RUNNING, worker=self.job.worker).update(
+            heartbeat_at=timezone.now(), **fields
+        )
+        if not updated:
+            raise JobLost(f"Job {self.job.pk} is no longer run by {self.job.worker}")
+
+
+def claim_job(worker):
+    """
+        Marks the oldest queued job as run by the worker and returns it, or None when the queue is empty.
+        Workers skip the rows locked by each other instead of waiting on them. The update is conditional
+        on the job still being queued for the databases that ignore SELECT ... FOR UPDATE.
+    """
+    while True:
+        with transaction.atomic():
+            job = Job.objects.select_for_update(skip_locked=True).filter(status=Job.QUEUED).order_by('created_at', 'id').first()
+            if job is None:
+                return None
+            now = timezone.now()
+            claimed = Job.objects.filter(pk=job.pk, status=Job.QUEUED).update(
+                status=Job.RUNNING, worker=worker, attempts=F('attempts') + 1,
+                started_at=now, heartbeat_at=now, progress=0, total=None,
+            )
+        if claimed:
+            job.refresh_from_db()
+            return job
+
+
+def run_job(job):
+    """
+        Runs a claimed job, writing its result to a temporary file which is renamed once it is complete
+    """
+    job_type = JOB_TYPES[job.job_type]
+    result_name = f"{job.pk}-{job_type.file_name(job.params)}"
+    path = os.path.join(results_dir(), result_name)
+    temporary_path = f"{path}.{os.getpid()}.tmp"
+    os.makedirs(results_dir(), exist_ok=True)
+    logger.info("Running job %s (%s)", job.pk, job.job_type)
+
+    jobs = Job.objects.filter(pk=job.pk, status=Job.RUNNING, worker=job.worker)
+    progress = JobProgress(job)
+    try:
+        with open(temporary_path, 'w', encoding='utf-8', newline='') as file:
+            job_type.run(job.params, file, progress)
+        os.replace(temporary_path, path)
+    except JobLost as error:
+        logger.warning(str(error))
+        remove_file(temporary_path)
+        return
+    except Exception as error:
+        logger.exception("Job %s failed", job.pk)
+        remove_file(temporary_path)
+        jobs.update(status=Job.FAILED, error=f"{type(error).__name__}: {error}", finished_at=timezone.now())
+        return
+
+    finished = jobs.update(
+        status=Job.SUCCEEDED, progress=job.progress, result_name=result_name,
+        result_content_type=job_type.content_type(job.params), result_size=os.path.getsize(path),
+        finished_at=timezone.now(), heartbeat_at=timezone.now(),
+    )
+    if not finished:
+        remove_file(path)
+    logger.info("Job %s succeeded", job.pk)
+
+
+def remove_file(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def requeue_stale_jobs():
+    """
+        Gives the running jobs without a heartbeat for PURCHASE_ORDER_JOB_TIMEOUT seconds to another worker,
+        or fails them after PURCHASE_ORDER_JOB_MAX_ATTEMPTS attempts
+    """
+    now = timezone.now()
+    timeout = getattr(settings, 'PURCHASE_ORDER_JOB_TIMEOUT', 300)
+    max_attempts = getattr(settings, 'PURCHASE_ORDER_JOB_MAX_ATTEMPTS', 3)
+    stale = Job.objects.filter(status=Job.RUNNING, heartbeat_at__lt=now - timedelta(seconds=timeout))
+    requeued = stale.filter(attempts__lt=max_attempts).update(status=Job.QUEUED, worker='')
+    failed = stale.update(status=Job.FAILED, error="The worker stopped responding.", finished_at=now)
+    return requeued, failed
+
+
+def purge_finished_jobs():
+    """
+        Deletes the jobs finished more than PURCHASE_ORDER_JOB_RESULT_TTL seconds ago and their result files
+    """
+    ttl = getattr(settings, 'PURCHASE_ORDER_JOB_RESULT_TTL', 7 * 24 * 60 * 60)
+    expired = Job.objects.filter(
+        status__in=[Job.SUCCEEDED, Job.FAILED], finished_at__lt=timezone.now() - timedelta(seconds=ttl),
+    )
+    deleted = 0
+    for job in expired:
+        if job.result_name:
+            remove_file(result_path(job))
+        job.delete()
+        deleted += 1
+    return deleted
+
+
+def work(stop, poll_interval=1.0, burst=False):
+    """
+        Claims and runs jobs until stop is set, or until the queue is empty in burst mode.
+        Returns the number of jobs run.
+    """
+    worker = worker_name()
+    jobs_run = 0
+    while not stop.is_set():
+        try:
+            job = claim_job(worker)
+            if job is None:
+                requeue_stale_jobs()
+                purge_finished_jobs()
+                if burst:
+                    break
+                stop.wait(poll_interval)
+                continue
+            run_job(job)
+            jobs_run += 1
+        except DatabaseError:
+            # A job interrupted here is requeued once its heartbeat times out
+            logger.exception("Database error in worker %s, retrying in %ss", worker, poll_interval)
+            connections.close_all()
+            stop.wait(poll_interval)
+    return jobs_run
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from purchase_order.archive import ARCHIVE_BATCH_SIZE, archive_cutoff, archive_orders, count_archivable_orders
+
+
+class Command(BaseCommand):
+    help = (
+        "Moves the purchase orders older than PURCHASE_ORDER_ARCHIVE_AFTER_DAYS and their line items to the "
+        "archive tables, in batches, so that the hot tables only hold the recent orders"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, help="Archive the orders older than this many days instead")
+        parser.add_argument('--batch-size', type=int, default=ARCHIVE_BATCH_SIZE, help="Number of orders moved per transaction")
+        parser.add_argument('--dry-run', action='store_true', help="Only count the orders that would be archived")
+
+    def handle(self, *args, **options):
+        if options['days'] is not None and options['days'] < 0:
+            raise CommandError("--days must not be negative")
+        if options['batch_size'] < 1:
+            raise CommandError("--batch-size must be positive")
+        before = archive_cutoff(options['days'])
+
+        if options['dry_run']:
+            orders, line_items = count_archivable_orders(before)
+            self.stdout.write(self.style.SUCCESS(f"{orders} orders and {line_items} line items would be archived"))
+            return
+
+        orders, line_items = archive_orders(before, batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Archived {orders} orders and {line_items} line items"))
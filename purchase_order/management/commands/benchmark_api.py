@@ -0,0 +1,141 @@
+import json
+import platform
+import statistics
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from purchase_order.models import LineItem, PurchaseOrder
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmarks the purchase order API against the current database and reports latency percentiles, "
+        "query counts and allocated memory per endpoint as JSON. Seed the database with seed_orders first."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=50, help="Requests per scenario")
+        parser.add_argument('--page-size', type=int, default=50)
+        parser.add_argument('--output', help="File the JSON results are written to, stdout by default")
+
+    def handle(self, *args, **options):
+        self.client = Client()
+        self.iterations = options['iterations']
+        if self.iterations < 2:
+            raise CommandError("At least 2 iterations are needed")
+
+        sample = list(PurchaseOrder.objects.select_related('supplier').order_by('-id')[:self.iterations])
+        if not sample:
+            raise CommandError("There are no purchase orders to benchmark, run seed_orders first")
+        item_name = LineItem.objects.filter(purchase_order=sample[0]).values_list('item_name', flat=True).first()
+
+        list_url = reverse('purchase-order-list-create')
+        page_size = options['page_size']
+        created = []
+
+        def order_data(purchase_order):
+            return {
+                "supplier": {"id": purchase_order.supplier_id, "name": purchase_order.supplier.name, "email": purchase_order.supplier.email},
+                "line_items": [
+                    {"item_name": "Benchmark item", "quantity": quantity, "price_without_tax": "10.00", "tax_name": "GST 5%", "tax_amount": "0.50"}
+                    for quantity in range(1, 6)
+                ],
+            }
+
+        def create(index):
+            response = self.client.post(list_url, data=json.dumps(order_data(sample[index % len(sample)])), content_type='application/json')
+            created.append(response.json()['id'])
+            return response
+
+        def update(index):
+            purchase_order_id = created[index % len(created)]
+            data = order_data(sample[index % len(sample)])
+            data['line_items'][0]['quantity'] = index + 10
+            return self.client.put(reverse('purchase-order-details', args=[purchase_order_id]), data=json.dumps(data), content_type='application/json')
+
+        scenarios = {
+            'list': lambda index: self.client.get(list_url, {'page_size': page_size}),
+            'list_supplier_filter': lambda index: self.client.get(list_url, {'page_size': page_size, 'supplier_name': sample[index % len(sample)].supplier.name[:4]}),
+            'list_item_filter': lambda index: self.client.get(list_url, {'page_size': page_size, 'item_name': item_name[:4]}),
+            'detail': lambda index: self.client.get(reverse('purchase-order-details', args=[sample[index % len(sample)].id])),
+            'create': create,
+            'update': update,
+            'delete': lambda index: self.client.delete(reverse('purchase-order-details', args=[created[index]])),
+        }
+
+        results = {}
+        # The test client sends requests for the host 'testserver'
+        with override_settings(ALLOWED_HOSTS=['testserver']):
+            for name, send in scenarios.items():
+                results[name] = self.run_scenario(name, send)
+
+        report = {
+            'timestamp': datetime.now(timezone.utc).isoformat(),
+            'environment': {
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'database': connection.vendor,
+                'purchase_orders': PurchaseOrder.objects.count(),
+                'line_items': LineItem.objects.count(),
+            },
+            'options': {'iterations': self.iterations, 'page_size': page_size},
+            'results': results,
+        }
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as file:
+                file.write(output + '\n')
+            self.stderr.write(f"Results written to {options['output']}")
+        else:
+            self.stdout.write(output)
+
+    def run_scenario(self, name, send):
+        """
+            Sends the requests of one scenario one at a time. Tracing allocations slows requests down, so
+            every other request is traced for memory and the latencies come from the untraced ones.
+        """
+        latencies = []
+        query_counts = []
+        allocations = []
+        for index in range(self.iterations):
+            traced = index % 2 == 1
+            if traced:
+                tracemalloc.start()
+            with CaptureQueriesContext(connection) as queries:
+                started = time.perf_counter()
+                response = send(index)
+                elapsed = time.perf_counter() - started
+            if traced:
+                allocations.append(tracemalloc.get_traced_memory()[1])
+                tracemalloc.stop()
+            else:
+                latencies.append(elapsed)
+            query_counts.append(len(queries))
+            if response.status_code >= 400:
+                raise CommandError(f"{name} returned {response.status_code}")
+
+        return {
+            'requests': self.iterations,
+            'latency_ms': {
+                'mean': statistics.mean(latencies) * 1000,
+                'p50': percentile(latencies, 0.50) * 1000,
+                'p90': percentile(latencies, 0.90) * 1000,
+                'p99': percentile(latencies, 0.99) * 1000,
+                'max': max(latencies) * 1000,
+            },
+            'queries': {'mean': statistics.mean(query_counts), 'max': max(query_counts)},
+            'peak_allocated_kb': {'mean': statistics.mean(allocations) / 1024, 'max': max(allocations) / 1024},
+        }
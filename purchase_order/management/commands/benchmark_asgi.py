@@ -0,0 +1,108 @@
+import asyncio
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.test import AsyncClient, Client, override_settings
+from django.urls import reverse
+
+from purchase_order.models import PurchaseOrder
+
+
+class Command(BaseCommand):
+    help = (
+        "Compares the throughput of the sync (WSGI) and async (ASGI) purchase order read endpoints "
+        "under concurrent load, with an artificial latency added to every database query"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200, help="Requests sent to each stack")
+        parser.add_argument('--concurrency', type=int, default=20, help="Requests in flight at once")
+        parser.add_argument('--db-latency-ms', type=float, default=20.0, help="Latency added to every query")
+        parser.add_argument('--page-size', type=int, default=20)
+
+    def handle(self, *args, **options):
+        order_ids = list(PurchaseOrder.objects.values_list('id', flat=True)[:50])
+        if not order_ids:
+            raise CommandError("There are no purchase orders to read, seed some first")
+
+        paths = []
+        for index in range(options['requests']):
+            if index % 2:
+                order_id = order_ids[index % len(order_ids)]
+                paths.append((reverse('purchase-order-details', args=[order_id]), reverse('async-purchase-order-details', args=[order_id])))
+            else:
+                query = f"?page_size={options['page_size']}"
+                paths.append((reverse('purchase-order-list-create') + query, reverse('async-purchase-order-list-create') + query))
+
+        latency = options['db_latency_ms'] / 1000
+
+        def slow_query(execute, sql, params, many, context):
+            time.sleep(latency)
+            return execute(sql, params, many, context)
+
+        def add_latency(sender, connection, **kwargs):
+            connection.execute_wrappers.append(slow_query)
+
+        connections.close_all()
+        connection_created.connect(add_latency)
+        try:
+            # The test clients send requests for the host 'testserver'
+            with override_settings(ALLOWED_HOSTS=['testserver']):
+                wsgi = self.run_wsgi([sync_path for sync_path, _ in paths], options['concurrency'])
+                asgi = asyncio.run(self.run_asgi([async_path for _, async_path in paths], options['concurrency']))
+        finally:
+            connection_created.disconnect(add_latency)
+            connections.close_all()
+
+        self.stdout.write(f"{'stack':<6}{'requests':>10}{'seconds':>10}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}")
+        for name, (elapsed, latencies) in (('wsgi', wsgi), ('asgi', asgi)):
+            latencies = sorted(latencies)
+            p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+            self.stdout.write(
+                f"{name:<6}{len(latencies):>10}{elapsed:>10.2f}{len(latencies) / elapsed:>10.1f}"
+                f"{statistics.median(latencies) * 1000:>10.1f}{p95 * 1000:>10.1f}"
+            )
+
+    def run_wsgi(self, paths, concurrency):
+        """
+            Sends the requests to the sync views from a pool of threads, like a threaded WSGI server
+        """
+        local = threading.local()
+
+        def send(path):
+            if not hasattr(local, 'client'):
+                local.client = Client()
+            started = time.perf_counter()
+            response = local.client.get(path)
+            if response.status_code != 200:
+                raise CommandError(f"GET {path} returned {response.status_code}")
+            return time.perf_counter() - started
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            latencies = list(executor.map(send, paths))
+        return time.perf_counter() - started, latencies
+
+    async def run_asgi(self, paths, concurrency):
+        """
+            Sends the requests to the async views from one event loop, like a single ASGI worker
+        """
+        client = AsyncClient()
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def send(path):
+            async with semaphore:
+                started = time.perf_counter()
+                response = await client.get(path)
+                if response.status_code != 200:
+                    raise CommandError(f"GET {path} returned {response.status_code}")
+                return time.perf_counter() - started
+
+        started = time.perf_counter()
+        latencies = await asyncio.gather(*(send(path) for path in paths))
+        return time.perf_counter() - started, latencies
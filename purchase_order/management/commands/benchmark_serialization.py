@@ -0,0 +1,47 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.renderers import JSONRenderer
+
+from purchase_order.models import PurchaseOrder
+from purchase_order.read_serializers import order_rows, serialize_order_rows
+from purchase_order.renderers import FastJSONRenderer
+from purchase_order.serializers import PurchaseOrderSerializer
+
+
+class Command(BaseCommand):
+    help = (
+        "Compares the time taken to read, serialize and render a page of purchase orders with PurchaseOrderSerializer "
+        "and JSONRenderer against the values() read path and FastJSONRenderer, and checks that both outputs are equal"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--orders', type=int, default=500, help="Purchase orders per page")
+        parser.add_argument('--iterations', type=int, default=10)
+
+    def handle(self, *args, **options):
+        queryset = PurchaseOrder.objects.order_by('-order_time', '-id')[:options['orders']]
+        if not queryset.exists():
+            raise CommandError("There are no purchase orders to benchmark, run seed_orders first")
+
+        def drf():
+            return JSONRenderer().render(PurchaseOrderSerializer(queryset.select_related('supplier').prefetch_related('line_items'), many=True).data)
+
+        def fast():
+            return FastJSONRenderer().render(serialize_order_rows(order_rows(queryset)))
+
+        if drf() != fast():
+            raise CommandError("The fast read path does not render the same output as PurchaseOrderSerializer")
+
+        results = {}
+        for name, render in (('drf', drf), ('fast', fast)):
+            timings = []
+            for _ in range(options['iterations']):
+                start = time.perf_counter()
+                render()
+                timings.append((time.perf_counter() - start) * 1000)
+            results[name] = {'min_ms': round(min(timings), 2), 'mean_ms': round(sum(timings) / len(timings), 2)}
+        results['speedup'] = round(results['drf']['mean_ms'] / results['fast']['mean_ms'], 2)
+
+        self.stdout.write(json.dumps(results, indent=2))
@@ -0,0 +1,88 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from purchase_order.imports import READERS, InvalidOrder, OrderLoader, clean_order, load_batch
+from purchase_order.models import ImportCheckpoint
+
+
+class Command(BaseCommand):
+    help = (
+        "Streams a csv or ndjson file of purchase orders (in the formats of the export endpoint) into the database "
+        "in batches. Suppliers are upserted by email. The import resumes from its checkpoint when run again."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=sorted(READERS), help="Defaults to the file extension")
+        parser.add_argument('--batch-size', type=int, default=1000, help="Number of orders loaded per transaction")
+        parser.add_argument('--checkpoint', help="Name of the checkpoint, defaults to the absolute path of the file")
+        parser.add_argument('--restart', action='store_true', help="Discard the checkpoint and import from the start")
+        parser.add_argument('--method', choices=['copy', 'bulk_create'], help="Defaults to copy on PostgreSQL")
+        parser.add_argument('--max-errors', type=int, default=1000, help="Abort after this many rejected orders")
+        parser.add_argument('--database', default='default')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        self.verbosity = options['verbosity']
+        file_format = options['format'] or os.path.splitext(path)[1].lstrip('.').lower()
+        if file_format not in READERS:
+            raise CommandError(f"Unknown format {file_format!r}, use --format {' or '.join(sorted(READERS))}")
+        batch_size = options['batch_size']
+        if batch_size < 1:
+            raise CommandError("--batch-size must be positive")
+
+        loader = OrderLoader(using=options['database'], method=options['method'])
+        checkpoint, _ = ImportCheckpoint.objects.using(loader.using).get_or_create(
+            name=options['checkpoint'] or os.path.abspath(path)
+        )
+        if options['restart']:
+            checkpoint.offset = checkpoint.orders = checkpoint.line_items = checkpoint.rejected = 0
+            checkpoint.save(using=loader.using)
+        elif checkpoint.offset:
+            self.stdout.write(f"Resuming after {checkpoint.orders} orders at byte {checkpoint.offset}")
+
+        orders_before = checkpoint.orders
+        rejected_before = checkpoint.rejected
+        line_items = 0
+        start = time.perf_counter()
+        try:
+            with open(path, 'rb') as file:
+                batch = []
+                rejected = 0
+                offset = checkpoint.offset
+                for line, offset, data in READERS[file_format](file, checkpoint.offset):
+                    try:
+                        batch.append(clean_order(data))
+                    except InvalidOrder as error:
+                        rejected += 1
+                        self.stderr.write(f"Order at line {line} rejected: {error}")
+                        if checkpoint.rejected + rejected - rejected_before > options['max_errors']:
+                            raise CommandError(f"More than {options['max_errors']} orders rejected, aborting")
+                    if len(batch) >= batch_size:
+                        line_items += load_batch(loader, batch, checkpoint, offset, rejected)
+                        batch = []
+                        rejected = 0
+                        self.report_progress(checkpoint, orders_before, line_items, start)
+                if batch or rejected or offset != checkpoint.offset:
+                    line_items += load_batch(loader, batch, checkpoint, offset, rejected)
+        except (InvalidOrder, UnicodeDecodeError) as error:
+            raise CommandError(f"Cannot read {path}: {error}")
+
+        elapsed = time.perf_counter() - start
+        orders = checkpoint.orders - orders_before
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {orders} orders and {line_items} line items in {elapsed:.1f}s "
+            f"({line_items / elapsed if elapsed else 0:.0f} line items/s), "
+            f"{checkpoint.rejected - rejected_before} orders rejected"
+        ))
+
+    def report_progress(self, checkpoint, orders_before, line_items, start):
+        if self.verbosity < 2:
+            return
+        elapsed = time.perf_counter() - start
+        self.stdout.write(
+            f"{checkpoint.orders - orders_before} orders, {line_items} line items, "
+            f"{line_items / elapsed if elapsed else 0:.0f} line items/s"
+        )
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from purchase_order.changes import purge_order_changes
+
+
+class Command(BaseCommand):
+    help = "Deletes the changes of the change feed log older than the RETENTION_DAYS of PURCHASE_ORDER_CHANGE_FEED"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, help="Keep the changes of this many days instead of RETENTION_DAYS")
+        parser.add_argument('--batch-size', type=int, default=1000, help="Number of changes deleted per query")
+
+    def handle(self, *args, **options):
+        deleted = purge_order_changes(days=options['days'], batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} expired order changes"))
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from purchase_order.reporting import rebuild_spend_rollup
+
+
+class Command(BaseCommand):
+    help = "Recomputes the spend rollup from the purchase orders and repairs the rows that drifted"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help="Only count the rows that would change")
+
+    def handle(self, *args, **options):
+        counts = rebuild_spend_rollup(dry_run=options['dry_run'])
+        action = "would be" if options['dry_run'] else "were"
+        self.stdout.write(self.style.SUCCESS(
+            f"{counts['created']} rows {action} created, {counts['updated']} updated and {counts['deleted']} deleted"
+        ))
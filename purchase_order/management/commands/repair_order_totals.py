@@ -0,0 +1,58 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from purchase_order.cache import get_response_cache
+from purchase_order.models import OrderChange, PurchaseOrder, line_item_totals
+from purchase_order.reporting import rebuild_spend_rollup
+
+
+class Command(BaseCommand):
+    help = "Backfills the stored totals of every PurchaseOrder and repairs the ones that drifted from their line items"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help="Number of orders checked per transaction")
+        parser.add_argument('--dry-run', action='store_true', help="Only count the orders with stale totals")
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        dry_run = options['dry_run']
+
+        totals = line_item_totals()
+        in_sync = Q()
+        for field in totals:
+            in_sync &= Q(**{field: F(f'computed_{field}')})
+        stale_orders = PurchaseOrder.objects.alias(
+            **{f'computed_{field}': expression for field, expression in totals.items()}
+        ).exclude(in_sync)
+
+        last_pk = 0
+        checked = 0
+        repaired = 0
+        while True:
+            batch = list(
+                PurchaseOrder.objects.filter(pk__gt=last_pk).order_by('pk').values_list('pk', flat=True)[:batch_size]
+            )
+            if not batch:
+                break
+            last_pk = batch[-1]
+            checked += len(batch)
+
+            with transaction.atomic():
+                stale_ids = list(stale_orders.filter(pk__in=batch).values_list('pk', flat=True))
+                if stale_ids and not dry_run:
+                    # Repaired orders are changed orders: new version for their ETag and cache key, and a change feed entry
+                    repaired_orders = PurchaseOrder.objects.filter(pk__in=stale_ids)
+                    repaired_orders.update(**totals, version=F('version') + 1, updated_at=timezone.now())
+                    OrderChange.objects.record(OrderChange.UPDATED, repaired_orders.values_list('id', 'version'))
+            if stale_ids and not dry_run:
+                get_response_cache().invalidate(*stale_ids)
+            repaired += len(stale_ids)
+
+        if repaired and not dry_run:
+            # The spend rollup was computed from the stale totals
+            rebuild_spend_rollup()
+
+        action = "would be repaired" if dry_run else "repaired"
+        self.stdout.write(self.style.SUCCESS(f"Checked {checked} orders, {repaired} {action}"))
@@ -0,0 +1,74 @@
+import multiprocessing
+import signal
+import threading
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from purchase_order.jobs import work
+
+
+def run_worker(stop, poll_interval, burst):
+    """
+        Entry point of a forked worker process, which stops after its current job on SIGINT or SIGTERM
+    """
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(signum, lambda *args: stop.set())
+    work(stop, poll_interval=poll_interval, burst=burst)
+    connections.close_all()
+
+
+class Command(BaseCommand):
+    help = (
+        "Runs the queued export and report jobs in a pool of worker processes. Workers poll the job table "
+        "and claim jobs with SELECT ... FOR UPDATE SKIP LOCKED, no broker is needed. "
+        "SIGINT or SIGTERM stop the workers once their current job is done."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=2, help="Number of worker processes, 1 runs in this process")
+        parser.add_argument('--poll-interval', type=float, default=1.0, help="Seconds between two polls of an empty queue")
+        parser.add_argument('--burst', action='store_true', help="Exit once the queue is empty")
+
+    def handle(self, *args, **options):
+        workers = options['workers']
+        if workers < 1:
+            raise CommandError("--workers must be positive")
+        poll_interval = options['poll_interval']
+        burst = options['burst']
+
+        if workers == 1:
+            stop = threading.Event()
+            previous_handlers = {
+                signum: signal.signal(signum, lambda *args: stop.set()) for signum in (signal.SIGINT, signal.SIGTERM)
+            }
+            try:
+                jobs_run = work(stop, poll_interval=poll_interval, burst=burst)
+            finally:
+                for signum, handler in previous_handlers.items():
+                    signal.signal(signum, handler)
+            self.stdout.write(self.style.SUCCESS(f"Ran {jobs_run} jobs"))
+            return
+
+        # Forked processes must not share the database connections of this one
+        connections.close_all()
+        context = multiprocessing.get_context('fork')
+        stop = context.Event()
+        processes = [
+            context.Process(target=run_worker, args=(stop, poll_interval, burst), name=f'purchase-order-worker-{index}')
+            for index in range(workers)
+        ]
+        for process in processes:
+            process.start()
+        self.stdout.write(f"Started {workers} workers")
+
+        previous_handlers = {
+            signum: signal.signal(signum, lambda *args: stop.set()) for signum in (signal.SIGINT, signal.SIGTERM)
+        }
+        try:
+            for process in processes:
+                process.join()
+        finally:
+            for signum, handler in previous_handlers.items():
+                signal.signal(signum, handler)
+        self.stdout.write(self.style.SUCCESS(f"Stopped {workers} workers"))
@@ -0,0 +1,53 @@
+import time
+
+import factory.random
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from purchase_order.factories import SupplierFactory, PurchaseOrderFactory, LineItemFactory
+from purchase_order.models import Supplier, LineItem, PurchaseOrder, line_item_totals
+from purchase_order.reporting import rebuild_spend_rollup
+
+
+class Command(BaseCommand):
+    help = "Seeds N suppliers with M purchase orders each, every order having K line items"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--suppliers', type=int, default=100)
+        parser.add_argument('--orders', type=int, default=10, help="Purchase orders per supplier")
+        parser.add_argument('--lines', type=int, default=5, help="Line items per purchase order")
+        parser.add_argument('--seed', type=int, default=0, help="Random seed, the same seed gives the same data")
+        parser.add_argument('--batch-size', type=int, default=1000, help="Purchase orders inserted per transaction")
+
+    def handle(self, *args, **options):
+        factory.random.reseed_random(options['seed'])
+        started = time.perf_counter()
+
+        # Continue the email sequence after existing suppliers so reseeding adds new ones
+        SupplierFactory.reset_sequence(Supplier.objects.count())
+        suppliers = Supplier.objects.bulk_create(SupplierFactory.build_batch(options['suppliers']))
+
+        orders = [supplier for supplier in suppliers for _ in range(options['orders'])]
+        batch_size = options['batch_size']
+        for start in range(0, len(orders), batch_size):
+            with transaction.atomic():
+                batch = [PurchaseOrderFactory.build(supplier=supplier) for supplier in orders[start:start + batch_size]]
+                for purchase_order, order_number in zip(batch, PurchaseOrder.reserve_order_numbers(len(batch))):
+                    purchase_order.order_number = order_number
+                PurchaseOrder.objects.bulk_create(batch)
+
+                LineItem.objects.bulk_create(
+                    (
+                        LineItemFactory.build(purchase_order=purchase_order)
+                        for purchase_order in batch for _ in range(options['lines'])
+                    ),
+                    batch_size=batch_size,
+                )
+                PurchaseOrder.objects.filter(pk__in=[purchase_order.pk for purchase_order in batch]).update(**line_item_totals())
+        rebuild_spend_rollup()
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Seeded {len(suppliers)} suppliers, {len(orders)} orders and {len(orders) * options['lines']} line items "
+            f"in {elapsed:.1f}s"
+        ))
@@ -0,0 +1,130 @@
+import logging
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+from .instrumentation import RequestMetrics, current_metrics, registry
+from .routers import use_replica
+
+logger = logging.getLogger('purchase_order.requests')
+
+PRIMARY_PIN_COOKIE = 'primary_pinned_until'
+
+
+class ReplicaRoutingMiddleware:
+    """
+        Lets the database router serve safe requests from a read replica.
+        After a write the client is pinned to the primary for PURCHASE_ORDER_REPLICA_STICKY_SECONDS, through a
+        cookie, so that it reads its own writes while the replicas catch up.
+    """
+    safe_methods = ('GET', 'HEAD', 'OPTIONS')
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        token = use_replica.set(self.may_use_replica(request))
+        try:
+            response = self.get_response(request)
+        finally:
+            use_replica.reset(token)
+        return self.process_response(request, response)
+
+    async def __acall__(self, request):
+        token = use_replica.set(self.may_use_replica(request))
+        try:
+            response = await self.get_response(request)
+        finally:
+            use_replica.reset(token)
+        return self.process_response(request, response)
+
+    def may_use_replica(self, request):
+        return request.method in self.safe_methods and not self.is_pinned(request)
+
+    def process_response(self, request, response):
+        if request.method not in self.safe_methods and response.status_code < 400:
+            sticky_seconds = getattr(settings, 'PURCHASE_ORDER_REPLICA_STICKY_SECONDS', 5)
+            response.set_cookie(PRIMARY_PIN_COOKIE, str(time.time() + sticky_seconds), max_age=sticky_seconds, httponly=True)
+        return response
+
+    def is_pinned(self, request):
+        try:
+            return float(request.COOKIES.get(PRIMARY_PIN_COOKIE, 0)) > time.time()
+        except ValueError:
+            return False
+
+
+class InstrumentationMiddleware:
+    """
+        Measures the time each request spends in SQL, in the serializers and in rendering.
+        The timings are sent back in a Server-Timing header, added to the histograms served at /metrics,
+        and requests slower than PURCHASE_ORDER_SLOW_REQUEST_MS are logged with their slowest queries.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        metrics = RequestMetrics()
+        token = current_metrics.set(metrics)
+        try:
+            response = self.get_response(request)
+        finally:
+            current_metrics.reset(token)
+        return self.process_response(request, response, metrics)
+
+    async def __acall__(self, request):
+        metrics = RequestMetrics()
+        token = current_metrics.set(metrics)
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_metrics.reset(token)
+        return self.process_response(request, response, metrics)
+
+    def process_response(self, request, response, metrics):
+        total_time = metrics.total_time
+        response['Server-Timing'] = ', '.join([
+            f'db;dur={metrics.db_time * 1000:.1f};desc="{len(metrics.queries)} queries"',
+            f'serialize;dur={metrics.sections["serialize"] * 1000:.1f}',
+            f'render;dur={metrics.sections["render"] * 1000:.1f}',
+            f'total;dur={total_time * 1000:.1f}',
+        ])
+
+        resolver_match = getattr(request, 'resolver_match', None)
+        endpoint = resolver_match.route if resolver_match is not None else 'unmatched'
+        registry.observe(request.method, endpoint, response.status_code, metrics)
+
+        if total_time * 1000 >= getattr(settings, 'PURCHASE_ORDER_SLOW_REQUEST_MS', 500):
+            logger.warning(
+                "Slow request",
+                extra={
+                    'method': request.method,
+                    'path': request.path,
+                    'status': response.status_code,
+                    'duration_ms': round(total_time * 1000, 1),
+                    'db_ms': round(metrics.db_time * 1000, 1),
+                    'db_queries': len(metrics.queries),
+                    'serialize_ms': round(metrics.sections['serialize'] * 1000, 1),
+                    'render_ms': round(metrics.sections['render'] * 1000, 1),
+                    'top_queries': [
+                        {'sql': sql, 'duration_ms': round(elapsed * 1000, 1)} for sql, elapsed in metrics.top_queries(5)
+                    ],
+                },
+            )
+        return response
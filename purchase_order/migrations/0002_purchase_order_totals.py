@@ -0,0 +1,51 @@
+# Generated by Django 5.0 on 2026-10-17 17:12
+
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.db.models import F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def backfill_totals(apps, schema_editor):
+    LineItem = apps.get_model('purchase_order', 'LineItem')
+    PurchaseOrder = apps.get_model('purchase_order', 'PurchaseOrder')
+
+    decimal_field = models.DecimalField(max_digits=14, decimal_places=2)
+    line_items = LineItem.objects.filter(purchase_order=OuterRef('pk')).order_by().values('purchase_order')
+
+    def total(expression, default):
+        subquery = Subquery(line_items.annotate(total=expression).values('total'))
+        return Coalesce(subquery, Value(default), output_field=expression.output_field)
+
+    PurchaseOrder.objects.update(
+        total_quantity=total(Sum('quantity', output_field=models.PositiveIntegerField()), 0),
+        total_amount=total(Sum(F('quantity') * (F('price_without_tax') + F('tax_amount')), output_field=decimal_field), Decimal('0')),
+        total_tax=total(Sum('tax_amount', output_field=decimal_field), Decimal('0')),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('purchase_order', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='purchaseorder',
+            name='total_amount',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=14),
+        ),
+        migrations.AddField(
+            model_name='purchaseorder',
+            name='total_quantity',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='purchaseorder',
+            name='total_tax',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=14),
+        ),
+        migrations.RunPython(backfill_totals, migrations.RunPython.noop),
+    ]
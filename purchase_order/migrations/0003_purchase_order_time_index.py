@@ -0,0 +1,17 @@
+# Generated by Django 5.0 on 2026-10-17 17:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('purchase_order', '0002_purchase_order_totals'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='purchaseorder',
+            index=models.Index(fields=['order_time', 'id'], name='purchase_order_time_id_idx'),
+        ),
+    ]
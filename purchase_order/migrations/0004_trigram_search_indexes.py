@@ -0,0 +1,36 @@
+from django.db import migrations
+
+# Django's icontains lookup compiles to UPPER("column"::text) LIKE UPPER(%s) on Postgres,
+# so the trigram indexes are built on that same expression to be usable by the filters and search.
+TRIGRAM_INDEXES = (
+    ('purchase_order_supplier_name_trgm_idx', 'purchase_order_supplier', 'name'),
+    ('purchase_order_lineitem_item_name_trgm_idx', 'purchase_order_lineitem', 'item_name'),
+)
+
+
+def create_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    for index_name, table, column in TRIGRAM_INDEXES:
+        schema_editor.execute(
+            f'CREATE INDEX IF NOT EXISTS {index_name} ON {table} USING gin ((UPPER({column}::text)) gin_trgm_ops)'
+        )
+
+
+def drop_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for index_name, table, column in TRIGRAM_INDEXES:
+        schema_editor.execute(f'DROP INDEX IF EXISTS {index_name}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('purchase_order', '0003_purchase_order_time_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_trigram_indexes, drop_trigram_indexes),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 5.0 on 2026-10-17 17:16
+
+from django.db import migrations, models
+from django.db.models import Count, Max
+
+
+def seed_order_number_counter(apps, schema_editor):
+    """
+        Renumbers orders that were given duplicate numbers by the old allocator,
+        then starts the counter after the highest order number
+    """
+    OrderNumberCounter = apps.get_model('purchase_order', 'OrderNumberCounter')
+    PurchaseOrder = apps.get_model('purchase_order', 'PurchaseOrder')
+
+    last_number = PurchaseOrder.objects.aggregate(last_number=Max('order_number'))['last_number'] or 0
+    duplicated_numbers = (
+        PurchaseOrder.objects.values('order_number').annotate(count=Count('id')).filter(count__gt=1).values_list('order_number', flat=True)
+    )
+    for order_number in list(duplicated_numbers):
+        for purchase_order in PurchaseOrder.objects.filter(order_number=order_number).order_by('id')[1:]:
+            last_number += 1
+            purchase_order.order_number = last_number
+            purchase_order.save(update_fields=['order_number'])
+
+    OrderNumberCounter.objects.update_or_create(name='purchase_order', defaults={'last_value': last_number})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('purchase_order', '0004_trigram_search_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrderNumberCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=64, unique=True)),
+                ('last_value', models.PositiveBigIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(seed_order_number_counter, migrations.RunPython.noop),
+    ]
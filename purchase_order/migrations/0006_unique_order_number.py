@@ -0,0 +1,18 @@
+# Generated by Django 5.0 on 2026-10-17 17:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('purchase_order', '0005_order_number_counter'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='purchaseorder',
+            name='order_number',
+            field=models.PositiveIntegerField(default=0, unique=True),
+        ),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 5.0 on 2026-10-17 17:40
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDate
+
+
+def build_rollup(apps, schema_editor):
+    PurchaseOrder = apps.get_model('purchase_order', 'PurchaseOrder')
+    SupplierDailySpend = apps.get_model('purchase_order', 'SupplierDailySpend')
+
+    rows = PurchaseOrder.objects.annotate(day=TruncDate('order_time')).values('supplier_id', 'day').annotate(
+        order_count=Count('id'),
+        total_quantity=Sum('total_quantity'),
+        total_amount=Sum('total_amount'),
+        total_tax=Sum('total_tax'),
+    ).order_by()
+    SupplierDailySpend.objects.bulk_create((SupplierDailySpend(**row) for row in rows), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('purchase_order', '0009_import_checkpoint'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SupplierDailySpend',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('order_count', models.IntegerField(default=0)),
+                ('total_quantity', models.BigIntegerField(default=0)),
+                ('total_amount', models.DecimalField(decimal_places=2, default=0, max_digits=18)),
+                ('total_tax', models.DecimalField(decimal_places=2, default=0, max_digits=18)),
+                ('supplier', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_spend', to='purchase_order.supplier')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['day', 'supplier'], name='purchase_order_spend_day_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='supplierdailyspend',
+            constraint=models.UniqueConstraint(fields=('supplier', 'day'), name='purchase_order_daily_spend_unique'),
+        ),
+        migrations.RunPython(build_rollup, migrations.RunPython.noop),
+    ]
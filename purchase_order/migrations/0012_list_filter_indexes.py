@@ -0,0 +1,36 @@
+# Generated by Django 5.0 on 2026-10-17 17:52
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('purchase_order', '0011_job'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='purchaseorder',
+            index=models.Index(fields=['supplier', 'order_time', 'id'], name='purchase_order_supplier_idx'),
+        ),
+        # The foreign key index is dropped once the composite index which replaces it exists
+        migrations.AlterField(
+            model_name='purchaseorder',
+            name='supplier',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='orders', to='purchase_order.supplier'),
+        ),
+        migrations.AddIndex(
+            model_name='purchaseorder',
+            index=models.Index(fields=['total_amount', 'id'], name='purchase_order_amount_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='purchaseorder',
+            index=models.Index(fields=['total_quantity', 'id'], name='purchase_order_quantity_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='purchaseorder',
+            index=models.Index(fields=['total_tax', 'id'], name='purchase_order_tax_idx'),
+        ),
+    ]
@@ -0,0 +1,60 @@
+# Generated by Django 5.0 on 2026-10-17 18:00
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('purchase_order', '0013_order_change'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedPurchaseOrder',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('order_time', models.DateTimeField()),
+                ('order_number', models.PositiveIntegerField(unique=True)),
+                ('total_quantity', models.PositiveIntegerField(default=0)),
+                ('total_amount', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('total_tax', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('version', models.PositiveIntegerField(default=1)),
+                ('updated_at', models.DateTimeField()),
+                ('supplier', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='archived_orders', to='purchase_order.supplier')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ArchivedLineItem',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('item_name', models.CharField(max_length=255)),
+                ('quantity', models.PositiveIntegerField()),
+                ('price_without_tax', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('tax_name', models.CharField(max_length=255)),
+                ('tax_amount', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('purchase_order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='line_items', to='purchase_order.archivedpurchaseorder')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='archivedpurchaseorder',
+            index=models.Index(fields=['order_time', 'id'], name='archived_order_time_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='archivedpurchaseorder',
+            index=models.Index(fields=['supplier', 'order_time', 'id'], name='archived_order_supplier_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='archivedpurchaseorder',
+            index=models.Index(fields=['total_amount', 'id'], name='archived_order_amount_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='archivedpurchaseorder',
+            index=models.Index(fields=['total_quantity', 'id'], name='archived_order_quantity_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='archivedpurchaseorder',
+            index=models.Index(fields=['total_tax', 'id'], name='archived_order_tax_idx'),
+        ),
+    ]
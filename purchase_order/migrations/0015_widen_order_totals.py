@@ -0,0 +1,53 @@
+# Generated by Django 5.0 on 2026-10-17 18:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('purchase_order', '0014_order_archive'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='archivedpurchaseorder',
+            name='total_amount',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=30),
+        ),
+        migrations.AlterField(
+            model_name='archivedpurchaseorder',
+            name='total_quantity',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+        migrations.AlterField(
+            model_name='archivedpurchaseorder',
+            name='total_tax',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=30),
+        ),
+        migrations.AlterField(
+            model_name='purchaseorder',
+            name='total_amount',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=30),
+        ),
+        migrations.AlterField(
+            model_name='purchaseorder',
+            name='total_quantity',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+        migrations.AlterField(
+            model_name='purchaseorder',
+            name='total_tax',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=30),
+        ),
+        migrations.AlterField(
+            model_name='supplierdailyspend',
+            name='total_amount',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=32),
+        ),
+        migrations.AlterField(
+            model_name='supplierdailyspend',
+            name='total_tax',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=32),
+        ),
+    ]
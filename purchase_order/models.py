@@ -1,4 +1,12 @@
-from django.db import models
+from decimal import Decimal
+
+from django.db import models, router, transaction
+from django.db.models import F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce, Greatest
+from django.utils import timezone
+from rest_framework.utils.encoders import JSONEncoder
+
+from .cache import get_response_cache
 
 class Supplier(models.Model):
     name = models.CharField(max_length=255)
@@ -16,44 +24,359 @@ class LineItem(models.Model):
     def line_total(self):
         return self.quantity * (self.price_without_tax + self.tax_amount)
 
+    def save(self, *args, **kwargs):
+        """
+            Keeps the stored totals of the parent PurchaseOrder in sync with its line items
+        """
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            self.purchase_order.update_totals()
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            result = super().delete(*args, **kwargs)
+            self.purchase_order.update_totals()
+        return result
+
+
+class OrderNumberCounter(models.Model):
+    """
+        Holds the last allocated order number. Order numbers are handed out by incrementing
+        the single row, which locks it until the allocating transaction ends.
+    """
+    name = models.CharField(max_length=64, unique=True)
+    last_value = models.PositiveBigIntegerField(default=0)
+
+
+ORDER_NUMBER_COUNTER = 'purchase_order'
+
+
+TOTAL_FIELDS = ('total_quantity', 'total_amount', 'total_tax')
+VERSION_FIELDS = ('version', 'updated_at')
+# Fields of an order counted by the spend rollup, as (name, attname) pairs in the order of reporting.spend_state
+SPEND_FIELDS = (('supplier', 'supplier_id'), ('order_time', 'order_time'), *((field, field) for field in TOTAL_FIELDS))
+
+
+def line_item_totals():
+    """
+        Returns correlated subqueries computing the totals of a PurchaseOrder from its line items,
+        keyed by the name of the PurchaseOrder column they are stored in
+    """
+    decimal_field = models.DecimalField(max_digits=30, decimal_places=2)
+    line_items = LineItem.objects.filter(purchase_order=OuterRef('pk')).order_by().values('purchase_order')
+
+    def total(expression, default):
+        subquery = Subquery(line_items.annotate(total=expression).values('total'))
+        return Coalesce(subquery, Value(default), output_field=expression.output_field)
+
+    return {
+        'total_quantity': total(Sum('quantity', output_field=models.PositiveBigIntegerField()), 0),
+        'total_amount': total(Sum(F('quantity') * (F('price_without_tax') + F('tax_amount')), output_field=decimal_field), Decimal('0')),
+        'total_tax': total(Sum('tax_amount', output_field=decimal_field), Decimal('0')),
+    }
+
+
+class PurchaseOrderQuerySet(models.QuerySet):
+    def with_details(self):
+        """
+            Joins the supplier and prefetches the line items so that serializing
+            the orders costs a fixed number of queries regardless of their count
+        """
+        return self.select_related('supplier').prefetch_related('line_items')
+
+    def touch(self):
+        """
+            Marks the orders as changed by bumping their version, which invalidates their cached responses,
+            and logs the change for the change feed
+        """
+        with transaction.atomic(savepoint=False, using=self.db):
+            touched = self.update(version=F('version') + 1, updated_at=timezone.now())
+            if touched:
+                OrderChange.objects.using(self.db).record(OrderChange.UPDATED, self.values_list('id', 'version'))
+        return touched
 
 
 class PurchaseOrder(models.Model):
-    supplier = models.ForeignKey('Supplier', on_delete=models.CASCADE, related_name="orders")
+    # Lookups by supplier are served by purchase_order_supplier_idx, which starts with supplier_id
+    supplier = models.ForeignKey('Supplier', on_delete=models.CASCADE, related_name="orders", db_index=False)
     order_time = models.DateTimeField(auto_now_add=True)
-    order_number = models.PositiveIntegerField(default=0)
+    order_number = models.PositiveIntegerField(default=0, unique=True)
+    # Sums over the line items, wide enough for any number of line items at the largest quantity and price
+    total_quantity = models.PositiveBigIntegerField(default=0)
+    total_amount = models.DecimalField(max_digits=30, decimal_places=2, default=0)
+    total_tax = models.DecimalField(max_digits=30, decimal_places=2, default=0)
+    version = models.PositiveIntegerField(default=1)
+    updated_at = models.DateTimeField(auto_now=True)
 
-    @property
-    def total_quantity(self):
-        total_quantity = 0
-        for line_item in self.line_items.all():
-            total_quantity += line_item.quantity
-        return total_quantity
+    objects = PurchaseOrderQuerySet.as_manager()
 
-    @property
-    def total_amount(self):
-        total_amount = 0
-        for line_item in self.line_items.all():
-            total_amount += line_item.line_total
-        return total_amount
-    
-    @property
-    def total_tax(self):
-        total_tax = 0
-        for line_item in self.line_items.all():
-            total_tax += line_item.tax_amount
-        return total_tax
+    class Meta:
+        # One index per ordering of the list endpoint, ending with id which breaks ties.
+        # order_number is unique and already indexed.
+        indexes = [
+            models.Index(fields=['order_time', 'id'], name='purchase_order_time_id_idx'),
+            models.Index(fields=['supplier', 'order_time', 'id'], name='purchase_order_supplier_idx'),
+            models.Index(fields=['total_amount', 'id'], name='purchase_order_amount_idx'),
+            models.Index(fields=['total_quantity', 'id'], name='purchase_order_quantity_idx'),
+            models.Index(fields=['total_tax', 'id'], name='purchase_order_tax_idx'),
+        ]
+
+    def update_totals(self):
+        """
+            Recomputes the stored totals from the line items and bumps the version in a single UPDATE, then reloads them.
+            The change of the totals is added to the spend rollup and the change is logged for the change feed.
+        """
+        from .reporting import record_order_change
+
+        with transaction.atomic():
+            before = PurchaseOrder.objects.select_for_update().filter(pk=self.pk).values_list(
+                'supplier_id', 'order_time', *TOTAL_FIELDS
+            ).get()
+            PurchaseOrder.objects.filter(pk=self.pk).update(
+                **line_item_totals(), version=F('version') + 1, updated_at=timezone.now()
+            )
+            self.refresh_from_db(fields=TOTAL_FIELDS + VERSION_FIELDS)
+            record_order_change(before, (before[0], before[1], *(getattr(self, field) for field in TOTAL_FIELDS)))
+            OrderChange.objects.record(OrderChange.UPDATED, [(self.pk, self.version)])
+        get_response_cache().invalidate(self.pk)
+
+    @classmethod
+    def update_order_number_counter(cls, last_value, using):
+        """
+            Sets the last allocated order number to the last_value expression, creating the counter
+            from the largest order number of the orders when it is missing. Returns the counter queryset.
+        """
+        counter = OrderNumberCounter.objects.using(using).filter(name=ORDER_NUMBER_COUNTER)
+        # The UPDATE takes the row lock before reading, so concurrent allocations never overlap
+        if not counter.update(last_value=last_value):
+            last_number = max(
+                model.objects.using(using).aggregate(last_number=models.Max('order_number'))['last_number'] or 0
+                for model in (cls, ArchivedPurchaseOrder)
+            )
+            OrderNumberCounter.objects.using(using).get_or_create(name=ORDER_NUMBER_COUNTER, defaults={'last_value': last_number})
+            counter.update(last_value=last_value)
+        return counter
+
+    @classmethod
+    def reserve_order_numbers(cls, count, using=None):
+        """
+            Reserves a block of count consecutive order numbers in the given database and returns it as a range
+        """
+        using = using or router.db_for_write(OrderNumberCounter)
+        with transaction.atomic(savepoint=False, using=using):
+            counter = cls.update_order_number_counter(F('last_value') + count, using)
+            last_value = counter.values_list('last_value', flat=True).get()
+        return range(last_value - count + 1, last_value + 1)
+
+    @classmethod
+    def claim_order_number(cls, order_number, using=None):
+        """
+            Moves the counter up to an order number chosen by the caller, so that it is never reserved again
+        """
+        using = using or router.db_for_write(OrderNumberCounter)
+        with transaction.atomic(savepoint=False, using=using):
+            cls.update_order_number_counter(
+                Greatest('last_value', Value(order_number), output_field=models.PositiveBigIntegerField()), using
+            )
 
     def save(self, *args, **kwargs):
         """
-            Added fuctionality to increment order number wheneven new PurchaseOrder is created
+            Added fuctionality to increment order number wheneven new PurchaseOrder is created,
+            new orders are also added to the spend rollup and to the change log.
+            Saving an existing order bumps its version, moves its spend from its stored state and logs the change.
         """
-        if not self.order_number:
-            last_order = PurchaseOrder.objects.order_by('-order_number').first()
-            if last_order:
-                self.order_number = last_order.order_number + 1
+        from .reporting import SpendDelta, record_order_change
+
+        using = kwargs.get('using') or router.db_for_write(PurchaseOrder, instance=self)
+        with transaction.atomic(using=using):
+            if not self.order_number:
+                self.order_number = PurchaseOrder.reserve_order_numbers(1, using=using)[0]
+            elif self._state.adding:
+                PurchaseOrder.claim_order_number(self.order_number, using=using)
+
+            adding = self._state.adding
+            stored = None
+            if not adding:
+                stored = PurchaseOrder.objects.using(using).select_for_update().filter(pk=self.pk).values_list(
+                    'supplier_id', 'order_time', *TOTAL_FIELDS, 'version'
+                ).first()
+            if stored is not None:
+                before, self.version = stored[:-1], stored[-1] + 1
+                if kwargs.get('update_fields') is not None:
+                    kwargs['update_fields'] = {*kwargs['update_fields'], *VERSION_FIELDS}
+            super().save(*args, **kwargs)
+            if stored is None:
+                delta = SpendDelta(using)
+                delta.add_order(self)
+                delta.apply()
+                OrderChange.objects.using(using).record(OrderChange.CREATED, [(self.pk, self.version)])
             else:
-                self.order_number = 1
+                # Fields left out of update_fields keep their stored value
+                saved = kwargs.get('update_fields')
+                after = tuple(
+                    getattr(self, attname) if saved is None or {name, attname} & set(saved) else value
+                    for (name, attname), value in zip(SPEND_FIELDS, before)
+                )
+                record_order_change(before, after, using=using)
+                OrderChange.objects.using(using).record(OrderChange.UPDATED, [(self.pk, self.version)])
+        if not adding:
+            get_response_cache().invalidate(self.pk)
+
+
+class IdempotencyKey(models.Model):
+    """
+        Response of a write request sent with an Idempotency-Key header, replayed when the client retries the request.
+        The row is inserted in the same transaction as the write, so a concurrent retry waits on its unique key.
+    """
+    key = models.CharField(max_length=255)
+    method = models.CharField(max_length=10)
+    path = models.CharField(max_length=255)
+    request_fingerprint = models.CharField(max_length=64)
+    status_code = models.PositiveSmallIntegerField(null=True)
+    response_body = models.JSONField(null=True, encoder=JSONEncoder)
+    response_headers = models.JSONField(default=dict)
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['key', 'method', 'path'], name='purchase_order_idempotency_key_unique'),
+        ]
+
+
+class ImportCheckpoint(models.Model):
+    """
+        Progress of an import_orders run: the byte offset of the source file up to which orders were loaded.
+        It is saved in the transaction of each batch, so a resumed import never loads an order twice.
+    """
+    name = models.CharField(max_length=255, unique=True)
+    offset = models.PositiveBigIntegerField(default=0)
+    orders = models.PositiveBigIntegerField(default=0)
+    line_items = models.PositiveBigIntegerField(default=0)
+    rejected = models.PositiveBigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
 
-        super().save(*args, **kwargs)
-    
\ No newline at end of file
+class SupplierDailySpend(models.Model):
+    """
+        Rollup of the orders of a supplier placed on one day, kept up to date by every write to the orders
+        (see purchase_order.reporting) so that spend reports read one row per supplier and day
+    """
+    supplier = models.ForeignKey('Supplier', on_delete=models.CASCADE, related_name="daily_spend")
+    day = models.DateField()
+    order_count = models.IntegerField(default=0)
+    total_quantity = models.BigIntegerField(default=0)
+    total_amount = models.DecimalField(max_digits=32, decimal_places=2, default=0)
+    total_tax = models.DecimalField(max_digits=32, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['supplier', 'day'], name='purchase_order_daily_spend_unique'),
+        ]
+        indexes = [
+            models.Index(fields=['day', 'supplier'], name='purchase_order_spend_day_idx'),
+        ]
+
+
+class Job(models.Model):
+    """
+        Export or report run in the background by the run_workers command. Workers claim queued jobs with
+        SELECT ... FOR UPDATE SKIP LOCKED, so each job is run by one worker, and write their result to a file.
+    """
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    SUCCEEDED = 'succeeded'
+    FAILED = 'failed'
+    STATUS_CHOICES = [(QUEUED, 'Queued'), (RUNNING, 'Running'), (SUCCEEDED, 'Succeeded'), (FAILED, 'Failed')]
+
+    job_type = models.CharField(max_length=50)
+    params = models.JSONField(default=dict)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=QUEUED)
+    progress = models.PositiveBigIntegerField(default=0)
+    total = models.PositiveBigIntegerField(null=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    worker = models.CharField(max_length=255, blank=True)
+    error = models.TextField(blank=True)
+    result_name = models.CharField(max_length=255, blank=True)
+    result_content_type = models.CharField(max_length=100, blank=True)
+    result_size = models.PositiveBigIntegerField(null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True)
+    heartbeat_at = models.DateTimeField(null=True)
+    finished_at = models.DateTimeField(null=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'created_at'], name='purchase_order_job_queue_idx'),
+        ]
+
+
+class OrderChangeQuerySet(models.QuerySet):
+    def record(self, action, versions):
+        """
+            Logs the action for each (purchase order id, version) pair, in the transaction of the change
+        """
+        return self.bulk_create(
+            [self.model(purchase_order_id=purchase_order_id, action=action, version=version) for purchase_order_id, version in versions],
+            batch_size=1000,
+        )
+
+
+class OrderChange(models.Model):
+    """
+        Log of the changes to the purchase orders, read by the change feed in sequence order. A row is written in the
+        transaction of every change which bumps the version of an order (or its creation) and of every deletion.
+    """
+    CREATED = 'created'
+    UPDATED = 'updated'
+    DELETED = 'deleted'
+    ACTION_CHOICES = [(CREATED, 'Created'), (UPDATED, 'Updated'), (DELETED, 'Deleted')]
+
+    sequence = models.BigAutoField(primary_key=True)
+    # Not a foreign key, the changes of deleted orders are kept
+    purchase_order_id = models.BigIntegerField()
+    action = models.CharField(max_length=10, choices=ACTION_CHOICES)
+    version = models.PositiveIntegerField(null=True)
+    changed_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    objects = OrderChangeQuerySet.as_manager()
+
+
+class ArchivedPurchaseOrder(models.Model):
+    """
+        PurchaseOrder moved out of the hot table by the archive_orders command, with the same id and columns.
+        Archived orders are read-only.
+    """
+    id = models.BigIntegerField(primary_key=True)
+    supplier = models.ForeignKey('Supplier', on_delete=models.CASCADE, related_name="archived_orders", db_index=False)
+    order_time = models.DateTimeField()
+    order_number = models.PositiveIntegerField(unique=True)
+    total_quantity = models.PositiveBigIntegerField(default=0)
+    total_amount = models.DecimalField(max_digits=30, decimal_places=2, default=0)
+    total_tax = models.DecimalField(max_digits=30, decimal_places=2, default=0)
+    version = models.PositiveIntegerField(default=1)
+    updated_at = models.DateTimeField()
+
+    class Meta:
+        # The orderings of the list endpoint with ?include_archived=1, like PurchaseOrder.Meta.indexes
+        indexes = [
+            models.Index(fields=['order_time', 'id'], name='archived_order_time_id_idx'),
+            models.Index(fields=['supplier', 'order_time', 'id'], name='archived_order_supplier_idx'),
+            models.Index(fields=['total_amount', 'id'], name='archived_order_amount_idx'),
+            models.Index(fields=['total_quantity', 'id'], name='archived_order_quantity_idx'),
+            models.Index(fields=['total_tax', 'id'], name='archived_order_tax_idx'),
+        ]
+
+
+class ArchivedLineItem(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    item_name = models.CharField(max_length=255)
+    quantity = models.PositiveIntegerField()
+    price_without_tax = models.DecimalField(max_digits=10, decimal_places=2)
+    tax_name = models.CharField(max_length=255)
+    tax_amount = models.DecimalField(max_digits=10, decimal_places=2)
+    purchase_order = models.ForeignKey('ArchivedPurchaseOrder', on_delete=models.CASCADE, related_name="line_items")
+
+    @property
+    def line_total(self):
+        return self.quantity * (self.price_without_tax + self.tax_amount)
@@ -0,0 +1,197 @@
+import heapq
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db.models import BooleanField, F, Func, Value
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import CursorPagination, _reverse_ordering
+
+
+# Fields accepted by ?ordering=, each one is read in order from an index on (field, id) where the cursor position
+# is looked up (see PurchaseOrder.Meta.indexes)
+ORDERING_FIELDS = ('order_time', 'order_number', 'total_amount', 'total_quantity', 'total_tax')
+DEFAULT_ORDERING = ('-order_time', '-id')
+
+
+def parse_ordering(query_params):
+    """
+        Returns the ordering requested with ?ordering=field or ?ordering=-field (descending), ties being
+        broken by id in the same direction. Raises ValueError for the fields that cannot be ordered by.
+    """
+    value = query_params.get('ordering')
+    if not value:
+        return DEFAULT_ORDERING
+    field = value[1:] if value.startswith('-') else value
+    if field not in ORDERING_FIELDS:
+        raise ValueError(f"ordering must be one of {', '.join(ORDERING_FIELDS)}, prefixed with - for descending order.")
+    if field == 'order_number':
+        # Unique, a tie breaker would keep PostgreSQL from reading the order from its index
+        return (value,)
+    return (value, '-id' if value.startswith('-') else 'id')
+
+
+class RowComparison(Func):
+    """
+        Compares a row of columns with a row of values, (a, b) > (x, y), which an index on (a, b) answers with
+        one range scan
+    """
+    output_field = BooleanField()
+
+    def __init__(self, columns, operator, values):
+        super().__init__(*columns, *values)
+        self.operator = operator
+
+    def as_sql(self, compiler, connection, **extra_context):
+        sql, params = [], []
+        for expression in self.source_expressions:
+            expression_sql, expression_params = compiler.compile(expression)
+            sql.append(expression_sql)
+            params.extend(expression_params)
+        half = len(sql) // 2
+        return f"({', '.join(sql[:half])}) {self.operator} ({', '.join(sql[half:])})", params
+
+
+class PurchaseOrderCursorPagination(CursorPagination):
+    """
+        Keyset pagination over the ?ordering= field and id, newest orders first by default. The cursor holds
+        the values of both columns of the last row of the page, so a page starts right after it however many
+        orders share the value of the field, and deep pages cost the same as the first one.
+    """
+    ordering = DEFAULT_ORDERING
+    page_size = getattr(settings, 'PURCHASE_ORDER_PAGE_SIZE', 50)
+    page_size_query_param = 'page_size'
+    max_page_size = getattr(settings, 'PURCHASE_ORDER_MAX_PAGE_SIZE', 500)
+
+    def get_ordering(self, request, queryset, view):
+        return parse_ordering(request.query_params)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        queryset = self.page_queryset(queryset, request, view)
+        if queryset is None:
+            return None
+        return self.set_page(list(queryset))
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        """
+            Same as paginate_queryset, fetching the page with the async ORM
+        """
+        queryset = self.page_queryset(queryset, request, view)
+        if queryset is None:
+            return None
+        return self.set_page([instance async for instance in queryset])
+
+    def paginate_querysets(self, querysets, request, view=None):
+        """
+            Paginates the union of querysets of dict rows with distinct ids, such as the hot and archived orders.
+            Each queryset is read from its own index up to the end of the page, and the rows are merged.
+        """
+        ordered = [self.page_queryset(queryset, request, view, merged=True) for queryset in querysets]
+        if None in ordered:
+            return None
+        return self.set_page(self.merge_rows([list(queryset) for queryset in ordered]))
+
+    async def apaginate_querysets(self, querysets, request, view=None):
+        ordered = [self.page_queryset(queryset, request, view, merged=True) for queryset in querysets]
+        if None in ordered:
+            return None
+        return self.set_page(self.merge_rows([[row async for row in queryset] for queryset in ordered]))
+
+    def merge_rows(self, results):
+        ordering = _reverse_ordering(self.ordering) if self.reverse else self.ordering
+        columns = [field.lstrip('-') for field in ordering]
+        rows = heapq.merge(
+            *results, key=lambda row: tuple(row[column] for column in columns), reverse=ordering[0].startswith('-'),
+        )
+        return list(rows)[self.offset:self.offset + self.page_size + 1]
+
+    def page_queryset(self, queryset, request, view=None, merged=False):
+        """
+            Returns the queryset of the requested page plus one row telling whether a next page exists.
+            This is the first half of CursorPagination.paginate_queryset, split so that the page can also be
+            fetched asynchronously. The querysets of merged pages also return the rows skipped by the offset.
+        """
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+
+        self.cursor = self.decode_cursor(request)
+        if self.cursor is None:
+            (self.offset, self.reverse, self.current_position) = (0, False, None)
+        else:
+            (self.offset, self.reverse, self.current_position) = self.cursor
+
+        if self.reverse:
+            queryset = queryset.order_by(*_reverse_ordering(self.ordering))
+        else:
+            queryset = queryset.order_by(*self.ordering)
+
+        if self.current_position is not None:
+            is_reversed = self.ordering[0].startswith('-')
+            queryset = queryset.filter(self.position_filter(queryset, '<' if self.cursor.reverse != is_reversed else '>'))
+
+        if merged:
+            return queryset[:self.offset + self.page_size + 1]
+        return queryset[self.offset:self.offset + self.page_size + 1]
+
+    def _get_position_from_instance(self, instance, ordering):
+        """
+            Returns the values of the ordering columns of a row, separated by commas
+        """
+        return ','.join(str(instance[field.lstrip('-')]) for field in ordering)
+
+    def position_filter(self, queryset, operator):
+        """
+            Returns the condition selecting the rows before (<) or after (>) the cursor position
+        """
+        columns = [field.lstrip('-') for field in self.ordering]
+        # Only the first column may contain commas, the others are ids
+        values = self.current_position.rsplit(',', len(columns) - 1)
+        if len(values) != len(columns):
+            raise NotFound(self.invalid_cursor_message)
+        try:
+            values = [
+                Value(field.to_python(value), output_field=field)
+                for field, value in zip(map(queryset.model._meta.get_field, columns), values)
+            ]
+        except ValidationError:
+            raise NotFound(self.invalid_cursor_message)
+        return RowComparison([F(column) for column in columns], operator, values)
+
+    def set_page(self, results):
+        """
+            Second half of CursorPagination.paginate_queryset, computes the next and previous positions
+            from the fetched rows and returns the page
+        """
+        self.page = list(results[:self.page_size])
+
+        if len(results) > len(self.page):
+            has_following_position = True
+            following_position = self._get_position_from_instance(results[-1], self.ordering)
+        else:
+            has_following_position = False
+            following_position = None
+
+        if self.reverse:
+            self.page = list(reversed(self.page))
+
+            self.has_next = (self.current_position is not None) or (self.offset > 0)
+            self.has_previous = has_following_position
+            if self.has_next:
+                self.next_position = self.current_position
+            if self.has_previous:
+                self.previous_position = following_position
+        else:
+            self.has_next = has_following_position
+            self.has_previous = (self.current_position is not None) or (self.offset > 0)
+            if self.has_next:
+                self.next_position = following_position
+            if self.has_previous:
+                self.previous_position = self.current_position
+
+        if (self.has_previous or self.has_next) and self.template is not None:
+            self.display_page_controls = True
+
+        return self.page
@@ -0,0 +1,62 @@
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+from .instrumentation import timed
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class InstrumentedJSONRenderer(JSONRenderer):
+    """
+        JSONRenderer recording its time in the request metrics
+    """
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        with timed('render'):
+            return super().render(data, accepted_media_type, renderer_context)
+
+
+class FastJSONRenderer(InstrumentedJSONRenderer):
+    """
+        Renders with orjson when it is installed, with the same output as JSONRenderer:
+        compact separators, decimals as floats and datetimes in DRF's format
+    """
+    orjson_options = (
+        (orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS)
+        if orjson is not None else 0
+    )
+    default = JSONEncoder().default
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        renderer_context = renderer_context or {}
+        fast = orjson is not None and self.compact and not self.ensure_ascii
+        if not fast or data is None or self.get_indent(accepted_media_type, renderer_context):
+            return super().render(data, accepted_media_type, renderer_context)
+
+        with timed('render'):
+            ret = orjson.dumps(data, default=self.default, option=self.orjson_options)
+            # Like JSONRenderer, escape the characters that are valid JSON but not valid JavaScript
+            if b'\xe2\x80\xa8' in ret or b'\xe2\x80\xa9' in ret:
+                ret = ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+            return ret
+
+
+class NDJSONRenderer(JSONRenderer):
+    """
+        Selects the ndjson export with ?format=ndjson, non streamed data (e.g. errors) is rendered as a single line
+    """
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return super().render(data, accepted_media_type, renderer_context) + b'\n'
+
+
+class CSVRenderer(JSONRenderer):
+    """
+        Selects the csv export with ?format=csv, non streamed data (e.g. errors) is rendered as json
+    """
+    media_type = 'text/csv'
+    format = 'csv'
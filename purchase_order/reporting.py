@@ -0,0 +1,213 @@
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import IntegrityError, router, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDate, TruncMonth
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from .models import ArchivedPurchaseOrder, PurchaseOrder, Supplier, SupplierDailySpend
+
+SPEND_FIELDS = ('order_count', 'total_quantity', 'total_amount', 'total_tax')
+AMOUNT_FIELDS = ('total_amount', 'total_tax')
+CENT = Decimal('0.01')
+PERIODS = {
+    'day': None,
+    'month': TruncMonth,
+}
+
+
+def spend_day(order_time):
+    """
+        Returns the day an order is reported on, in the current time zone like TruncDate
+    """
+    if timezone.is_aware(order_time):
+        order_time = timezone.localtime(order_time)
+    return order_time.date()
+
+
+class SpendDelta:
+    """
+        Accumulates the changes to the rollup caused by a write, by supplier and day,
+        and applies them to the rollup of the given database
+    """
+    def __init__(self, using=None):
+        self.using = using
+        self.changes = defaultdict(lambda: dict.fromkeys(SPEND_FIELDS, 0))
+
+    def add(self, supplier_id, order_time, total_quantity, total_amount, total_tax, order_count=1, sign=1):
+        self.add_day(supplier_id, spend_day(order_time), total_quantity, total_amount, total_tax, order_count, sign)
+
+    def add_day(self, supplier_id, day, total_quantity, total_amount, total_tax, order_count=1, sign=1):
+        change = self.changes[(supplier_id, day)]
+        change['order_count'] += sign * order_count
+        change['total_quantity'] += sign * total_quantity
+        change['total_amount'] += sign * total_amount
+        change['total_tax'] += sign * total_tax
+
+    def add_order(self, order, sign=1):
+        self.add(order.supplier_id, order.order_time, order.total_quantity, order.total_amount, order.total_tax, sign=sign)
+
+    def apply(self):
+        """
+            Adds the changes to the rollup rows, creating the missing ones. The rows are updated in a fixed
+            order with relative UPDATEs, so concurrent writes neither deadlock nor lose each other's changes.
+        """
+        using = self.using or router.db_for_write(SupplierDailySpend)
+        spend = SupplierDailySpend.objects.using(using)
+        with transaction.atomic(savepoint=False, using=using):
+            for (supplier_id, day), change in sorted(self.changes.items()):
+                if not any(change.values()):
+                    continue
+                rows = spend.filter(supplier_id=supplier_id, day=day)
+                increments = {field: F(field) + value for field, value in change.items()}
+                if rows.update(**increments):
+                    if change['order_count'] < 0:
+                        # The last order of the day was removed
+                        rows.filter(order_count=0).delete()
+                    continue
+                try:
+                    with transaction.atomic(using=using):
+                        spend.create(supplier_id=supplier_id, day=day, **change)
+                except IntegrityError:
+                    # Created by a concurrent write since the UPDATE
+                    rows.update(**increments)
+        self.changes.clear()
+
+
+def record_order_change(before, after, using=None):
+    """
+        Moves the spend of an order from its state before a write to its state after it.
+        Both states are (supplier_id, order_time, total_quantity, total_amount, total_tax) tuples.
+    """
+    if before == after:
+        return
+    delta = SpendDelta(using)
+    delta.add(*before, order_count=1, sign=-1)
+    delta.add(*after, order_count=1)
+    delta.apply()
+
+
+def spend_state(order):
+    return (order.supplier_id, order.order_time, order.total_quantity, order.total_amount, order.total_tax)
+
+
+def remove_deleted_order(sender, instance, origin=None, **kwargs):
+    """
+        Connected to the post_delete signal of PurchaseOrder. The rollup of a deleted supplier is deleted with it.
+    """
+    if isinstance(origin, Supplier):
+        return
+    delta = SpendDelta()
+    delta.add_order(instance, sign=-1)
+    delta.apply()
+
+
+def computed_spend(queryset=None):
+    """
+        Returns the rollup computed from the orders of the queryset, or from all the orders archived ones included,
+        as {(supplier_id, day): {field: value}}
+    """
+    if queryset is None:
+        spend = computed_spend(PurchaseOrder.objects.all())
+        for key, values in computed_spend(ArchivedPurchaseOrder.objects.all()).items():
+            if key in spend:
+                values = {field: spend[key][field] + value for field, value in values.items()}
+            spend[key] = values
+        return spend
+    rows = queryset.annotate(day=TruncDate('order_time')).values('supplier_id', 'day').annotate(
+        order_count=Count('id'),
+        total_quantity=Sum('total_quantity'),
+        total_amount=Sum('total_amount'),
+        total_tax=Sum('total_tax'),
+    ).order_by()
+    return {(row.pop('supplier_id'), row.pop('day')): quantize_amounts(row) for row in rows}
+
+
+def quantize_amounts(row):
+    """
+        Rounds summed amounts to cents, SQLite sums decimals as floats
+    """
+    for field in AMOUNT_FIELDS:
+        row[field] = Decimal(row[field]).quantize(CENT)
+    return row
+
+
+def rebuild_spend_rollup(dry_run=False):
+    """
+        Reconciles the rollup with the orders and returns the number of rows created, updated and deleted
+    """
+    with transaction.atomic():
+        expected = computed_spend()
+        stored = {
+            (row.supplier_id, row.day): row for row in SupplierDailySpend.objects.select_for_update()
+        }
+
+        missing = [
+            SupplierDailySpend(supplier_id=supplier_id, day=day, **values)
+            for (supplier_id, day), values in expected.items() if (supplier_id, day) not in stored
+        ]
+        stale = []
+        for key, row in stored.items():
+            values = expected.get(key)
+            if values is None:
+                continue
+            if any(getattr(row, field) != values[field] for field in SPEND_FIELDS):
+                for field in SPEND_FIELDS:
+                    setattr(row, field, values[field])
+                stale.append(row)
+        extra = [row.pk for key, row in stored.items() if key not in expected]
+
+        if not dry_run:
+            SupplierDailySpend.objects.bulk_create(missing, batch_size=1000)
+            SupplierDailySpend.objects.bulk_update(stale, SPEND_FIELDS, batch_size=1000)
+            SupplierDailySpend.objects.filter(pk__in=extra).delete()
+    return {'created': len(missing), 'updated': len(stale), 'deleted': len(extra)}
+
+
+def spend_report(period='day', start=None, end=None, supplier_ids=None):
+    """
+        Returns the spend of each supplier by day or month from the rollup, between the start and end days included
+    """
+    rows = SupplierDailySpend.objects.all()
+    if start is not None:
+        rows = rows.filter(day__gte=start)
+    if end is not None:
+        rows = rows.filter(day__lte=end)
+    if supplier_ids:
+        rows = rows.filter(supplier_id__in=supplier_ids)
+
+    truncate = PERIODS[period]
+    period_start = F('day') if truncate is None else truncate('day')
+    rows = rows.annotate(period=period_start).values('period', 'supplier_id', 'supplier__name').annotate(
+        **{field: Sum(field) for field in SPEND_FIELDS}
+    ).order_by('period', 'supplier_id')
+    return [quantize_amounts(row) for row in rows]
+
+
+def spend_report_params(params):
+    """
+        Validates the ?period=, ?start=, ?end= and ?supplier= parameters of a spend report and returns
+        the keyword arguments of spend_report, raises ValueError when one is invalid
+    """
+    period = params.get('period') or 'day'
+    if period not in PERIODS:
+        raise ValueError(f"period must be one of {', '.join(PERIODS)}.")
+
+    days = {}
+    for param in ('start', 'end'):
+        value = params.get(param)
+        try:
+            days[param] = parse_date(value) if value else None
+        except (TypeError, ValueError):
+            days[param] = None
+        if value and days[param] is None:
+            raise ValueError(f"{param} must be a date (YYYY-MM-DD).")
+
+    try:
+        supplier_ids = [int(value) for value in str(params.get('supplier') or '').split(',') if value.strip()]
+    except ValueError:
+        raise ValueError("supplier must be a comma separated list of ids.")
+
+    return dict(period=period, supplier_ids=supplier_ids, **days)
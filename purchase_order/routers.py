@@ -0,0 +1,46 @@
+import contextvars
+import itertools
+import threading
+
+from django.conf import settings
+
+# Set by ReplicaRoutingMiddleware for the requests whose reads may be served by a replica
+use_replica = contextvars.ContextVar('use_replica', default=False)
+
+
+class PrimaryReplicaRouter:
+    """
+        Sends the reads of the purchase_order models to the read replicas listed in
+        settings.PURCHASE_ORDER_READ_REPLICAS while use_replica is set, and everything else to the primary
+    """
+    primary = 'default'
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._replicas = None
+        self._cycle = None
+
+    def _next_replica(self):
+        replicas = list(getattr(settings, 'PURCHASE_ORDER_READ_REPLICAS', []))
+        if not replicas:
+            return self.primary
+        with self._lock:
+            if replicas != self._replicas:
+                self._replicas = replicas
+                self._cycle = itertools.cycle(replicas)
+            return next(self._cycle)
+
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label == 'purchase_order' and use_replica.get():
+            return self._next_replica()
+        return self.primary
+
+    def db_for_write(self, model, **hints):
+        return self.primary
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # The replicas hold the same data as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db not in getattr(settings, 'PURCHASE_ORDER_READ_REPLICAS', [])
@@ -0,0 +1,139 @@
+import gzip
+import hashlib
+import os
+import threading
+
+import yaml
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.cache import patch_vary_headers
+from django.utils.http import parse_etags, quote_etag
+from drf_spectacular.renderers import OpenApiJsonRenderer, OpenApiYamlRenderer
+from drf_spectacular.settings import spectacular_settings
+
+SCHEMA_CONTENT_TYPES = {
+    'yaml': 'application/vnd.oai.openapi; charset=utf-8',
+    'json': 'application/vnd.oai.openapi+json; charset=utf-8',
+}
+
+
+def schema_file():
+    return str(getattr(settings, 'PURCHASE_ORDER_SCHEMA_FILE', os.path.join(settings.BASE_DIR, 'schema.yml')))
+
+
+def generate_schema():
+    """
+        Introspects the views and serializers like `manage.py spectacular`, returns the schema as a dict
+    """
+    return spectacular_settings.DEFAULT_GENERATOR_CLASS().get_schema(request=None, public=True)
+
+
+def render_schema(schema, file_format):
+    renderer = OpenApiJsonRenderer() if file_format == 'json' else OpenApiYamlRenderer()
+    return renderer.render(schema, renderer_context={})
+
+
+class SchemaVariant:
+    """
+        One rendering of the schema, with its gzipped body and the ETags of both encodings, computed once
+    """
+    def __init__(self, body, content_type):
+        digest = hashlib.sha256(body).hexdigest()[:32]
+        self.content_type = content_type
+        self.body = body
+        self.etag = quote_etag(digest)
+        self.gzipped = gzip.compress(body, compresslevel=9, mtime=0)
+        self.gzipped_etag = quote_etag(f'{digest}-gzip')
+
+
+class PrecomputedSchema:
+    """
+        The OpenAPI schema rendered as yaml and json. The yaml is the checked in schema file as is, and the schema is
+        only generated from the code when the file is missing.
+    """
+    def __init__(self, path):
+        try:
+            with open(path, 'rb') as file:
+                yaml_body = file.read()
+            self.schema = yaml.safe_load(yaml_body)
+        except FileNotFoundError:
+            self.schema = generate_schema()
+            yaml_body = render_schema(self.schema, 'yaml')
+        self.variants = {
+            'yaml': SchemaVariant(yaml_body, SCHEMA_CONTENT_TYPES['yaml']),
+            'json': SchemaVariant(render_schema(self.schema, 'json'), SCHEMA_CONTENT_TYPES['json']),
+        }
+
+    def drift(self):
+        """
+            Returns the paths and components whose definition differs between the served schema and the code
+        """
+        # Round tripped through yaml like the checked in file
+        generated = yaml.safe_load(render_schema(generate_schema(), 'yaml'))
+        served = self.schema
+        sections = {'paths': (served.get('paths') or {}, generated.get('paths') or {})}
+        served_components, generated_components = served.get('components') or {}, generated.get('components') or {}
+        for kind in set(served_components) | set(generated_components):
+            sections[f'components.{kind}'] = (served_components.get(kind) or {}, generated_components.get(kind) or {})
+
+        drifted = [
+            key for key in sorted(set(served) | set(generated))
+            if key not in ('paths', 'components') and served.get(key) != generated.get(key)
+        ]
+        for section, (served_items, generated_items) in sorted(sections.items()):
+            for name in sorted(set(served_items) | set(generated_items)):
+                if served_items.get(name) != generated_items.get(name):
+                    drifted.append(f"{section}: {name}")
+        return drifted
+
+
+_schema = None
+_schema_lock = threading.Lock()
+
+
+def get_schema():
+    global _schema
+    if _schema is None:
+        with _schema_lock:
+            if _schema is None:
+                _schema = PrecomputedSchema(schema_file())
+    return _schema
+
+
+@receiver(setting_changed)
+def reset_schema(*, setting, **kwargs):
+    global _schema
+    if setting == 'PURCHASE_ORDER_SCHEMA_FILE':
+        with _schema_lock:
+            _schema = None
+
+
+def requested_format(request):
+    file_format = request.GET.get('format')
+    if file_format in SCHEMA_CONTENT_TYPES:
+        return file_format
+    return 'json' if 'json' in request.headers.get('Accept', '') else 'yaml'
+
+
+def schema_view(request):
+    """
+        Serves the precomputed OpenAPI schema as yaml, or as json with ?format=json or a json Accept header.
+        The responses are built from bytes kept in memory, gzipped when the client accepts it.
+    """
+    variant = get_schema().variants[requested_format(request)]
+    if 'gzip' in request.headers.get('Accept-Encoding', ''):
+        body, etag, headers = variant.gzipped, variant.gzipped_etag, {'Content-Encoding': 'gzip'}
+    else:
+        body, etag, headers = variant.body, variant.etag, {}
+
+    etags = parse_etags(request.headers.get('If-None-Match', ''))
+    if etag in etags or '*' in etags:
+        response = HttpResponseNotModified()
+    else:
+        response = HttpResponse(body, content_type=variant.content_type, headers=headers)
+    response['ETag'] = etag
+    response['Cache-Control'] = 'public, max-age=0, must-revalidate'
+    patch_vary_headers(response, ('Accept', 'Accept-Encoding'))
+    return response
@@ -0,0 +1,61 @@
+from django.db import connections
+from django.db.models import Case, Exists, FloatField, Max, OuterRef, Q, Subquery, Value, When
+from django.db.models.functions import Coalesce, Greatest
+
+from .models import LineItem
+
+
+def item_name_matches(term, line_item_model=LineItem):
+    """
+        Matches orders with a line item whose name contains the term. Using EXISTS instead
+        of joining the line items returns each order once, however many of its items match.
+    """
+    return Exists(line_item_model.objects.filter(purchase_order=OuterRef('pk'), item_name__icontains=term))
+
+
+def _substring_relevance(field, term):
+    """
+        Portable relevance: exact match ranks above a prefix match, which ranks above any other substring match
+    """
+    return Case(
+        When(**{f'{field}__iexact': term}, then=Value(1.0)),
+        When(**{f'{field}__istartswith': term}, then=Value(0.5)),
+        When(**{f'{field}__icontains': term}, then=Value(0.25)),
+        default=Value(0.0),
+        output_field=FloatField(),
+    )
+
+
+def _relevance(vendor, field, term):
+    if vendor == 'postgresql':
+        from django.contrib.postgres.search import TrigramSimilarity
+        return TrigramSimilarity(field, term)
+    return _substring_relevance(field, term)
+
+
+def search_purchase_orders(queryset, term):
+    """
+        Returns the orders whose supplier name or line item names contain the term, most relevant first.
+        Postgres ranks by pg_trgm similarity and is served by the trigram indexes, other databases
+        fall back to a substring ranking so the search keeps working locally.
+    """
+    vendor = connections[queryset.db].vendor
+
+    item_relevance = LineItem.objects.filter(
+        purchase_order=OuterRef('pk'), item_name__icontains=term,
+    ).order_by().values('purchase_order').annotate(
+        relevance=Max(_relevance(vendor, 'item_name', term))
+    ).values('relevance')
+
+    return queryset.filter(
+        Q(supplier__name__icontains=term) | Q(item_name_matches(term))
+    ).annotate(
+        relevance=Greatest(
+            Case(
+                When(supplier__name__icontains=term, then=_relevance(vendor, 'supplier__name', term)),
+                default=Value(0.0),
+                output_field=FloatField(),
+            ),
+            Coalesce(Subquery(item_relevance, output_field=FloatField()), Value(0.0)),
+        )
+    ).order_by('-relevance', '-order_time', '-id')
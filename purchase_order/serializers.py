@@ -1,5 +1,12 @@
+from django.db import connections, transaction
+from django.urls import reverse
 from rest_framework import serializers
-from .models import Supplier, LineItem, PurchaseOrder
+from .models import Supplier, LineItem, PurchaseOrder, Job, OrderChange, VERSION_FIELDS
+from .archive import delete_rows
+from .cache import get_response_cache
+from .instrumentation import timed
+from .suppliers import touch_supplier_orders
+from .reporting import SpendDelta, computed_spend
 
 class SupplierSerializer(serializers.ModelSerializer):
     id = serializers.IntegerField(required=False, allow_null=True)
@@ -17,6 +24,8 @@ class LineItemSerializer(serializers.ModelSerializer):
         model = LineItem
         fields = '__all__'
         read_only_fields = ('line_total', 'purchase_order', 'id',)
+        # The range of PositiveIntegerField on PostgreSQL, so that validation and the schema do not depend on the database
+        extra_kwargs = {'quantity': {'max_value': 2147483647}}
 
     def get_line_total(self, obj: LineItem) -> float:
         return obj.line_total
@@ -32,10 +41,14 @@ class PurchaseOrderSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = PurchaseOrder
-        fields = '__all__'
+        exclude = ('version', 'updated_at',)
         read_only_fields = ('order_number', 'order_time', 'total_amount', 'total_quantity', 'total_tax', 'id',)
 
 
+    def to_representation(self, instance):
+        with timed('serialize'):
+            return super().to_representation(instance)
+
     def get_total_amount(self, obj: PurchaseOrder)-> float:
         return obj.total_amount
 
@@ -61,67 +74,253 @@ class PurchaseOrderSerializer(serializers.ModelSerializer):
             This method creates the Purchase order along with its line_itens
         """
         line_items_data = validated_data.pop('line_items', [])
+        line_items = [LineItem(**line_item_data) for line_item_data in line_items_data]
 
-        purchase_order = PurchaseOrder.objects.create(**validated_data)
+        with transaction.atomic():
+            # The totals are known before the insert, so the order is written (and added to the spend rollup) once
+            purchase_order = PurchaseOrder.objects.create(
+                **validated_data,
+                total_quantity=sum(line_item.quantity for line_item in line_items),
+                total_amount=sum(line_item.line_total for line_item in line_items),
+                total_tax=sum(line_item.tax_amount for line_item in line_items),
+            )
 
-        for line_item_data in line_items_data:
-            line_item_data['purchase_order'] = purchase_order
-            LineItem.objects.create(**line_item_data)
+            for line_item in line_items:
+                line_item.purchase_order = purchase_order
+            LineItem.objects.bulk_create(line_items)
 
         return purchase_order
 
     def update(self, instance, validated_data) -> PurchaseOrder:
         """
-            This method updates the specific PurchaseOrder
+            This method updates the specific PurchaseOrder.
+            The submitted line items are diffed against the stored ones and the changes are applied with
+            one bulk statement per kind, rows that did not change are not written. The counts of touched
+            rows are kept in self.changes.
         """
-        supplier_data = validated_data.get('supplier', {})
-        supplier_instance, created = Supplier.objects.get_or_create(pk=supplier_data.get('id'), defaults=supplier_data)
+        with transaction.atomic():
+            order_fields = []
+            changed_supplier_fields = []
 
-        if not created:
-            supplier_instance.name = supplier_data.get('name', supplier_instance.name)
-            supplier_instance.email = supplier_data.get('email', supplier_instance.email)
+            supplier_data = validated_data.get('supplier', {})
+            supplier_id = supplier_data.get('id')
+            if supplier_id is not None and supplier_id == instance.supplier_id:
+                supplier_instance, created = instance.supplier, False
+            else:
+                supplier_instance, created = Supplier.objects.get_or_create(pk=supplier_id, defaults=supplier_data)
 
-        instance.supplier = supplier_instance
+            if not created:
+                changed_supplier_fields = [
+                    field for field in ('name', 'email')
+                    if field in supplier_data and getattr(supplier_instance, field) != supplier_data[field]
+                ]
+                for field in changed_supplier_fields:
+                    setattr(supplier_instance, field, supplier_data[field])
+                if changed_supplier_fields:
+                    supplier_instance.save(update_fields=changed_supplier_fields)
 
-        line_items_data = validated_data.get('line_items', [])
-        existing_line_item_ids = [item.id for item in instance.line_items.all()]
+            if instance.supplier_id != supplier_instance.id:
+                order_fields.append('supplier')
+            instance.supplier = supplier_instance
 
-        for line_item_data in line_items_data:
-            line_item_id = line_item_data.get('id', None)
+            existing_line_items = {item.id: item for item in instance.line_items.all()}
+            submitted_line_item_ids = set()
+            new_line_items = []
+            changed_line_items = []
+            changed_line_item_fields = set()
 
-            if line_item_id is not None:
-                LineItem.objects.filter(id=line_item_id, purchase_order=instance).update(**line_item_data)
-            else:
-                new_line_item_instance = LineItem.objects.create(purchase_order=instance, **line_item_data)
-                line_item_data['id'] = new_line_item_instance.id
+            for line_item_data in validated_data.get('line_items', []):
+                line_item_data = dict(line_item_data)
+                line_item_id = line_item_data.pop('id', None)
+
+                if line_item_id is None:
+                    new_line_items.append(LineItem(purchase_order=instance, **line_item_data))
+                    continue
+
+                submitted_line_item_ids.add(line_item_id)
+                line_item = existing_line_items.get(line_item_id)
+                if line_item is None:
+                    continue
+
+                changed_fields = [field for field, value in line_item_data.items() if getattr(line_item, field) != value]
+                for field in changed_fields:
+                    setattr(line_item, field, line_item_data[field])
+                if changed_fields:
+                    changed_line_items.append(line_item)
+                    changed_line_item_fields.update(changed_fields)
+
+            deleted_line_item_ids = [line_item_id for line_item_id in existing_line_items if line_item_id not in submitted_line_item_ids]
+
+            LineItem.objects.bulk_create(new_line_items)
+            if changed_line_items:
+                LineItem.objects.bulk_update(changed_line_items, sorted(changed_line_item_fields))
+            if deleted_line_item_ids:
+                LineItem.objects.filter(id__in=deleted_line_item_ids).delete()
+
+            final_line_items = [
+                line_item for line_item_id, line_item in existing_line_items.items() if line_item_id in submitted_line_item_ids
+            ] + new_line_items
+            totals = {
+                'total_quantity': sum(line_item.quantity for line_item in final_line_items),
+                'total_amount': sum(line_item.line_total for line_item in final_line_items),
+                'total_tax': sum(line_item.tax_amount for line_item in final_line_items),
+            }
+            for field, value in totals.items():
+                if getattr(instance, field) != value:
+                    setattr(instance, field, value)
+                    order_fields.append(field)
 
-        LineItem.objects.filter(id__in=existing_line_item_ids).exclude(id__in=[item['id'] for item in line_items_data]).delete()
+            if order_fields:
+                # Bumps the version, moves the spend of the order and logs the change
+                instance.save(update_fields=order_fields)
 
-        instance.save()
-        instance.supplier.save()
+            changed = bool(new_line_items or changed_line_items or deleted_line_item_ids or order_fields or changed_supplier_fields)
+            if changed_supplier_fields:
+                touch_supplier_orders(supplier_instance.id)
+            elif changed and not order_fields:
+                PurchaseOrder.objects.filter(pk=instance.pk).touch()
+            if changed:
+                instance.refresh_from_db(fields=VERSION_FIELDS)
+                get_response_cache().invalidate(instance.pk)
+
+        self.changes = {
+            'line_items_created': len(new_line_items),
+            'line_items_updated': len(changed_line_items),
+            'line_items_deleted': len(deleted_line_item_ids),
+            'line_items_unchanged': len(final_line_items) - len(new_line_items) - len(changed_line_items),
+            'supplier_created': created,
+            'supplier_updated': bool(changed_supplier_fields),
+            'order_updated': bool(order_fields),
+        }
         return instance
 
-    def delete(self, instance) -> None:
-        """
-            This method deletes the PurchaseOrder and the associated line_items
-        """
-        LineItem.objects.filter(purchase_order=instance).delete()
-        instance.delete()
 
-        return
+def bulk_create_purchase_orders(validated_orders):
+    """
+        Creates many validated PurchaseOrders in one transaction with a fixed number of queries.
+        validated_orders is a list of (index, validated_data) pairs, suppliers given by id must exist
+        and the others are matched by email or created. Returns the created orders by index and the
+        errors of the orders that could not be created.
+    """
+    errors = {}
 
-    def destroy(self, validated_data) -> None:
-        """
-            This method is a wrapper around the delete method and validates if the deletion is possible
-        """
-        instance_id = validated_data.get('id')
-        if instance_id is not None:
-            try:
-                instance = PurchaseOrder.objects.get(id=instance_id)
-                self.delete(instance)
-            except PurchaseOrder.DoesNotExist:
-                raise serializers.ValidationError("Purchase Order with given ID does not exist")
-        else:
-            raise serializers.ValidationError("ID is required for deleting a Purchase Order")
-        
-        return
\ No newline at end of file
+    supplier_ids = {data['supplier']['id'] for _, data in validated_orders if data['supplier'].get('id') is not None}
+    suppliers_by_id = Supplier.objects.in_bulk(supplier_ids)
+
+    with transaction.atomic():
+        emails = {data['supplier']['email'] for _, data in validated_orders if data['supplier'].get('id') is None}
+        suppliers_by_email = {supplier.email: supplier for supplier in Supplier.objects.filter(email__in=emails)}
+        new_suppliers = {}
+        for _, data in validated_orders:
+            supplier_data = data['supplier']
+            if supplier_data.get('id') is None and supplier_data['email'] not in suppliers_by_email:
+                new_suppliers.setdefault(supplier_data['email'], Supplier(name=supplier_data['name'], email=supplier_data['email']))
+        if new_suppliers:
+            # A concurrent request may insert the same emails first, its suppliers are kept and read back
+            Supplier.objects.bulk_create(new_suppliers.values(), ignore_conflicts=True)
+            suppliers_by_email.update(
+                (supplier.email, supplier) for supplier in Supplier.objects.filter(email__in=new_suppliers)
+            )
+
+        orders = {}
+        line_items = []
+        for index, data in validated_orders:
+            supplier_data = data['supplier']
+            if supplier_data.get('id') is not None:
+                supplier = suppliers_by_id.get(supplier_data['id'])
+                if supplier is None:
+                    errors[index] = {"error": "Supplier with provided id does not exist."}
+                    continue
+            else:
+                supplier = suppliers_by_email[supplier_data['email']]
+
+            order_line_items = [
+                LineItem(**{field: value for field, value in line_item_data.items() if field != 'id'})
+                for line_item_data in data['line_items']
+            ]
+            orders[index] = PurchaseOrder(
+                supplier=supplier,
+                total_quantity=sum(line_item.quantity for line_item in order_line_items),
+                total_amount=sum(line_item.line_total for line_item in order_line_items),
+                total_tax=sum(line_item.tax_amount for line_item in order_line_items),
+            )
+            line_items.append((orders[index], order_line_items))
+
+        if not orders:
+            return orders, errors
+
+        for purchase_order, order_number in zip(orders.values(), PurchaseOrder.reserve_order_numbers(len(orders))):
+            purchase_order.order_number = order_number
+        PurchaseOrder.objects.bulk_create(orders.values())
+
+        spend = SpendDelta()
+        for purchase_order in orders.values():
+            spend.add_order(purchase_order)
+        spend.apply()
+        OrderChange.objects.record(OrderChange.CREATED, [(purchase_order.pk, purchase_order.version) for purchase_order in orders.values()])
+
+        for purchase_order, order_line_items in line_items:
+            for line_item in order_line_items:
+                line_item.purchase_order = purchase_order
+        LineItem.objects.bulk_create(line_item for _, order_line_items in line_items for line_item in order_line_items)
+
+    return orders, errors
+
+
+DELETE_CHUNK_SIZE = 1000
+
+
+def bulk_delete_purchase_orders(queryset, max_count):
+    """
+        Deletes the PurchaseOrders of the queryset and their line items in one transaction, with a fixed
+        number of set-based statements per chunk of DELETE_CHUNK_SIZE orders: the rows are locked, their spend
+        is removed from the rollup with one aggregate query, then the line items and orders are deleted and the
+        deletions are logged for the change feed.
+        Returns the number of orders and line items deleted, raises ValueError when more than max_count match.
+    """
+    queryset = queryset.select_for_update(of=('self',))
+    using = queryset.db
+    with transaction.atomic(using=using):
+        order_ids = list(queryset.order_by('id').values_list('id', flat=True)[:max_count + 1])
+        if len(order_ids) > max_count:
+            raise ValueError(f"More than {max_count} purchase orders match, at most {max_count} can be deleted at once.")
+
+        orders_deleted = line_items_deleted = 0
+        for start in range(0, len(order_ids), DELETE_CHUNK_SIZE):
+            chunk = order_ids[start:start + DELETE_CHUNK_SIZE]
+
+            spend = SpendDelta(using)
+            for (supplier_id, day), totals in computed_spend(PurchaseOrder.objects.using(using).filter(id__in=chunk)).items():
+                spend.add_day(
+                    supplier_id, day, totals['total_quantity'], totals['total_amount'], totals['total_tax'],
+                    order_count=totals['order_count'], sign=-1,
+                )
+            spend.apply()
+
+            line_items_deleted += LineItem.objects.using(using).filter(purchase_order_id__in=chunk).delete()[0]
+            # The post_delete receivers would load every order to update the rollup and log the change one by one
+            with connections[using].cursor() as cursor:
+                orders_deleted += delete_rows(cursor, connections[using], PurchaseOrder, chunk)
+            OrderChange.objects.using(using).record(OrderChange.DELETED, [(order_id, None) for order_id in chunk])
+
+        get_response_cache().invalidate(*order_ids)
+    return orders_deleted, line_items_deleted
+
+
+class JobSerializer(serializers.ModelSerializer):
+    result_url = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Job
+        fields = (
+            'id', 'job_type', 'params', 'status', 'progress', 'total', 'error',
+            'result_url', 'result_size', 'created_at', 'started_at', 'finished_at',
+        )
+        read_only_fields = fields
+
+    def get_result_url(self, obj: Job) -> str:
+        if obj.status != Job.SUCCEEDED:
+            return None
+        url = reverse('job-result', args=[obj.id])
+        request = self.context.get('request')
+        return request.build_absolute_uri(url) if request is not None else url
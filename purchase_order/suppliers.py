@@ -0,0 +1,29 @@
+from django.db import router
+from django.db.models import F
+from django.utils import timezone
+
+from .cache import get_response_cache
+from .models import ArchivedPurchaseOrder, PurchaseOrder, Supplier
+
+
+def touch_supplier_orders(*supplier_ids, using=None):
+    """
+        Bumps the version of every order of the suppliers, archived ones included, which are part of their representation
+    """
+    using = using or router.db_for_write(PurchaseOrder)
+    touched_orders = PurchaseOrder.objects.using(using).filter(supplier_id__in=supplier_ids)
+    touched_orders.touch()
+    get_response_cache().invalidate(*touched_orders.values_list('id', flat=True))
+    # The cached responses of archived orders are keyed by their version, which no longer matches
+    ArchivedPurchaseOrder.objects.using(using).filter(supplier_id__in=supplier_ids).update(
+        version=F('version') + 1, updated_at=timezone.now(),
+    )
+
+
+def resolve_supplier(name, email):
+    """
+        Returns the supplier with the given email, creating it with the given name when it does not exist.
+        An existing supplier keeps its name, suppliers are renamed through the update endpoint.
+    """
+    supplier, _ = Supplier.objects.get_or_create(email=email, defaults={'name': name})
+    return supplier
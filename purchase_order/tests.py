@@ -1,9 +1,47 @@
+import gzip
 import json
-from django.test import TestCase
+import os
+import tempfile
+import time
+import yaml
+from asgiref.sync import sync_to_async
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
+from django.contrib.contenttypes.models import ContentType
+from django.core.management import call_command
+from django.core.management.base import SystemCheckError
+from django.db import IntegrityError, connection, transaction
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from rest_framework import status
+from rest_framework.renderers import JSONRenderer
 from rest_framework.test import APIClient
-from purchase_order.models import PurchaseOrder, Supplier, LineItem
+from django.test import AsyncClient
+from purchase_order.models import (
+    PurchaseOrder, Supplier, LineItem, OrderNumberCounter, IdempotencyKey, SupplierDailySpend, Job, OrderChange,
+    ArchivedPurchaseOrder, ArchivedLineItem,
+)
+from purchase_order.filters import filter_purchase_orders
+from purchase_order.pagination import ORDERING_FIELDS, PurchaseOrderCursorPagination, parse_ordering
+from purchase_order.routers import PrimaryReplicaRouter, use_replica
+from purchase_order.middleware import ReplicaRoutingMiddleware, PRIMARY_PIN_COOKIE
+from purchase_order.cache import get_response_cache
+from purchase_order.async_views import change_streams
+from purchase_order.changes import purge_order_changes, sequence_gaps
+from purchase_order.imports import OrderLoader
+from purchase_order.instrumentation import registry
+from purchase_order.jobs import JOB_TYPES, JobLost, JobProgress, claim_job, purge_finished_jobs, requeue_stale_jobs, run_job
+from purchase_order.renderers import FastJSONRenderer
+from purchase_order.schema import get_schema, schema_file
+from purchase_order.reporting import rebuild_spend_rollup
+from purchase_order.serializers import PurchaseOrderSerializer
+from purchase_order.suppliers import touch_supplier_orders
 from django.urls import reverse
+from django.utils import timezone
+from django.utils.http import quote_etag
 from urllib.parse import urlencode
 
 
@@ -97,7 +135,7 @@ class PurchaseOrderAPITestCase(TestCase):
 
         response = self.client.get(reverse('purchase-order-list-create'))
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(response.data), 1)
+        self.assertEqual(len(response.data['results']), 1)
 
     def test_get_all_purchase_orders_with_supplier_filter(self):
         """
@@ -108,7 +146,7 @@ class PurchaseOrderAPITestCase(TestCase):
         query_params = {'supplier_name': 'Supplier 1'}
         response = self.client.get(reverse('purchase-order-list-create')+ '?' + urlencode(query_params))
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(response.data), 1)
+        self.assertEqual(len(response.data['results']), 1)
 
     def test_get_all_purchase_orders_with_supplier_filter_with_wrong_input(self):
         """
@@ -119,7 +157,7 @@ class PurchaseOrderAPITestCase(TestCase):
         query_params = {'supplier_name': 'Supplier 999'}
         response = self.client.get(reverse('purchase-order-list-create')+ '?' + urlencode(query_params))
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(response.data), 0)
+        self.assertEqual(len(response.data['results']), 0)
 
     def test_get_all_purchase_orders_with_item_name_filter(self):
         """
@@ -130,7 +168,7 @@ class PurchaseOrderAPITestCase(TestCase):
         query_params = {'item_name': 'Test Product'}
         response = self.client.get(reverse('purchase-order-list-create')+ '?' + urlencode(query_params))
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(response.data), 1) 
+        self.assertEqual(len(response.data['results']), 1) 
 
     def test_get_all_purchase_orders_with_item_name_filter_with_wrong_input(self):
         """
@@ -141,7 +179,7 @@ class PurchaseOrderAPITestCase(TestCase):
         query_params = {'item_name': 'No Product '}
         response = self.client.get(reverse('purchase-order-list-create')+ '?' + urlencode(query_params))
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(response.data), 0) 
+        self.assertEqual(len(response.data['results']), 0) 
 
     def test_get_single_purchase_order(self):
         """
@@ -203,7 +241,7 @@ class PurchaseOrderAPITestCase(TestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(response.data['supplier']['name'],"Updated Supplier")
         self.assertEqual(len(response.data['line_items']),2)
-        self.assertNotEqual(old_response.data[0]['total_amount'], response.data['total_amount'])
+        self.assertNotEqual(old_response.data['results'][0]['total_amount'], response.data['total_amount'])
 
 
     def test_delete_purchase_order(self):
@@ -225,4 +263,2293 @@ class PurchaseOrderAPITestCase(TestCase):
 
         purchase_order_id = 999999
         response = self.client.delete(reverse('purchase-order-details', args=[purchase_order_id]))
-        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
\ No newline at end of file
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class PurchaseOrderTotalsTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        supplier = Supplier.objects.create(name="Supplier 1", email="supplier@email.com")
+        self.purchase_order = PurchaseOrder.objects.create(supplier=supplier)
+
+    def create_line_item(self, **kwargs):
+        data = {
+            "item_name": "Test Product",
+            "quantity": 2,
+            "price_without_tax": Decimal("10.00"),
+            "tax_name": "GST 5%",
+            "tax_amount": Decimal("0.50"),
+            "purchase_order": self.purchase_order,
+        }
+        data.update(kwargs)
+        return LineItem.objects.create(**data)
+
+    def test_totals_wider_than_a_line_item(self):
+        """
+            This test checks that the stored totals hold sums beyond the range of a single line item
+        """
+        line_item = {"item_name": "Bulk", "quantity": 2147483647, "price_without_tax": "990.00", "tax_name": "GST 1%", "tax_amount": "10.00"}
+        response = self.client.post(reverse('purchase-order-list-create'), data=json.dumps({
+            "supplier": {"name": "Supplier 1", "email": "supplier@email.com"}, "line_items": [line_item, line_item],
+        }), content_type='application/json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        purchase_order = PurchaseOrder.objects.get(pk=response.json()['id'])
+        self.assertEqual(purchase_order.total_quantity, 4294967294)
+        self.assertEqual(purchase_order.total_amount, Decimal("4294967294000.00"))
+        purchase_order.update_totals()
+        self.assertEqual(purchase_order.total_quantity, 4294967294)
+        self.assertEqual(purchase_order.total_amount, Decimal("4294967294000.00"))
+
+    def test_totals_follow_line_item_save_and_delete(self):
+        """
+            This test checks that saving and deleting a LineItem keeps the stored totals in sync
+        """
+        line_item = self.create_line_item()
+        self.create_line_item(quantity=1, price_without_tax=Decimal("4.00"), tax_amount=Decimal("1.00"))
+
+        self.purchase_order.refresh_from_db()
+        self.assertEqual(self.purchase_order.total_quantity, 3)
+        self.assertEqual(self.purchase_order.total_amount, Decimal("26.00"))
+        self.assertEqual(self.purchase_order.total_tax, Decimal("1.50"))
+
+        line_item.delete()
+        self.purchase_order.refresh_from_db()
+        self.assertEqual(self.purchase_order.total_quantity, 1)
+        self.assertEqual(self.purchase_order.total_amount, Decimal("5.00"))
+
+    def test_totals_stored_on_create_and_update(self):
+        """
+            This test checks that the totals are stored when orders are created and updated through the API
+        """
+        data = {
+            "supplier": {"id": None, "name": "New Supplier", "email": "new_supplier@email.com"},
+            "line_items": [
+                {"item_name": "A", "quantity": 2, "price_without_tax": "15.00", "tax_name": "GST 5%", "tax_amount": "0.75"},
+                {"item_name": "B", "quantity": 1, "price_without_tax": "5.00", "tax_name": "GST 5%", "tax_amount": "0.25"},
+            ]
+        }
+        response = self.client.post(reverse('purchase-order-list-create'), data=json.dumps(data), content_type='application/json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        purchase_order = PurchaseOrder.objects.get(pk=response.data['id'])
+        self.assertEqual(purchase_order.total_quantity, 3)
+        self.assertEqual(purchase_order.total_amount, Decimal("36.75"))
+        self.assertEqual(purchase_order.total_tax, Decimal("1.00"))
+
+        data['supplier']['id'] = purchase_order.supplier_id
+        data['line_items'] = [dict(data['line_items'][0], id=purchase_order.line_items.get(item_name="A").id, quantity=4)]
+        response = self.client.put(reverse('purchase-order-details', args=[purchase_order.id]), data=json.dumps(data), content_type='application/json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        purchase_order.refresh_from_db()
+        self.assertEqual(purchase_order.total_quantity, 4)
+        self.assertEqual(purchase_order.total_amount, Decimal("63.00"))
+        self.assertEqual(response.data['total_amount'], Decimal("63.00"))
+
+    def test_repair_order_totals_command(self):
+        """
+            This test checks that the repair command fixes drifted totals
+        """
+        self.create_line_item()
+        PurchaseOrder.objects.update(total_quantity=0, total_amount=0, total_tax=0)
+
+        out = StringIO()
+        call_command('repair_order_totals', '--dry-run', stdout=out)
+        self.assertIn("1 would be repaired", out.getvalue())
+        self.assertEqual(PurchaseOrder.objects.get().total_quantity, 0)
+
+        version = PurchaseOrder.objects.get().version
+        url = reverse('purchase-order-details', args=[PurchaseOrder.objects.get().id])
+        stale = self.client.get(url)
+        call_command('repair_order_totals', stdout=StringIO())
+        purchase_order = PurchaseOrder.objects.get()
+        self.assertEqual(purchase_order.total_quantity, 2)
+        self.assertEqual(purchase_order.total_amount, Decimal("21.00"))
+        self.assertEqual(purchase_order.total_tax, Decimal("0.50"))
+        # The repair is a change: the ETag moves on and the change feed reports it
+        self.assertEqual(purchase_order.version, version + 1)
+        self.assertEqual(
+            OrderChange.objects.order_by('-sequence').values_list('purchase_order_id', 'action', 'version').first(),
+            (purchase_order.id, OrderChange.UPDATED, version + 1),
+        )
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=stale['ETag'])
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['total_quantity'], 2)
+
+
+class PurchaseOrderQueryCountTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+
+    def create_orders(self, count):
+        """
+            This method creates orders for distinct suppliers, each with two line items
+        """
+        for index in range(count):
+            supplier = Supplier.objects.create(name=f"Supplier {index}", email=f"supplier{index}@email.com")
+            purchase_order = PurchaseOrder.objects.create(supplier=supplier)
+            LineItem.objects.bulk_create(
+                LineItem(
+                    item_name=f"Product {index}-{line}",
+                    quantity=1,
+                    price_without_tax=Decimal("10.00"),
+                    tax_name="GST 5%",
+                    tax_amount=Decimal("0.50"),
+                    purchase_order=purchase_order,
+                )
+                for line in range(2)
+            )
+
+    def test_list_query_count_does_not_grow_with_orders(self):
+        """
+            This test checks that listing orders uses a fixed number of queries
+        """
+        self.create_orders(10)
+
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('purchase-order-list-create'))
+        self.assertEqual(len(response.data['results']), 10)
+        self.assertEqual(len(response.data['results'][0]['line_items']), 2)
+
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('purchase-order-list-create') + '?' + urlencode({'supplier_name': 'Supplier'}))
+        self.assertEqual(len(response.data['results']), 10)
+
+    def test_detail_query_count(self):
+        """
+            This test checks that retrieving an order joins its supplier and prefetches its line items
+        """
+        self.create_orders(1)
+        purchase_order_id = PurchaseOrder.objects.get().id
+
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse('purchase-order-details', args=[purchase_order_id]))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['supplier']['name'], "Supplier 0")
+
+
+class PurchaseOrderPaginationTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        for index in range(5):
+            supplier = Supplier.objects.create(name=f"Supplier {index % 2}", email=f"supplier{index}@email.com")
+            purchase_order = PurchaseOrder.objects.create(supplier=supplier)
+            for item_name in ("Widget", "Widget Pro"):
+                LineItem.objects.create(
+                    item_name=item_name,
+                    quantity=1,
+                    price_without_tax=Decimal("10.00"),
+                    tax_name="GST 5%",
+                    tax_amount=Decimal("0.50"),
+                    purchase_order=purchase_order,
+                )
+
+    def collect_pages(self, query_params):
+        """
+            This method follows the next cursors and returns the ids of every page
+        """
+        url = reverse('purchase-order-list-create') + '?' + urlencode(query_params)
+        pages = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            pages.append([order['id'] for order in response.data['results']])
+            url = response.data['next']
+        return pages
+
+    def test_cursor_pages_cover_every_order_once(self):
+        """
+            This test checks that following the cursors returns all orders, newest first, without repeats
+        """
+        pages = self.collect_pages({'page_size': 2})
+        self.assertEqual([len(page) for page in pages], [2, 2, 1])
+        ids = [order_id for page in pages for order_id in page]
+        self.assertEqual(ids, list(PurchaseOrder.objects.order_by('-order_time', '-id').values_list('id', flat=True)))
+
+    def test_filters_apply_across_pages(self):
+        """
+            This test checks that the supplier_name and item_name filters are kept by the cursors
+        """
+        pages = self.collect_pages({'page_size': 1, 'supplier_name': 'Supplier 1'})
+        self.assertEqual(len(pages), 2)
+
+        pages = self.collect_pages({'page_size': 2, 'item_name': 'Widget'})
+        ids = [order_id for page in pages for order_id in page]
+        self.assertEqual(len(ids), 5)
+        self.assertEqual(len(set(ids)), 5)
+
+    def test_ordering_across_pages(self):
+        """
+            This test checks that ?ordering= sorts every page, ties being broken by id, and keeps the cursors consistent
+        """
+        for purchase_order, amount in zip(PurchaseOrder.objects.order_by('id'), ('30.00', '10.00', '30.00', '20.00', '10.00')):
+            PurchaseOrder.objects.filter(id=purchase_order.id).update(total_amount=Decimal(amount))
+
+        pages = self.collect_pages({'page_size': 2, 'ordering': '-total_amount', 'fields': 'id'})
+        ids = [order_id for page in pages for order_id in page]
+        self.assertEqual(ids, list(PurchaseOrder.objects.order_by('-total_amount', '-id').values_list('id', flat=True)))
+
+        pages = self.collect_pages({'page_size': 2, 'ordering': 'order_number'})
+        ids = [order_id for page in pages for order_id in page]
+        self.assertEqual(ids, list(PurchaseOrder.objects.order_by('order_number').values_list('id', flat=True)))
+
+    def test_cursors_over_many_tied_values(self):
+        """
+            This test checks that pages of orders sharing the same total start after the (total, id) of the cursor,
+            without an OFFSET, forward and backward and with the archived orders merged in
+        """
+        supplier = Supplier.objects.first()
+        PurchaseOrder.objects.bulk_create([
+            PurchaseOrder(supplier=supplier, order_number=1000 + index, total_amount=Decimal('21.00'))
+            for index in range(60)
+        ])
+        expected = list(PurchaseOrder.objects.order_by('total_amount', 'id').values_list('id', flat=True))
+
+        with CaptureQueriesContext(connection) as queries:
+            pages = self.collect_pages({'page_size': 7, 'ordering': 'total_amount', 'fields': 'id'})
+        self.assertEqual([order_id for page in pages for order_id in page], expected)
+        self.assertFalse([query['sql'] for query in queries if 'OFFSET' in query['sql']])
+
+        url = reverse('purchase-order-list-create') + '?' + urlencode({'page_size': 7, 'ordering': 'total_amount', 'fields': 'id'})
+        for _ in range(4):
+            url = self.client.get(url).data['next']
+        backward = []
+        while url:
+            response = self.client.get(url)
+            backward = [order['id'] for order in response.data['results']] + backward
+            url = response.data['previous']
+        self.assertEqual(backward, expected[:len(backward)])
+        self.assertEqual(len(backward), 35)
+
+        # Every order totals 21.00, the archived orders are merged with the newer hot ones in id order
+        call_command('archive_orders', '--days', 0, stdout=StringIO())
+        PurchaseOrder.objects.bulk_create([
+            PurchaseOrder(supplier=supplier, order_number=2000 + index, total_amount=Decimal('21.00'))
+            for index in range(30)
+        ])
+        expected = sorted(expected + list(PurchaseOrder.objects.values_list('id', flat=True)), reverse=True)
+        pages = self.collect_pages({'page_size': 7, 'ordering': '-total_amount', 'fields': 'id', 'include_archived': 1})
+        self.assertEqual([order_id for page in pages for order_id in page], expected)
+        self.assertEqual(len(expected), 95)
+
+    def test_every_ordering_over_tied_values(self):
+        """
+            This test checks that the sync and async lists page through orders sharing every ordered value,
+            in both directions
+        """
+        supplier = Supplier.objects.first()
+        order_time = timezone.now()
+        PurchaseOrder.objects.bulk_create([
+            PurchaseOrder(
+                supplier=supplier, order_number=1000 + index, total_quantity=2,
+                total_amount=Decimal('21.00'), total_tax=Decimal('1.00'),
+            )
+            for index in range(25)
+        ])
+        PurchaseOrder.objects.filter(order_number__gte=1000).update(order_time=order_time)
+
+        for field in ORDERING_FIELDS:
+            for ordering in (field, f'-{field}'):
+                expected = list(PurchaseOrder.objects.order_by(ordering, ordering.replace(field, 'id')).values_list('id', flat=True))
+                pages = self.collect_pages({'page_size': 4, 'ordering': ordering, 'fields': 'id'})
+                self.assertEqual([order_id for page in pages for order_id in page], expected, ordering)
+
+                url = reverse('async-purchase-order-list-create') + '?' + urlencode({'page_size': 4, 'ordering': ordering, 'fields': 'id'})
+                ids = []
+                while url:
+                    response = self.client.get(url).json()
+                    ids += [order['id'] for order in response['results']]
+                    url = response['next']
+                self.assertEqual(ids, expected, ordering)
+
+    def test_order_time_and_supplier_filters(self):
+        """
+            This test checks the order_time range (start included, end excluded) and supplier id filters
+        """
+        orders = list(PurchaseOrder.objects.order_by('id'))
+        for purchase_order, day in zip(orders, ('2024-01-01', '2024-01-15', '2024-02-01', '2024-02-15', '2024-03-01')):
+            PurchaseOrder.objects.filter(id=purchase_order.id).update(order_time=f'{day}T00:00:00Z')
+
+        pages = self.collect_pages({'order_time_after': '2024-01-15', 'order_time_before': '2024-03-01T00:00:00Z'})
+        self.assertEqual(pages, [[orders[3].id, orders[2].id, orders[1].id]])
+
+        supplier_ids = f'{orders[0].supplier_id},{orders[4].supplier_id}'
+        pages = self.collect_pages({'supplier': supplier_ids, 'order_time_before': '2024-02-20', 'page_size': 1})
+        self.assertEqual(pages, [[orders[0].id]])
+
+        async_url = reverse('async-purchase-order-list-create') + '?' + urlencode({'supplier': orders[1].supplier_id})
+        self.assertEqual([order['id'] for order in self.client.get(async_url).json()['results']], [orders[1].id])
+
+    def test_invalid_filters_and_ordering(self):
+        """
+            This test checks that invalid filters and orderings are rejected
+        """
+        for params in ({'ordering': 'supplier'}, {'ordering': '--order_time'}, {'supplier': 'abc'}, {'order_time_after': 'yesterday'}):
+            for url in (reverse('purchase-order-list-create'), reverse('async-purchase-order-list-create')):
+                response = self.client.get(url + '?' + urlencode(params))
+                self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, (url, params))
+
+    def test_page_size_is_capped(self):
+        """
+            This test checks that the page size cannot exceed the configured maximum
+        """
+        with mock.patch.object(PurchaseOrderCursorPagination, 'max_page_size', 3):
+            response = self.client.get(reverse('purchase-order-list-create') + '?' + urlencode({'page_size': 100}))
+        self.assertEqual(len(response.data['results']), 3)
+
+
+class PurchaseOrderExportTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        for index in range(3):
+            supplier = Supplier.objects.create(name=f"Supplier {index}", email=f"supplier{index}@email.com")
+            purchase_order = PurchaseOrder.objects.create(supplier=supplier)
+            for item_name in ("Widget", "Gadget"):
+                LineItem.objects.create(
+                    item_name=f"{item_name} {index}",
+                    quantity=2,
+                    price_without_tax=Decimal("10.00"),
+                    tax_name="GST 5%",
+                    tax_amount=Decimal("0.50"),
+                    purchase_order=purchase_order,
+                )
+
+    def export(self, query_params):
+        response = self.client.get(reverse('purchase-order-export') + '?' + urlencode(query_params))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content).decode()
+
+    def test_ndjson_export(self):
+        """
+            This test checks that the ndjson export streams one order per line in the API shape
+        """
+        lines = self.export({'format': 'ndjson'}).splitlines()
+        self.assertEqual(len(lines), 3)
+        order = json.loads(lines[0])
+        self.assertEqual(order['supplier']['name'], "Supplier 0")
+        self.assertEqual(len(order['line_items']), 2)
+        self.assertEqual(order['total_amount'], 42.0)
+
+    def test_csv_export_with_filters(self):
+        """
+            This test checks that the csv export has one row per line item and honours the list filters
+        """
+        rows = self.export({'format': 'csv'}).splitlines()
+        self.assertEqual(rows[0].split(',')[:3], ['order_id', 'order_number', 'order_time'])
+        self.assertEqual(len(rows), 7)
+
+        rows = self.export({'format': 'csv', 'supplier_name': 'Supplier 1'}).splitlines()
+        self.assertEqual(len(rows), 3)
+
+        lines = self.export({'format': 'ndjson', 'item_name': 'Gadget 2'}).splitlines()
+        self.assertEqual(len(lines), 1)
+
+
+class PurchaseOrderSearchTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+
+    def create_order(self, supplier_name, item_names):
+        supplier = Supplier.objects.create(name=supplier_name, email=f"{supplier_name.replace(' ', '.')}@email.com")
+        purchase_order = PurchaseOrder.objects.create(supplier=supplier)
+        for item_name in item_names:
+            LineItem.objects.create(
+                item_name=item_name,
+                quantity=1,
+                price_without_tax=Decimal("10.00"),
+                tax_name="GST 5%",
+                tax_amount=Decimal("0.50"),
+                purchase_order=purchase_order,
+            )
+        return purchase_order
+
+    def test_search_orders_by_relevance_without_duplicates(self):
+        """
+            This test checks that search returns each matching order once, the best match first
+        """
+        substring = self.create_order("Acme", ["Blue bolt", "Red bolt", "Bolt cutter"])
+        exact = self.create_order("Bolt", ["Nut"])
+        self.create_order("Other", ["Screw"])
+
+        response = self.client.get(reverse('purchase-order-search') + '?' + urlencode({'q': 'bolt'}))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([order['id'] for order in response.data['results']], [exact.id, substring.id])
+
+    def test_search_requires_term(self):
+        """
+            This test checks that 400 is returned without a search term
+        """
+        response = self.client.get(reverse('purchase-order-search'))
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_item_name_filter_returns_distinct_orders(self):
+        """
+            This test checks that the item_name filter does not repeat orders with several matching items
+        """
+        self.create_order("Acme", ["Blue bolt", "Red bolt"])
+
+        response = self.client.get(reverse('purchase-order-list-create') + '?' + urlencode({'item_name': 'bolt'}))
+        self.assertEqual(len(response.data['results']), 1)
+
+
+class PurchaseOrderBulkCreateTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.supplier = Supplier.objects.create(name="Supplier 1", email="supplier@email.com")
+
+    def order_data(self, supplier, quantity=2):
+        return {
+            "supplier": supplier,
+            "line_items": [
+                {"item_name": "A", "quantity": quantity, "price_without_tax": "15.00", "tax_name": "GST 5%", "tax_amount": "0.75"},
+                {"item_name": "B", "quantity": 1, "price_without_tax": "5.00", "tax_name": "GST 5%", "tax_amount": "0.25"},
+            ]
+        }
+
+    def test_bulk_create_purchase_orders(self):
+        """
+            This test checks that a batch of orders is created with consecutive order numbers,
+            suppliers matched by email and stored totals, using a fixed number of queries
+        """
+        PurchaseOrder.objects.create(supplier=self.supplier)
+        data = [
+            self.order_data({"id": self.supplier.id, "name": self.supplier.name, "email": self.supplier.email}),
+            self.order_data({"name": "Supplier 1", "email": "supplier@email.com"}),
+            self.order_data({"name": "New Supplier", "email": "new_supplier@email.com"}),
+            self.order_data({"name": "New Supplier", "email": "new_supplier@email.com"}, quantity=4),
+        ]
+
+        # One UPDATE of the spend rollup per supplier, plus the INSERT of the missing row and of the change log
+        with self.assertNumQueries(16):
+            response = self.client.post(reverse('purchase-order-bulk-create'), data=json.dumps(data), content_type='application/json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual([order['order_number'] for order in response.data['created']], [2, 3, 4, 5])
+        self.assertEqual(Supplier.objects.count(), 2)
+        self.assertEqual(LineItem.objects.count(), 8)
+
+        purchase_order = PurchaseOrder.objects.get(pk=response.data['created'][3]['id'])
+        self.assertEqual(purchase_order.supplier.email, "new_supplier@email.com")
+        self.assertEqual(purchase_order.total_quantity, 5)
+        self.assertEqual(purchase_order.total_amount, Decimal("68.25"))
+        self.assertEqual(purchase_order.total_tax, Decimal("1.00"))
+
+    def test_bulk_create_reports_errors_per_order(self):
+        """
+            This test checks that invalid orders are reported by index while the valid ones are created
+        """
+        invalid = self.order_data({"name": "Supplier 1", "email": "supplier@email.com"})
+        invalid['line_items'] = []
+        data = [
+            invalid,
+            self.order_data({"id": 9999, "name": "Missing", "email": "missing@email.com"}),
+            self.order_data({"name": "Supplier 1", "email": "supplier@email.com"}),
+        ]
+
+        response = self.client.post(reverse('purchase-order-bulk-create'), data=json.dumps(data), content_type='application/json')
+        self.assertEqual(response.status_code, status.HTTP_207_MULTI_STATUS)
+        self.assertEqual([error['index'] for error in response.data['errors']], [0, 1])
+        self.assertEqual([order['index'] for order in response.data['created']], [2])
+        self.assertEqual(PurchaseOrder.objects.count(), 1)
+
+
+    def test_supplier_created_by_a_concurrent_request(self):
+        """
+            This test checks that a new supplier inserted by another request in the meantime is used
+            instead of failing the batch
+        """
+        bulk_create = Supplier.objects.bulk_create
+
+        def concurrent_bulk_create(suppliers, **kwargs):
+            Supplier.objects.create(name="Concurrent", email="new_supplier@email.com")
+            return bulk_create(suppliers, **kwargs)
+
+        data = [self.order_data({"name": "New Supplier", "email": "new_supplier@email.com"})]
+        with mock.patch.object(Supplier.objects, 'bulk_create', concurrent_bulk_create):
+            response = self.client.post(reverse('purchase-order-bulk-create'), data=json.dumps(data), content_type='application/json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        supplier = Supplier.objects.get(email="new_supplier@email.com")
+        self.assertEqual(supplier.name, "Concurrent")
+        self.assertEqual(PurchaseOrder.objects.get(pk=response.data['created'][0]['id']).supplier_id, supplier.id)
+
+class OrderNumberAllocationTestCase(TestCase):
+    def setUp(self):
+        self.supplier = Supplier.objects.create(name="Supplier 1", email="supplier@email.com")
+
+    def test_order_numbers_are_consecutive_and_ranges_do_not_overlap(self):
+        """
+            This test checks that single orders and reserved ranges get distinct consecutive numbers
+        """
+        first = PurchaseOrder.objects.create(supplier=self.supplier)
+        block = PurchaseOrder.reserve_order_numbers(3)
+        second = PurchaseOrder.objects.create(supplier=self.supplier)
+
+        self.assertEqual(first.order_number, 1)
+        self.assertEqual(list(block), [2, 3, 4])
+        self.assertEqual(second.order_number, 5)
+
+    def test_counter_is_recreated_after_the_highest_order_number(self):
+        """
+            This test checks that a missing counter restarts after the existing orders
+        """
+        PurchaseOrder.objects.create(supplier=self.supplier, order_number=41)
+        OrderNumberCounter.objects.all().delete()
+
+        purchase_order = PurchaseOrder.objects.create(supplier=self.supplier)
+        self.assertEqual(purchase_order.order_number, 42)
+
+    def test_explicit_order_numbers_advance_the_counter(self):
+        """
+            This test checks that an order created with its own number is never given that number again
+        """
+        PurchaseOrder.objects.create(supplier=self.supplier)
+        PurchaseOrder.objects.create(supplier=self.supplier, order_number=10)
+        self.assertEqual(PurchaseOrder.objects.create(supplier=self.supplier).order_number, 11)
+
+        PurchaseOrder.objects.create(supplier=self.supplier, order_number=5)
+        self.assertEqual(list(PurchaseOrder.reserve_order_numbers(2)), [12, 13])
+
+        OrderNumberCounter.objects.all().delete()
+        PurchaseOrder.objects.create(supplier=self.supplier, order_number=20)
+        self.assertEqual(PurchaseOrder.objects.create(supplier=self.supplier).order_number, 21)
+
+    def test_order_number_is_unique(self):
+        """
+            This test checks that the database rejects duplicate order numbers
+        """
+        PurchaseOrder.objects.create(supplier=self.supplier, order_number=7)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            PurchaseOrder.objects.create(supplier=self.supplier, order_number=7)
+
+
+class PurchaseOrderUpdateDiffTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.supplier = Supplier.objects.create(name="Supplier 1", email="supplier@email.com")
+        self.purchase_order = PurchaseOrder.objects.create(supplier=self.supplier)
+        LineItem.objects.bulk_create(
+            LineItem(
+                item_name=f"Product {index}",
+                quantity=1,
+                price_without_tax=Decimal("10.00"),
+                tax_name="GST 5%",
+                tax_amount=Decimal("0.50"),
+                purchase_order=self.purchase_order,
+            )
+            for index in range(5)
+        )
+        self.purchase_order.update_totals()
+
+    def request_data(self):
+        return {
+            "supplier": {"id": self.supplier.id, "name": self.supplier.name, "email": self.supplier.email},
+            "line_items": [
+                {
+                    "id": line_item.id,
+                    "item_name": line_item.item_name,
+                    "quantity": line_item.quantity,
+                    "price_without_tax": str(line_item.price_without_tax),
+                    "tax_name": line_item.tax_name,
+                    "tax_amount": str(line_item.tax_amount),
+                }
+                for line_item in self.purchase_order.line_items.order_by('id')
+            ]
+        }
+
+    def put(self, data):
+        response = self.client.put(reverse('purchase-order-details', args=[self.purchase_order.id]), data=json.dumps(data), content_type='application/json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response
+
+    def test_unchanged_update_does_not_write(self):
+        """
+            This test checks that resubmitting an order unchanged issues no writes
+        """
+        data = self.request_data()
+        with self.assertNumQueries(5):
+            response = self.put(data)
+        self.assertEqual(response.data['changes']['line_items_unchanged'], 5)
+        self.assertFalse(response.data['changes']['order_updated'])
+        self.assertFalse(response.data['changes']['supplier_updated'])
+
+    def test_update_applies_diff(self):
+        """
+            This test checks that updated, new and removed line items are each applied in bulk
+        """
+        data = self.request_data()
+        data['line_items'][0]['quantity'] = 3
+        data['line_items'][1]['item_name'] = "Renamed"
+        del data['line_items'][4]
+        data['line_items'].append({"item_name": "New", "quantity": 2, "price_without_tax": "1.00", "tax_name": "GST 5%", "tax_amount": "0.10"})
+
+        response = self.put(data)
+        self.assertEqual(response.data['changes'], {
+            'line_items_created': 1,
+            'line_items_updated': 2,
+            'line_items_deleted': 1,
+            'line_items_unchanged': 2,
+            'supplier_created': False,
+            'supplier_updated': False,
+            'order_updated': True,
+        })
+        self.assertEqual(sorted(self.purchase_order.line_items.values_list('item_name', flat=True)), ["New", "Product 0", "Product 2", "Product 3", "Renamed"])
+
+        self.purchase_order.refresh_from_db()
+        self.assertEqual(self.purchase_order.total_quantity, 8)
+        self.assertEqual(self.purchase_order.total_amount, Decimal("65.20"))
+        self.assertEqual(response.data['total_quantity'], 8)
+
+
+@override_settings(PURCHASE_ORDER_RESPONSE_CACHE={'BACKEND': 'purchase_order.cache.LocalMemoryResponseCache'})
+class PurchaseOrderDetailCacheTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        supplier = Supplier.objects.create(name="Supplier 1", email="supplier@email.com")
+        self.purchase_order = PurchaseOrder.objects.create(supplier=supplier)
+        self.line_item = LineItem.objects.create(
+            item_name="Test Product",
+            quantity=1,
+            price_without_tax=Decimal("10.00"),
+            tax_name="GST 5%",
+            tax_amount=Decimal("0.50"),
+            purchase_order=self.purchase_order,
+        )
+        self.url = reverse('purchase-order-details', args=[self.purchase_order.id])
+
+    def test_cached_and_conditional_reads(self):
+        """
+            This test checks that repeated reads are served from the cache and
+            that a matching If-None-Match returns 304 after a single query
+        """
+        response = self.client.get(self.url)
+        etag = response['ETag']
+        self.assertIn('Last-Modified', response)
+
+        with self.assertNumQueries(1):
+            cached_response = self.client.get(self.url)
+        self.assertEqual(cached_response.data, response.data)
+        self.assertEqual(cached_response['ETag'], etag)
+
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        stats = self.client.get(reverse('purchase-order-cache-stats')).data
+        self.assertEqual((stats['hits'], stats['misses']), (1, 1))
+
+    def test_changes_invalidate_cached_reads(self):
+        """
+            This test checks that line item changes and updates change the ETag and the cached data
+        """
+        etag = self.client.get(self.url)['ETag']
+
+        self.line_item.quantity = 4
+        self.line_item.save()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['total_quantity'], 4)
+
+        data = {
+            "supplier": {"id": self.purchase_order.supplier_id, "name": "Renamed", "email": "supplier@email.com"},
+            "line_items": [{"id": self.line_item.id, "item_name": "Test Product", "quantity": 4, "price_without_tax": "10.00", "tax_name": "GST 5%", "tax_amount": "0.50"}],
+        }
+        put_response = self.client.put(self.url, data=json.dumps(data), content_type='application/json')
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['ETag'], put_response['ETag'])
+        self.assertEqual(response.data['supplier']['name'], "Renamed")
+
+    @override_settings(
+        CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+        PURCHASE_ORDER_RESPONSE_CACHE={'BACKEND': 'purchase_order.cache.DjangoResponseCache', 'ALIAS': 'default'},
+    )
+    def test_django_cache_backend(self):
+        """
+            This test checks that the response cache can be backed by a Django cache
+        """
+        self.client.get(self.url)
+        with self.assertNumQueries(1):
+            self.client.get(self.url)
+        stats = self.client.get(reverse('purchase-order-cache-stats')).data
+        self.assertEqual(stats['backend'], 'DjangoResponseCache')
+        self.assertEqual(stats['hits'], 1)
+
+
+    async def test_async_conditional_reads(self):
+        """
+            This test checks that the async detail view answers the preconditions like the sync one:
+            304 for a matching If-None-Match and 412 for a failed If-Match
+        """
+        async_url = reverse('async-purchase-order-details', args=[self.purchase_order.id])
+        response = await AsyncClient().get(async_url)
+        etag = response['ETag']
+
+        response = await AsyncClient().get(async_url, headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response['ETag'], etag)
+
+        response = await sync_to_async(self.client.get)(self.url, HTTP_IF_MATCH='"0-0"')
+        self.assertEqual(response.status_code, status.HTTP_412_PRECONDITION_FAILED)
+        response = await AsyncClient().get(async_url, headers={'If-Match': '"0-0"'})
+        self.assertEqual(response.status_code, status.HTTP_412_PRECONDITION_FAILED)
+        self.assertEqual(response['ETag'], etag)
+
+    async def test_async_reads_share_the_cache(self):
+        """
+            This test checks that the async detail view reads and fills the response cache like the sync one,
+            with both cache backends
+        """
+        async_url = reverse('async-purchase-order-details', args=[self.purchase_order.id])
+        for cache_setting in (
+            {'BACKEND': 'purchase_order.cache.LocalMemoryResponseCache'},
+            {'BACKEND': 'purchase_order.cache.DjangoResponseCache', 'ALIAS': 'default'},
+        ):
+            with override_settings(
+                CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+                PURCHASE_ORDER_RESPONSE_CACHE=cache_setting,
+            ):
+                response = await sync_to_async(self.client.get)(self.url)
+                async_response = await AsyncClient().get(async_url)
+                self.assertEqual(async_response.json(), json.loads(response.content))
+                self.assertEqual(async_response['ETag'], response['ETag'])
+                self.assertEqual(get_response_cache().get_stats()['hits'], 1)
+
+                await LineItem.objects.filter(pk=self.line_item.pk).aupdate(quantity=3)
+                await sync_to_async((await PurchaseOrder.objects.aget(pk=self.purchase_order.pk)).update_totals)()
+                async_response = await AsyncClient().get(async_url)
+                self.assertEqual(async_response.json()['total_quantity'], 3)
+                response = await sync_to_async(self.client.get)(self.url)
+                self.assertEqual(json.loads(response.content), async_response.json())
+                self.assertEqual(get_response_cache().get_stats()['hits'], 2)
+
+
+class AsyncPurchaseOrderViewsTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.async_client = AsyncClient()
+        self.supplier = Supplier.objects.create(name="Supplier 1", email="supplier@email.com")
+        for index in range(3):
+            purchase_order = PurchaseOrder.objects.create(supplier=self.supplier)
+            LineItem.objects.create(
+                item_name=f"Product {index}",
+                quantity=index + 1,
+                price_without_tax=Decimal("10.00"),
+                tax_name="GST 5%",
+                tax_amount=Decimal("0.50"),
+                purchase_order=purchase_order,
+            )
+
+    def order_data(self):
+        return {
+            "supplier": {"id": self.supplier.id, "name": self.supplier.name, "email": self.supplier.email},
+            "line_items": [{"item_name": "New", "quantity": 2, "price_without_tax": "15.00", "tax_name": "GST 5%", "tax_amount": "0.75"}],
+        }
+
+    async def test_async_list_matches_sync_list(self):
+        """
+            This test checks that the async list returns the same pages as the sync one
+        """
+        url = '?' + urlencode({'page_size': 2, 'item_name': 'Product'})
+        sync_response = await sync_to_async(self.client.get)(reverse('purchase-order-list-create') + url)
+        response = await self.async_client.get(reverse('async-purchase-order-list-create') + url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()['results'], json.loads(sync_response.content)['results'])
+        self.assertIsNotNone(response.json()['next'])
+
+    async def test_async_create_retrieve_update_delete(self):
+        """
+            This test checks the async create, retrieve, update and delete handlers
+        """
+        response = await self.async_client.post(reverse('async-purchase-order-list-create'), data=self.order_data(), content_type='application/json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        purchase_order_id = response.json()['id']
+        self.assertEqual(response.json()['total_amount'], 31.5)
+
+        url = reverse('async-purchase-order-details', args=[purchase_order_id])
+        response = await self.async_client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        response = await self.async_client.get(url, headers={'If-None-Match': response['ETag']})
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        data = self.order_data()
+        data['line_items'][0]['quantity'] = 4
+        response = await self.async_client.put(url, data=data, content_type='application/json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()['total_quantity'], 4)
+
+        response = await self.async_client.delete(url)
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertFalse(await PurchaseOrder.objects.filter(pk=purchase_order_id).aexists())
+        self.assertEqual(await sync_to_async(rebuild_spend_rollup)(dry_run=True), {'created': 0, 'updated': 0, 'deleted': 0})
+        self.assertEqual(
+            (await OrderChange.objects.filter(purchase_order_id=purchase_order_id).alast()).action, OrderChange.DELETED
+        )
+
+        response = await self.async_client.delete(url)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+@override_settings(PURCHASE_ORDER_READ_REPLICAS=['replica1', 'replica2'], PURCHASE_ORDER_REPLICA_STICKY_SECONDS=5)
+class ReplicaRoutingTestCase(SimpleTestCase):
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.router = PrimaryReplicaRouter()
+
+    def route(self, request):
+        """
+            This method runs the request through the middleware and returns the database
+            the router picked for a purchase order read, along with the response
+        """
+        databases = []
+
+        def view(request):
+            databases.append(self.router.db_for_read(PurchaseOrder))
+            return HttpResponse()
+
+        response = ReplicaRoutingMiddleware(view)(request)
+        return databases[0], response
+
+    def test_reads_are_spread_over_replicas(self):
+        """
+            This test checks that GET requests read from the replicas in turn and writes go to the primary
+        """
+        self.assertEqual([self.route(self.factory.get('/'))[0] for _ in range(3)], ['replica1', 'replica2', 'replica1'])
+        self.assertEqual(self.route(self.factory.post('/'))[0], 'default')
+        self.assertEqual(self.router.db_for_write(PurchaseOrder), 'default')
+        self.assertFalse(use_replica.get())
+
+    def test_client_is_pinned_to_primary_after_write(self):
+        """
+            This test checks that a client reads from the primary during the sticky window after a write
+        """
+        _, response = self.route(self.factory.put('/'))
+        pin = response.cookies[PRIMARY_PIN_COOKIE].value
+
+        request = self.factory.get('/')
+        request.COOKIES[PRIMARY_PIN_COOKIE] = pin
+        self.assertEqual(self.route(request)[0], 'default')
+
+        request = self.factory.get('/')
+        request.COOKIES[PRIMARY_PIN_COOKIE] = str(float(pin) - 10)
+        self.assertIn(self.route(request)[0], ['replica1', 'replica2'])
+
+    def test_other_apps_and_migrations_stay_on_primary(self):
+        """
+            This test checks that only purchase order reads are routed and that replicas are not migrated
+        """
+        token = use_replica.set(True)
+        try:
+            self.assertEqual(self.router.db_for_read(Supplier), 'replica1')
+            self.assertEqual(self.router.db_for_read(ContentType), 'default')
+        finally:
+            use_replica.reset(token)
+        self.assertFalse(self.router.allow_migrate('replica1', 'purchase_order'))
+        self.assertTrue(self.router.allow_migrate('default', 'purchase_order'))
+
+
+class BenchmarkCommandsTestCase(TestCase):
+    def test_seed_orders_and_benchmark_api(self):
+        """
+            This test checks that seed_orders creates N x M x K rows with consistent totals
+            and that benchmark_api reports every scenario as JSON
+        """
+        call_command('seed_orders', '--suppliers', 2, '--orders', 3, '--lines', 2, '--seed', 1, stdout=StringIO())
+        self.assertEqual(Supplier.objects.count(), 2)
+        self.assertEqual(PurchaseOrder.objects.count(), 6)
+        self.assertEqual(LineItem.objects.count(), 12)
+        self.assertEqual(len(set(PurchaseOrder.objects.values_list('order_number', flat=True))), 6)
+        purchase_order = PurchaseOrder.objects.first()
+        self.assertEqual(purchase_order.total_quantity, sum(purchase_order.line_items.values_list('quantity', flat=True)))
+
+        out = StringIO()
+        call_command('benchmark_api', '--iterations', 2, stdout=out)
+        report = json.loads(out.getvalue())
+        self.assertEqual(
+            set(report['results']),
+            {'list', 'list_supplier_filter', 'list_item_filter', 'detail', 'create', 'update', 'delete'},
+        )
+        self.assertEqual(report['results']['list']['queries']['max'], 2)
+        self.assertEqual(PurchaseOrder.objects.count(), 6)
+
+        out = StringIO()
+        call_command('benchmark_serialization', '--iterations', 1, stdout=out)
+        self.assertEqual(set(json.loads(out.getvalue())), {'drf', 'fast', 'speedup'})
+
+
+class InstrumentationTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        supplier = Supplier.objects.create(name="Supplier 1", email="supplier@email.com")
+        purchase_order = PurchaseOrder.objects.create(supplier=supplier)
+        LineItem.objects.create(
+            item_name="Test Product",
+            quantity=1,
+            price_without_tax=Decimal("10.00"),
+            tax_name="GST 5%",
+            tax_amount=Decimal("0.50"),
+            purchase_order=purchase_order,
+        )
+        registry.reset()
+
+    def test_server_timing_header_and_metrics(self):
+        """
+            This test checks that responses carry their timings and that they are aggregated per endpoint
+        """
+        response = self.client.get(reverse('purchase-order-list-create'))
+        server_timing = response['Server-Timing']
+        for section in ('db;', 'serialize;', 'render;', 'total;'):
+            self.assertIn(section, server_timing)
+        self.assertIn('desc="2 queries"', server_timing)
+
+        metrics = self.client.get(reverse('metrics')).content.decode()
+        self.assertIn(
+            'purchase_order_request_db_queries_bucket{method="GET",endpoint="api/purchase/orders/",le="2"} 1', metrics
+        )
+        self.assertIn('purchase_order_responses_total{method="GET",endpoint="api/purchase/orders/",status="200"} 1', metrics)
+
+    @override_settings(PURCHASE_ORDER_SLOW_REQUEST_MS=0)
+    def test_slow_requests_are_logged_with_their_queries(self):
+        """
+            This test checks that slow requests are logged with their slowest SQL statements
+        """
+        with self.assertLogs('purchase_order.requests', level='WARNING') as logs:
+            self.client.get(reverse('purchase-order-list-create'))
+        record = logs.records[0]
+        self.assertEqual(record.db_queries, 2)
+        self.assertIn('purchase_order_purchaseorder', record.top_queries[0]['sql'] + record.top_queries[1]['sql'])
+
+    def test_invalid_data_is_logged(self):
+        """
+            This test checks that rejected purchase orders are logged with their validation errors
+        """
+        data = {"supplier": {"name": "New Supplier", "email": "new_supplier@email.com"}, "line_items": []}
+        with self.assertLogs('purchase_order.views', level='INFO') as logs:
+            response = self.client.post(reverse('purchase-order-list-create'), data=json.dumps(data), content_type='application/json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('line_items', logs.records[0].errors)
+
+
+class FastReadPathTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        supplier = Supplier.objects.create(name="Fournisseur été\u2028\u2029", email="supplier@email.com")
+        self.purchase_order = PurchaseOrder.objects.create(supplier=supplier)
+        for quantity, price in ((1, '10.00'), (3, '0.10'), (7, '1234.5')):
+            LineItem.objects.create(
+                item_name=f"Product ☃ {quantity}",
+                quantity=quantity,
+                price_without_tax=Decimal(price),
+                tax_name="GST 12%",
+                tax_amount=Decimal(price) * Decimal('0.12'),
+                purchase_order=self.purchase_order,
+            )
+        PurchaseOrder.objects.create(supplier=supplier)
+
+    def drf_render(self, data):
+        return JSONRenderer().render(data)
+
+    def test_list_matches_drf_serializer(self):
+        """
+            This test checks that the list is rendered byte for byte like PurchaseOrderSerializer and JSONRenderer
+        """
+        response = self.client.get(reverse('purchase-order-list-create'))
+        orders = PurchaseOrder.objects.with_details().order_by('-order_time', '-id')
+        self.assertEqual(
+            json.loads(response.content)['results'],
+            json.loads(self.drf_render(PurchaseOrderSerializer(orders, many=True).data)),
+        )
+        self.assertIn(self.drf_render(PurchaseOrderSerializer(orders, many=True).data)[1:-1], response.content)
+
+    def test_detail_matches_drf_serializer(self):
+        """
+            This test checks that the detail of an order, including unicode and empty orders, matches the DRF output
+        """
+        for purchase_order in PurchaseOrder.objects.with_details():
+            response = self.client.get(reverse('purchase-order-details', args=[purchase_order.id]))
+            self.assertEqual(response.content, self.drf_render(PurchaseOrderSerializer(purchase_order).data))
+
+    def test_fast_renderer_matches_json_renderer(self):
+        """
+            This test checks that FastJSONRenderer falls back to JSONRenderer's output for the same data
+        """
+        data = {'amount': Decimal('12.50'), 'time': self.purchase_order.order_time, 'name': "\u2028é", 'items': [], 'none': None}
+        self.assertEqual(FastJSONRenderer().render(data), self.drf_render(data))
+        self.assertEqual(
+            FastJSONRenderer().render(data, 'application/json; indent=2'),
+            JSONRenderer().render(data, 'application/json; indent=2'),
+        )
+
+
+class IdempotencyKeyTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.data = {
+            "supplier": {"name": "Supplier 1", "email": "supplier@email.com"},
+            "line_items": [
+                {"item_name": "Test Product", "quantity": 2, "price_without_tax": "10.00", "tax_name": "GST 12%", "tax_amount": "1.20"},
+            ],
+        }
+
+    def post(self, data, key='order-1'):
+        return self.client.post(
+            reverse('purchase-order-list-create'), data=json.dumps(data), content_type='application/json',
+            HTTP_IDEMPOTENCY_KEY=key,
+        )
+
+    def test_retried_post_is_replayed(self):
+        """
+            This test checks that a retried POST gets the first response without creating another order
+        """
+        response = self.post(self.data)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        with mock.patch.object(PurchaseOrderSerializer, 'is_valid') as is_valid:
+            replayed = self.post(self.data)
+        is_valid.assert_not_called()
+        self.assertEqual(replayed.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(replayed.content, response.content)
+        self.assertEqual(replayed['Idempotent-Replayed'], 'true')
+        self.assertEqual(PurchaseOrder.objects.count(), 1)
+        self.assertEqual(Supplier.objects.count(), 1)
+
+        self.data['supplier']['id'] = response.json()['supplier']['id']
+        self.assertEqual(self.post(self.data, key='order-2').status_code, status.HTTP_201_CREATED)
+        self.assertEqual(PurchaseOrder.objects.count(), 2)
+
+    def test_key_reused_for_another_request(self):
+        """
+            This test checks that a key cannot be reused with a different body
+        """
+        self.post(self.data)
+        self.data['line_items'][0]['quantity'] = 3
+        response = self.post(self.data)
+        self.assertEqual(response.status_code, status.HTTP_422_UNPROCESSABLE_ENTITY)
+        self.assertEqual(PurchaseOrder.objects.count(), 1)
+
+    def test_key_in_progress(self):
+        """
+            This test checks that a key whose first request has not stored its response yet is reported as a conflict
+        """
+        self.post(self.data)
+        IdempotencyKey.objects.update(status_code=None)
+        self.assertEqual(self.post(self.data).status_code, status.HTTP_409_CONFLICT)
+
+    def test_invalid_requests_are_replayed_and_server_errors_are_not(self):
+        """
+            This test checks that validation errors are stored while failed requests leave no key or order behind
+        """
+        self.assertEqual(self.post({"supplier": {}}).status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(IdempotencyKey.objects.get().status_code, status.HTTP_400_BAD_REQUEST)
+
+        with mock.patch.object(LineItem.objects, 'bulk_create', side_effect=RuntimeError), self.assertRaises(RuntimeError):
+            self.post(self.data, key='order-2')
+        self.assertFalse(IdempotencyKey.objects.filter(key='order-2').exists())
+        self.assertEqual(PurchaseOrder.objects.count(), 0)
+        self.assertEqual(self.post(self.data, key='order-2').status_code, status.HTTP_201_CREATED)
+
+    def test_put_is_replayed_with_its_validators(self):
+        """
+            This test checks that a retried PUT is replayed with the ETag of the version it created
+        """
+        purchase_order = self.post(self.data).json()
+        url = reverse('purchase-order-details', args=[purchase_order['id']])
+        self.data['supplier']['id'] = purchase_order['supplier']['id']
+        self.data['line_items'][0]['quantity'] = 5
+
+        def put():
+            return self.client.put(url, data=json.dumps(self.data), content_type='application/json', HTTP_IDEMPOTENCY_KEY='update-1')
+
+        response = put()
+        replayed = put()
+        self.assertEqual(replayed.content, response.content)
+        self.assertEqual(replayed['ETag'], response['ETag'])
+        self.assertEqual(response['ETag'], quote_etag(f"{purchase_order['id']}-{PurchaseOrder.objects.get().version}"))
+        self.assertEqual(PurchaseOrder.objects.values_list('total_quantity', flat=True).get(), 5)
+
+    @override_settings(PURCHASE_ORDER_IDEMPOTENCY_KEY_TTL=0)
+    def test_expired_keys_are_processed_again_and_purged(self):
+        """
+            This test checks that expired keys no longer replay and are removed by purge_idempotency_keys
+        """
+        self.data['supplier']['id'] = Supplier.objects.create(**self.data['supplier']).id
+        self.post(self.data)
+        self.assertEqual(self.post(self.data).status_code, status.HTTP_201_CREATED)
+        self.assertEqual(PurchaseOrder.objects.count(), 2)
+
+        out = StringIO()
+        call_command('purge_idempotency_keys', stdout=out)
+        self.assertIn('Deleted 1 expired idempotency keys', out.getvalue())
+        self.assertFalse(IdempotencyKey.objects.exists())
+
+    async def test_async_post_and_put_are_replayed(self):
+        """
+            This test checks that retried requests to the async views are replayed like those to the sync views
+        """
+        async_client = AsyncClient()
+
+        async def post():
+            return await async_client.post(
+                reverse('async-purchase-order-list-create'), data=self.data, content_type='application/json',
+                headers={'Idempotency-Key': 'order-1'},
+            )
+
+        response = await post()
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        replayed = await post()
+        self.assertEqual(replayed['Idempotent-Replayed'], 'true')
+        self.assertEqual(replayed.json(), response.json())
+        self.assertEqual(await PurchaseOrder.objects.acount(), 1)
+
+        url = reverse('async-purchase-order-details', args=[response.json()['id']])
+        self.data['supplier']['id'] = response.json()['supplier']['id']
+        self.data['line_items'][0]['quantity'] = 5
+        responses = [
+            await async_client.put(url, data=self.data, content_type='application/json', headers={'Idempotency-Key': 'update-1'})
+            for _ in range(2)
+        ]
+        self.assertEqual(responses[1]['Idempotent-Replayed'], 'true')
+        self.assertEqual(responses[1]['ETag'], responses[0]['ETag'])
+        self.assertEqual(responses[1].json(), responses[0].json())
+        self.assertEqual(await PurchaseOrder.objects.values_list('version', flat=True).aget(), 2)
+
+        self.data['line_items'][0]['quantity'] = 6
+        response = await async_client.put(url, data=self.data, content_type='application/json', headers={'Idempotency-Key': 'update-1'})
+        self.assertEqual(response.status_code, status.HTTP_422_UNPROCESSABLE_ENTITY)
+
+    def test_invalid_key(self):
+        response = self.post(self.data, key='x' * 256)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(PurchaseOrder.objects.count(), 0)
+
+
+class SparseFieldsetsTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        supplier = Supplier.objects.create(name="Supplier 1", email="supplier@email.com")
+        self.purchase_order = PurchaseOrder.objects.create(supplier=supplier)
+        LineItem.objects.create(
+            item_name="Test Product", quantity=2, price_without_tax=Decimal('10.00'),
+            tax_name="GST 12%", tax_amount=Decimal('1.20'), purchase_order=self.purchase_order,
+        )
+
+    def test_summary_list_reads_only_the_order_columns(self):
+        """
+            This test checks that a summary list runs one query, without joining the supplier or reading line items
+        """
+        url = reverse('purchase-order-list-create') + '?fields=order_number,total_amount'
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()['results'], [{'total_amount': 22.4, 'order_number': self.purchase_order.order_number}])
+        self.assertEqual(len(queries), 1)
+        self.assertNotIn('purchase_order_supplier', queries[0]['sql'])
+        self.assertNotIn('total_tax', queries[0]['sql'])
+
+    def test_expand(self):
+        """
+            This test checks that ?expand= adds the relations, and fetches only those
+        """
+        url = reverse('purchase-order-list-create') + '?expand=supplier'
+        with self.assertNumQueries(1):
+            result = self.client.get(url).json()['results'][0]
+        self.assertEqual(
+            list(result), ['id', 'supplier', 'total_amount', 'total_quantity', 'total_tax', 'order_time', 'order_number']
+        )
+        self.assertEqual(result['supplier']['name'], "Supplier 1")
+
+        url = reverse('purchase-order-list-create') + '?fields=id&expand=line_items'
+        result = self.client.get(url).json()['results'][0]
+        self.assertEqual(list(result), ['id', 'line_items'])
+        self.assertEqual(result['line_items'][0]['line_total'], 22.4)
+
+    def test_detail_fields(self):
+        """
+            This test checks that the detail view returns the selected fields without touching the response cache
+        """
+        url = reverse('purchase-order-details', args=[self.purchase_order.id])
+        response = self.client.get(url + '?fields=id,total_quantity')
+        self.assertEqual(response.json(), {'id': self.purchase_order.id, 'total_quantity': 2})
+        self.assertIsNone(get_response_cache().get(self.purchase_order.id, (self.purchase_order.version, self.purchase_order.updated_at)))
+        self.assertEqual(len(self.client.get(url).json()['line_items']), 1)
+
+    def test_unknown_fields(self):
+        for query in ('?fields=id,secret', '?expand=total_amount'):
+            response = self.client.get(reverse('purchase-order-list-create') + query)
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get(reverse('purchase-order-details', args=[self.purchase_order.id]) + '?fields=secret')
+        self.assertEqual(response.json(), {'error': 'Unknown fields: secret.'})
+
+    async def test_async_views(self):
+        """
+            This test checks that the async views honour ?fields= and ?expand= too
+        """
+        client = AsyncClient()
+        response = await client.get(reverse('async-purchase-order-list-create') + '?fields=order_number&expand=supplier')
+        self.assertEqual(list(json.loads(response.content)['results'][0]), ['supplier', 'order_number'])
+        response = await client.get(reverse('async-purchase-order-details', args=[self.purchase_order.id]) + '?fields=id')
+        self.assertEqual(json.loads(response.content), {'id': self.purchase_order.id})
+
+
+class ImportOrdersTestCase(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.supplier = Supplier.objects.create(name="Old name", email="supplier@email.com")
+
+    def write(self, name, content):
+        path = os.path.join(self.directory.name, name)
+        with open(path, 'w') as file:
+            file.write(content)
+        return path
+
+    def import_orders(self, *args):
+        out = StringIO()
+        err = StringIO()
+        call_command('import_orders', *args, stdout=out, stderr=err)
+        return out.getvalue(), err.getvalue()
+
+    def order(self, email="supplier@email.com", quantity=2, **extra):
+        return dict({
+            "supplier": {"name": "Supplier 1", "email": email},
+            "line_items": [
+                {"item_name": "Product", "quantity": quantity, "price_without_tax": "10.00", "tax_name": "GST 12%", "tax_amount": "1.20"},
+                {"item_name": "Other product", "quantity": 1, "price_without_tax": "5.50", "tax_name": "GST 5%", "tax_amount": "0.28"},
+            ],
+        }, **extra)
+
+    def test_import_ndjson(self):
+        """
+            This test checks that orders are imported with their totals and order time, suppliers are upserted by
+            email and invalid orders are reported and skipped
+        """
+        lines = [
+            json.dumps(self.order(order_time="2020-01-02T03:04:05Z")),
+            json.dumps(self.order(email="new@email.com")),
+            json.dumps(self.order(quantity=-1)),
+            "{not json",
+            json.dumps(self.order(quantity=2147483648)),
+        ]
+        path = self.write('orders.ndjson', '\n'.join(lines) + '\n')
+        out, err = self.import_orders(path, '--batch-size', 1)
+
+        self.assertIn('Imported 2 orders and 4 line items', out)
+        self.assertIn('3 orders rejected', out)
+        self.assertIn('line 3 rejected: quantity must be a positive integer.', err)
+        self.assertIn('line 4 rejected: Invalid json', err)
+        self.assertIn('line 5 rejected: quantity must be at most 2147483647.', err)
+
+        self.assertEqual(Supplier.objects.count(), 2)
+        self.supplier.refresh_from_db()
+        self.assertEqual(self.supplier.name, "Supplier 1")
+        purchase_order = PurchaseOrder.objects.get(supplier=self.supplier)
+        self.assertEqual(purchase_order.order_time.isoformat(), '2020-01-02T03:04:05+00:00')
+        self.assertEqual(purchase_order.total_quantity, 3)
+        self.assertEqual(purchase_order.total_amount, Decimal('28.18'))
+        self.assertEqual(purchase_order.total_tax, Decimal('1.48'))
+        self.assertEqual(len(set(PurchaseOrder.objects.values_list('order_number', flat=True))), 2)
+        self.assertEqual(rebuild_spend_rollup(dry_run=True), {'created': 0, 'updated': 0, 'deleted': 0})
+
+    def test_import_csv_export(self):
+        """
+            This test checks that a csv export is imported back with one order per group of rows
+        """
+        for quantity in (1, 2):
+            self.client.post(reverse('purchase-order-list-create'), data=json.dumps(self.order(quantity=quantity, supplier={
+                "id": self.supplier.id, "name": "Old name", "email": "supplier@email.com",
+            })), content_type='application/json')
+        export = b''.join(self.client.get(reverse('purchase-order-export'), {'format': 'csv'}).streaming_content)
+        path = self.write('orders.csv', export.decode())
+
+        out, _ = self.import_orders(path)
+        self.assertIn('Imported 2 orders and 4 line items', out)
+        self.assertEqual(PurchaseOrder.objects.count(), 4)
+        self.assertEqual(
+            sorted(PurchaseOrder.objects.values_list('total_amount', flat=True)),
+            sorted(2 * list(PurchaseOrder.objects.order_by('id').values_list('total_amount', flat=True)[:2])),
+        )
+
+    def test_resume_from_checkpoint(self):
+        """
+            This test checks that an interrupted import resumes after the last loaded batch
+        """
+        path = self.write('orders.ndjson', '\n'.join(json.dumps(self.order(quantity=quantity)) for quantity in range(1, 6)) + '\n')
+
+        load = OrderLoader.load
+        calls = []
+
+        def failing_load(loader, orders):
+            calls.append(len(orders))
+            if len(calls) == 3:
+                raise RuntimeError("Connection lost")
+            return load(loader, orders)
+
+        with mock.patch.object(OrderLoader, 'load', failing_load), self.assertRaises(RuntimeError):
+            self.import_orders(path, '--batch-size', 2)
+        self.assertEqual(PurchaseOrder.objects.count(), 4)
+
+        out, _ = self.import_orders(path, '--batch-size', 2)
+        self.assertIn('Resuming after 4 orders', out)
+        self.assertIn('Imported 1 orders and 2 line items', out)
+        self.assertEqual(sorted(PurchaseOrder.objects.values_list('total_quantity', flat=True)), [2, 3, 4, 5, 6])
+
+        out, _ = self.import_orders(path)
+        self.assertIn('Imported 0 orders', out)
+        out, _ = self.import_orders(path, '--restart')
+        self.assertIn('Imported 5 orders', out)
+
+
+class SupplierUpsertTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.supplier = Supplier.objects.create(name="Supplier 1", email="supplier@email.com")
+        self.purchase_order = PurchaseOrder.objects.create(supplier=self.supplier)
+
+    def post(self, name="Supplier 1", email="supplier@email.com"):
+        data = {
+            "supplier": {"name": name, "email": email},
+            "line_items": [
+                {"item_name": "Test Product", "quantity": 1, "price_without_tax": "10.00", "tax_name": "GST 12%", "tax_amount": "1.20"},
+            ],
+        }
+        return self.client.post(reverse('purchase-order-list-create'), data=json.dumps(data), content_type='application/json')
+
+    def test_existing_supplier_is_resolved_by_email(self):
+        """
+            This test checks that an order for a known supplier email is created without a supplier id
+        """
+        response = self.post()
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['supplier']['id'], self.supplier.id)
+        self.assertEqual(Supplier.objects.count(), 1)
+
+        response = self.post(email="new@email.com")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(Supplier.objects.get(email="new@email.com").id, response.data['supplier']['id'])
+
+    def test_existing_supplier_needs_one_query(self):
+        """
+            This test checks that the supplier of a known email is read with one query and neither locked nor written
+        """
+        with CaptureQueriesContext(connection) as queries:
+            response = self.post()
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        supplier_queries = [query['sql'] for query in queries if '"purchase_order_supplier"' in query['sql']]
+        self.assertEqual(len(supplier_queries), 1)
+        self.assertTrue(supplier_queries[0].startswith('SELECT'))
+
+    def test_existing_supplier_keeps_its_name(self):
+        """
+            This test checks that creating an order neither renames a known supplier nor bumps the versions of its orders
+        """
+        self.post()
+        version = PurchaseOrder.objects.get(pk=self.purchase_order.pk).version
+
+        response = self.post(name="Renamed")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['supplier']['name'], "Supplier 1")
+        self.supplier.refresh_from_db()
+        self.assertEqual(self.supplier.name, "Supplier 1")
+        self.assertEqual(PurchaseOrder.objects.get(pk=self.purchase_order.pk).version, version)
+
+    async def test_async_create(self):
+        """
+            This test checks that the async view resolves suppliers by email too
+        """
+        data = {
+            "supplier": {"name": "Supplier 1", "email": "supplier@email.com"},
+            "line_items": [
+                {"item_name": "Test Product", "quantity": 1, "price_without_tax": "10.00", "tax_name": "GST 12%", "tax_amount": "1.20"},
+            ],
+        }
+        response = await AsyncClient().post(reverse('async-purchase-order-list-create'), data=data, content_type='application/json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(json.loads(response.content)['supplier']['id'], self.supplier.id)
+
+
+class SpendRollupTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.supplier = Supplier.objects.create(name="Supplier 1", email="supplier@email.com")
+        self.other_supplier = Supplier.objects.create(name="Supplier 2", email="other@email.com")
+
+    def order_data(self, supplier, quantity=2):
+        return {
+            "supplier": {"id": supplier.id, "name": supplier.name, "email": supplier.email},
+            "line_items": [
+                {"item_name": "Test Product", "quantity": quantity, "price_without_tax": "10.00", "tax_name": "GST 12%", "tax_amount": "1.20"},
+            ],
+        }
+
+    def post(self, supplier, quantity=2):
+        response = self.client.post(
+            reverse('purchase-order-list-create'), data=json.dumps(self.order_data(supplier, quantity)), content_type='application/json'
+        )
+        return response.data
+
+    def assertRollupConsistent(self):
+        self.assertEqual(rebuild_spend_rollup(dry_run=True), {'created': 0, 'updated': 0, 'deleted': 0})
+
+    def spend(self, supplier):
+        return SupplierDailySpend.objects.filter(supplier=supplier).values('order_count', 'total_quantity', 'total_amount').get()
+
+    def test_rollup_follows_writes(self):
+        """
+            This test checks that creating, updating and deleting orders and line items keeps the rollup in sync
+        """
+        order = self.post(self.supplier)
+        self.post(self.supplier, quantity=3)
+        self.assertEqual(self.spend(self.supplier), {'order_count': 2, 'total_quantity': 5, 'total_amount': Decimal('56.00')})
+        self.assertRollupConsistent()
+
+        url = reverse('purchase-order-details', args=[order['id']])
+        data = self.order_data(self.supplier, quantity=4)
+        data['line_items'][0]['id'] = order['line_items'][0]['id']
+        self.client.put(url, data=json.dumps(data), content_type='application/json')
+        self.assertEqual(self.spend(self.supplier)['total_quantity'], 7)
+        self.assertRollupConsistent()
+
+        self.client.put(url, data=json.dumps(self.order_data(self.other_supplier, quantity=1)), content_type='application/json')
+        self.assertEqual(self.spend(self.supplier), {'order_count': 1, 'total_quantity': 3, 'total_amount': Decimal('33.60')})
+        self.assertEqual(self.spend(self.other_supplier), {'order_count': 1, 'total_quantity': 1, 'total_amount': Decimal('11.20')})
+        self.assertRollupConsistent()
+
+        purchase_order = PurchaseOrder.objects.get(pk=order['id'])
+        LineItem.objects.create(
+            item_name="Extra", quantity=5, price_without_tax=Decimal('1.00'), tax_name="GST 5%",
+            tax_amount=Decimal('0.05'), purchase_order=purchase_order,
+        )
+        LineItem.objects.filter(item_name="Test Product", purchase_order=purchase_order).get().delete()
+        self.assertEqual(self.spend(self.other_supplier)['total_quantity'], 5)
+        self.assertRollupConsistent()
+
+        self.client.delete(url)
+        self.assertFalse(SupplierDailySpend.objects.filter(supplier=self.other_supplier).exists())
+        self.assertRollupConsistent()
+
+        self.supplier.delete()
+        self.assertFalse(SupplierDailySpend.objects.filter(supplier_id=self.supplier.id).exists())
+
+    def test_resave_with_new_supplier(self):
+        """
+            This test checks that saving an existing order with another supplier moves its spend,
+            bumps its version and logs the change
+        """
+        order = PurchaseOrder.objects.get(pk=self.post(self.supplier)['id'])
+        after = OrderChange.objects.order_by('-sequence').values_list('sequence', flat=True).first()
+
+        order.supplier = self.other_supplier
+        order.save()
+        self.assertFalse(SupplierDailySpend.objects.filter(supplier=self.supplier).exists())
+        self.assertEqual(self.spend(self.other_supplier), {'order_count': 1, 'total_quantity': 2, 'total_amount': Decimal('22.40')})
+        self.assertRollupConsistent()
+        self.assertEqual(order.version, 2)
+        self.assertEqual(PurchaseOrder.objects.get(pk=order.pk).version, 2)
+        self.assertEqual(
+            list(OrderChange.objects.filter(sequence__gt=after).values_list('purchase_order_id', 'action', 'version')),
+            [(order.pk, OrderChange.UPDATED, 2)],
+        )
+
+        # Fields left out of update_fields are not moved
+        order.supplier = self.supplier
+        order.total_quantity = 1
+        order.save(update_fields=['total_quantity'])
+        self.assertEqual(self.spend(self.other_supplier)['total_quantity'], 1)
+        self.assertEqual(PurchaseOrder.objects.get(pk=order.pk).version, 3)
+        self.assertRollupConsistent()
+
+    def test_bulk_create_and_rebuild(self):
+        """
+            This test checks that bulk created orders are rolled up and that the rebuild command repairs drift
+        """
+        self.client.post(
+            reverse('purchase-order-bulk-create'),
+            data=json.dumps([self.order_data(self.supplier), self.order_data(self.other_supplier), self.order_data(self.supplier)]),
+            content_type='application/json',
+        )
+        self.assertEqual(self.spend(self.supplier)['order_count'], 2)
+        self.assertRollupConsistent()
+
+        SupplierDailySpend.objects.filter(supplier=self.supplier).update(total_amount=0)
+        SupplierDailySpend.objects.filter(supplier=self.other_supplier).delete()
+        out = StringIO()
+        call_command('rebuild_spend_rollup', stdout=out)
+        self.assertIn('1 rows were created, 1 updated and 0 deleted', out.getvalue())
+        self.assertRollupConsistent()
+
+    def test_spend_report(self):
+        """
+            This test checks that the report groups the rollup by day or month with date and supplier filters
+        """
+        for supplier, day, quantity in (
+            (self.supplier, '2024-01-05', 1), (self.supplier, '2024-01-20', 2),
+            (self.other_supplier, '2024-01-20', 3), (self.supplier, '2024-02-01', 4),
+        ):
+            SupplierDailySpend.objects.create(
+                supplier=supplier, day=day, order_count=1, total_quantity=quantity,
+                total_amount=Decimal('10.50') * quantity, total_tax=Decimal('0.50') * quantity,
+            )
+        url = reverse('spend-report')
+
+        with self.assertNumQueries(1):
+            response = self.client.get(url, {'period': 'month'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [(row['period'], row['supplier']['name'], row['order_count'], row['total_quantity']) for row in response.data['results']],
+            [('2024-01-01', "Supplier 1", 2, 3), ('2024-01-01', "Supplier 2", 1, 3), ('2024-02-01', "Supplier 1", 1, 4)],
+        )
+        self.assertEqual(response.json()['results'][0]['total_amount'], 31.5)
+
+        response = self.client.get(url, {'start': '2024-01-06', 'end': '2024-01-31', 'supplier': self.supplier.id})
+        self.assertEqual(
+            [(row['period'], row['total_quantity']) for row in response.data['results']], [('2024-01-20', 2)]
+        )
+
+        for params in ({'period': 'year'}, {'start': '2024-13-01'}, {'supplier': 'abc'}):
+            self.assertEqual(self.client.get(url, params).status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class JobQueueTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.results_dir = directory.name
+        results_dir = override_settings(PURCHASE_ORDER_JOB_RESULTS_DIR=directory.name)
+        results_dir.enable()
+        self.addCleanup(results_dir.disable)
+        self.supplier = Supplier.objects.create(name="Supplier 1", email="supplier@email.com")
+
+    def create_order(self, quantity=2):
+        data = {
+            "supplier": {"id": self.supplier.id, "name": self.supplier.name, "email": self.supplier.email},
+            "line_items": [
+                {"item_name": "Test Product", "quantity": quantity, "price_without_tax": "10.00", "tax_name": "GST 12%", "tax_amount": "1.20"},
+            ],
+        }
+        return self.client.post(reverse('purchase-order-list-create'), data=json.dumps(data), content_type='application/json')
+
+    def submit(self, job_type, params=None):
+        return self.client.post(
+            reverse('job-create'), data=json.dumps({"job_type": job_type, "params": params}), content_type='application/json'
+        )
+
+    def run_workers(self):
+        out = StringIO()
+        call_command('run_workers', '--workers', 1, '--burst', stdout=out)
+        return out.getvalue()
+
+    def test_order_export_job(self):
+        """
+            This test checks that a submitted export is run by the workers and that its result matches the export endpoint
+        """
+        self.create_order()
+        self.create_order(quantity=3)
+
+        response = self.submit('order_export', {'format': 'csv'})
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(response.data['status'], Job.QUEUED)
+        self.assertIsNone(response.data['result_url'])
+        self.assertTrue(response['Location'].endswith(reverse('job-details', args=[response.data['id']])))
+        job_url = response['Location']
+
+        result_url = reverse('job-result', args=[response.data['id']])
+        self.assertEqual(self.client.get(result_url).status_code, status.HTTP_409_CONFLICT)
+
+        self.assertIn('Ran 1 jobs', self.run_workers())
+        response = self.client.get(job_url)
+        self.assertEqual(response.data['status'], Job.SUCCEEDED)
+        self.assertEqual((response.data['progress'], response.data['total']), (2, 2))
+        self.assertTrue(response.data['result_url'].endswith(result_url))
+
+        response = self.client.get(result_url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        self.assertIn('filename="purchase_orders.csv"', response['Content-Disposition'])
+        export = self.client.get(reverse('purchase-order-export'), {'format': 'csv'})
+        self.assertEqual(b''.join(response.streaming_content), b''.join(export.streaming_content))
+
+    def test_spend_report_job(self):
+        """
+            This test checks that the spend report job writes one csv row per period and supplier
+        """
+        self.create_order()
+        self.create_order(quantity=3)
+        job_id = self.submit('spend_report', {'period': 'month', 'supplier': str(self.supplier.id)}).data['id']
+        self.run_workers()
+
+        response = self.client.get(reverse('job-result', args=[job_id]))
+        rows = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(rows[0], 'period,supplier_id,supplier_name,order_count,total_quantity,total_amount,total_tax')
+        self.assertEqual(rows[1].split(',')[1:], [str(self.supplier.id), "Supplier 1", '2', '5', '56.00', '2.40'])
+        self.assertEqual(len(rows), 2)
+
+    def test_invalid_jobs(self):
+        """
+            This test checks that invalid jobs are rejected when they are submitted
+        """
+        for job_type, params in (
+            ('unknown', {}), ('order_export', {'format': 'xml'}), ('order_export', []),
+            ('spend_report', {'period': 'year'}), ('spend_report', {'start': 'yesterday'}),
+        ):
+            response = self.submit(job_type, params)
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, (job_type, params))
+        self.assertFalse(Job.objects.exists())
+        self.assertEqual(self.client.get(reverse('job-details', args=[1])).status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_failed_job(self):
+        """
+            This test checks that an error in a job fails it without stopping the worker
+        """
+        failing = Job.objects.create(job_type='spend_report', params={'period': 'day'})
+        Job.objects.create(job_type='spend_report', params={'period': 'month'})
+        with mock.patch.object(JOB_TYPES['spend_report'], 'run', side_effect=[RuntimeError("Disk full"), None]):
+            self.assertIn('Ran 2 jobs', self.run_workers())
+
+        failing.refresh_from_db()
+        self.assertEqual((failing.status, failing.error), (Job.FAILED, "RuntimeError: Disk full"))
+        self.assertEqual(Job.objects.filter(status=Job.SUCCEEDED).count(), 1)
+        # The temporary file of the failed job is removed
+        self.assertEqual(os.listdir(self.results_dir), [f'{failing.id + 1}-spend_report_month.csv'])
+
+    def test_claim_and_requeue(self):
+        """
+            This test checks that jobs are claimed oldest first, that jobs without heartbeat are requeued and then failed,
+            and that a worker whose job was requeued stops
+        """
+        first = Job.objects.create(job_type='spend_report', params={'period': 'day'})
+        second = Job.objects.create(job_type='spend_report', params={'period': 'month'})
+
+        self.assertEqual(claim_job('worker-1').id, first.id)
+        self.assertEqual(claim_job('worker-2').id, second.id)
+        self.assertIsNone(claim_job('worker-3'))
+
+        with override_settings(PURCHASE_ORDER_JOB_TIMEOUT=60, PURCHASE_ORDER_JOB_MAX_ATTEMPTS=2):
+            Job.objects.filter(id=first.id).update(heartbeat_at=timezone.now() - timedelta(seconds=61))
+            self.assertEqual(requeue_stale_jobs(), (1, 0))
+            job = claim_job('worker-3')
+            self.assertEqual((job.id, job.attempts), (first.id, 2))
+
+            with self.assertRaises(JobLost):
+                JobProgress(Job(id=first.id, worker='worker-1')).set_total(1)
+
+            Job.objects.filter(id=first.id).update(heartbeat_at=timezone.now() - timedelta(seconds=61))
+            self.assertEqual(requeue_stale_jobs(), (0, 1))
+        self.assertEqual(Job.objects.get(id=first.id).status, Job.FAILED)
+
+        stale_job = Job.objects.get(id=second.id)
+        Job.objects.filter(id=second.id).update(worker='worker-4')
+        run_job(stale_job)
+        self.assertEqual(Job.objects.get(id=second.id).status, Job.RUNNING)
+        self.assertEqual(os.listdir(self.results_dir), [])
+
+    def test_purge_finished_jobs(self):
+        """
+            This test checks that finished jobs are deleted with their result file once their TTL has expired
+        """
+        job_id = self.submit('spend_report').data['id']
+        self.run_workers()
+        self.assertEqual(len(os.listdir(self.results_dir)), 1)
+
+        with override_settings(PURCHASE_ORDER_JOB_RESULT_TTL=60):
+            self.assertEqual(purge_finished_jobs(), 0)
+            Job.objects.filter(id=job_id).update(finished_at=timezone.now() - timedelta(seconds=61))
+            self.assertEqual(purge_finished_jobs(), 1)
+        self.assertFalse(Job.objects.exists())
+        self.assertEqual(os.listdir(self.results_dir), [])
+
+
+class BulkDeleteTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.supplier = Supplier.objects.create(name="Supplier 1", email="supplier@email.com")
+        self.other_supplier = Supplier.objects.create(name="Supplier 2", email="other@email.com")
+        self.url = reverse('purchase-order-bulk-delete')
+
+    def create_orders(self, supplier, order_time, count):
+        orders = []
+        for _ in range(count):
+            data = {
+                "supplier": {"id": supplier.id, "name": supplier.name, "email": supplier.email},
+                "line_items": [
+                    {"item_name": "Test Product", "quantity": 2, "price_without_tax": "10.00", "tax_name": "GST 12%", "tax_amount": "1.20"},
+                    {"item_name": "Other Product", "quantity": 1, "price_without_tax": "5.00", "tax_name": "GST 5%", "tax_amount": "0.25"},
+                ],
+            }
+            response = self.client.post(reverse('purchase-order-list-create'), data=json.dumps(data), content_type='application/json')
+            orders.append(response.data['id'])
+        PurchaseOrder.objects.filter(id__in=orders).update(order_time=order_time)
+        rebuild_spend_rollup()
+        return orders
+
+    def delete(self, **data):
+        return self.client.post(self.url, data=json.dumps(data), content_type='application/json')
+
+    def test_bulk_delete_by_filters(self):
+        """
+            This test checks that the orders matching the filters are deleted with their line items and
+            spend, with the same number of queries however many orders match
+        """
+        january = self.create_orders(self.supplier, '2024-01-10T10:00:00Z', 2)
+        february = self.create_orders(self.supplier, '2024-02-10T10:00:00Z', 6)
+        other = self.create_orders(self.other_supplier, '2024-01-10T10:00:00Z', 1)
+
+        with CaptureQueriesContext(connection) as january_queries:
+            response = self.delete(supplier_name="Supplier 1", order_time_before='2024-02-01')
+        self.assertEqual(response.data, {"dry_run": False, "orders": 2, "line_items": 4})
+
+        with CaptureQueriesContext(connection) as february_queries:
+            response = self.delete(supplier_name="Supplier 1", order_time_after='2024-02-01T00:00:00Z')
+        self.assertEqual(response.data, {"dry_run": False, "orders": 6, "line_items": 12})
+        self.assertEqual(len(january_queries), len(february_queries))
+
+        self.assertEqual(list(PurchaseOrder.objects.values_list('id', flat=True)), other)
+        self.assertFalse(LineItem.objects.filter(purchase_order_id__in=january + february).exists())
+        self.assertEqual(rebuild_spend_rollup(dry_run=True), {'created': 0, 'updated': 0, 'deleted': 0})
+
+        response = self.delete(ids=other)
+        self.assertEqual(response.data['orders'], 1)
+        self.assertFalse(PurchaseOrder.objects.exists())
+        self.assertFalse(SupplierDailySpend.objects.exists())
+
+    def test_dry_run_and_cap(self):
+        """
+            This test checks that a dry run only counts the orders and that requests above the cap delete nothing
+        """
+        orders = self.create_orders(self.supplier, '2024-01-10T10:00:00Z', 3)
+
+        response = self.delete(item_name="other", dry_run=True)
+        self.assertEqual(response.data, {"dry_run": True, "orders": 3, "line_items": 6})
+        self.assertEqual(PurchaseOrder.objects.count(), 3)
+        for dry_run in ("maybe", None, [True]):
+            response = self.delete(item_name="other", dry_run=dry_run)
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, dry_run)
+        self.assertEqual(PurchaseOrder.objects.count(), 3)
+
+        with override_settings(PURCHASE_ORDER_MAX_BULK_DELETE=2):
+            response = self.delete(item_name="other")
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+            self.assertEqual(PurchaseOrder.objects.count(), 3)
+
+            response = self.delete(ids=orders[:2], dry_run="false")
+            self.assertEqual(response.data['orders'], 2)
+            self.assertEqual(PurchaseOrder.objects.count(), 1)
+
+    def test_invalid_bulk_delete(self):
+        """
+            This test checks that a bulk delete without filters or with invalid filters is rejected
+        """
+        self.create_orders(self.supplier, '2024-01-10T10:00:00Z', 1)
+        for data in ({}, {"dry_run": True}, {"ids": "1,2"}, {"ids": [True]}, {"order_time_after": "January"}):
+            response = self.delete(**data)
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, data)
+        self.assertEqual(PurchaseOrder.objects.count(), 1)
+
+
+class QueryPlanTestCase(TestCase):
+    """
+        Checks with EXPLAIN that the list filters and orderings are served by the composite indexes.
+        On PostgreSQL sequential scans are disabled, so that the planner picks an index even on the tiny test tables
+        whenever one can serve the query.
+    """
+    def setUp(self):
+        self.supplier = Supplier.objects.create(name="Supplier 1", email="supplier@email.com")
+
+    def query_plan(self, query_params):
+        queryset = filter_purchase_orders(PurchaseOrder.objects.all(), query_params)
+        queryset = queryset.order_by(*parse_ordering(query_params))[:50]
+        with transaction.atomic():
+            if connection.vendor == 'postgresql':
+                with connection.cursor() as cursor:
+                    cursor.execute('SET LOCAL enable_seqscan = off')
+            return queryset.explain()
+
+    def assertUsesIndex(self, query_params, index_name=None):
+        """
+            Asserts that the list query reads the rows in order from an index, the given one if any
+        """
+        plan = self.query_plan(query_params)
+        if index_name is not None:
+            self.assertIn(index_name, plan, plan)
+        if connection.vendor == 'postgresql':
+            self.assertIn('Index', plan, plan)
+            self.assertNotIn('Seq Scan', plan, plan)
+            self.assertNotIn('Sort', plan, plan)
+        else:
+            self.assertIn('USING INDEX', plan, plan)
+            self.assertNotIn('TEMP B-TREE', plan, plan)
+
+    def test_filters_use_indexes(self):
+        """
+            This test checks that the default ordering, the order_time range and the supplier filter use an index
+        """
+        self.assertUsesIndex({}, 'purchase_order_time_id_idx')
+        self.assertUsesIndex({'order_time_after': '2024-01-01', 'order_time_before': '2024-02-01'}, 'purchase_order_time_id_idx')
+        self.assertUsesIndex({'supplier': str(self.supplier.id), 'order_time_after': '2024-01-01'}, 'purchase_order_supplier_idx')
+
+    def test_orderings_use_indexes(self):
+        """
+            This test checks that every ordering of the list endpoint reads its index in order instead of sorting
+        """
+        for field, index_name in (
+            ('total_amount', 'purchase_order_amount_idx'),
+            ('total_quantity', 'purchase_order_quantity_idx'),
+            ('total_tax', 'purchase_order_tax_idx'),
+        ):
+            self.assertUsesIndex({'ordering': field}, index_name)
+            self.assertUsesIndex({'ordering': f'-{field}'}, index_name)
+
+        # Served by the unique index of order_number, whose name depends on the database
+        self.assertUsesIndex({'ordering': '-order_number'})
+
+
+class OrderChangeFeedTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.async_client = AsyncClient()
+        self.supplier = Supplier.objects.create(name="Supplier 1", email="supplier@email.com")
+        self.url = reverse('purchase-order-changes')
+        self.async_url = reverse('async-purchase-order-changes')
+        sequence_gaps.clear()
+        self.addCleanup(sequence_gaps.clear)
+
+    def order_data(self, quantity=2):
+        return {
+            "supplier": {"id": self.supplier.id, "name": self.supplier.name, "email": self.supplier.email},
+            "line_items": [
+                {"item_name": "Test Product", "quantity": quantity, "price_without_tax": "10.00", "tax_name": "GST 12%", "tax_amount": "1.20"},
+            ],
+        }
+
+    def create_order(self):
+        response = self.client.post(reverse('purchase-order-list-create'), data=json.dumps(self.order_data()), content_type='application/json')
+        return response.data['id']
+
+    def last_sequence(self):
+        return OrderChange.objects.order_by('-sequence').values_list('sequence', flat=True).first() or 0
+
+    def logged(self, after):
+        return list(OrderChange.objects.filter(sequence__gt=after).order_by('sequence').values_list('purchase_order_id', 'action', 'version'))
+
+    def test_writes_are_logged(self):
+        """
+            This test checks that every write to an order or its line items logs its id, action and new version
+        """
+        after = self.last_sequence()
+        purchase_order_id = self.create_order()
+        self.assertEqual(self.logged(after), [(purchase_order_id, OrderChange.CREATED, 1)])
+
+        after = self.last_sequence()
+        url = reverse('purchase-order-details', args=[purchase_order_id])
+        response = self.client.put(url, data=json.dumps(self.order_data(quantity=3)), content_type='application/json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        version = PurchaseOrder.objects.get(pk=purchase_order_id).version
+        self.assertEqual(self.logged(after)[-1], (purchase_order_id, OrderChange.UPDATED, version))
+
+        after = self.last_sequence()
+        line_item = LineItem.objects.get(purchase_order_id=purchase_order_id)
+        line_item.quantity = 5
+        line_item.save()
+        self.assertEqual(self.logged(after), [(purchase_order_id, OrderChange.UPDATED, version + 1)])
+
+        # Renaming the supplier through another of its orders bumps the versions of all its orders
+        other_url = reverse('purchase-order-details', args=[self.create_order()])
+        after = self.last_sequence()
+        data = dict(self.order_data(), supplier={"id": self.supplier.id, "name": "Renamed Supplier", "email": self.supplier.email})
+        response = self.client.put(other_url, data=json.dumps(data), content_type='application/json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn((purchase_order_id, OrderChange.UPDATED, version + 2), self.logged(after))
+
+        after = self.last_sequence()
+        response = self.client.delete(url)
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(self.logged(after), [(purchase_order_id, OrderChange.DELETED, None)])
+
+    def test_bulk_writes_are_logged(self):
+        """
+            This test checks that the orders of a bulk create and a bulk delete are logged
+        """
+        after = self.last_sequence()
+        response = self.client.post(
+            reverse('purchase-order-bulk-create'), data=json.dumps([self.order_data(), self.order_data()]), content_type='application/json',
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        order_ids = [order['id'] for order in response.data['created']]
+        self.assertEqual(self.logged(after), [(order_id, OrderChange.CREATED, 1) for order_id in order_ids])
+
+        after = self.last_sequence()
+        response = self.client.post(
+            reverse('purchase-order-bulk-delete'), data=json.dumps({'ids': order_ids}), content_type='application/json',
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(sorted(self.logged(after)), [(order_id, OrderChange.DELETED, None) for order_id in sorted(order_ids)])
+
+        # Deleting a supplier logs the orders deleted by the cascade
+        purchase_order_id = self.create_order()
+        after = self.last_sequence()
+        self.supplier.delete()
+        self.assertEqual(self.logged(after), [(purchase_order_id, OrderChange.DELETED, None)])
+
+    def test_feed_returns_changes_after_cursor(self):
+        """
+            This test checks that the feed returns the changes in sequence order, page by page with its cursor
+        """
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['changes'], [])
+        cursor = response.data['cursor']
+
+        order_ids = [self.create_order() for _ in range(3)]
+        response = self.client.get(self.url, {'after': cursor, 'limit': 2})
+        changes = response.data['changes']
+        self.assertEqual([change['sequence'] for change in changes], [cursor + 1, cursor + 2])
+        self.assertEqual([change['purchase_order_id'] for change in changes], order_ids[:2])
+        self.assertEqual(changes[0]['action'], 'created')
+        self.assertEqual(changes[0]['version'], 1)
+        self.assertEqual(response.data['cursor'], cursor + 2)
+
+        response = self.client.get(self.url, {'after': response.data['cursor']})
+        self.assertEqual(len(response.data['changes']), 1)
+        self.assertEqual(response.data['changes'][-1]['purchase_order_id'], order_ids[2])
+        response = self.client.get(self.url, {'after': response.data['cursor']})
+        self.assertEqual(response.data['changes'], [])
+
+    def test_feed_invalid_and_expired_cursors(self):
+        """
+            This test checks that an invalid cursor is rejected and that a purged one is gone
+        """
+        for params in ({'after': 'abc'}, {'after': '-1'}, {'limit': '0'}):
+            response = self.client.get(self.url, params)
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, params)
+
+        self.create_order()
+        cursor = self.last_sequence()
+        for _ in range(2):
+            self.create_order()
+        OrderChange.objects.update(changed_at=timezone.now() - timedelta(days=8))
+        self.create_order()
+        self.assertEqual(purge_order_changes(), 3)
+
+        response = self.client.get(self.url, {'after': cursor})
+        self.assertEqual(response.status_code, status.HTTP_410_GONE)
+        # The start of the log is always readable
+        response = self.client.get(self.url, {'after': 0})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([change['sequence'] for change in response.data['changes']], [cursor + 3])
+
+    def test_gap_holds_back_later_changes(self):
+        """
+            This test checks that the changes after a missing sequence number wait for it until GAP_TIMEOUT
+            seconds after it was first seen missing
+        """
+        self.create_order()
+        cursor = self.last_sequence()
+        OrderChange.objects.create(sequence=cursor + 2, purchase_order_id=1, action=OrderChange.UPDATED, version=2)
+
+        response = self.client.get(self.url, {'after': cursor})
+        self.assertEqual(response.data['changes'], [])
+        self.assertEqual(response.data['cursor'], cursor)
+
+        # The transaction which took the missing number rolled back
+        with mock.patch('purchase_order.changes.time.monotonic', return_value=time.monotonic() + 11):
+            response = self.client.get(self.url, {'after': cursor})
+        self.assertEqual([change['sequence'] for change in response.data['changes']], [cursor + 2])
+
+    def test_late_commit_is_delivered(self):
+        """
+            This test checks that a change committed long after it took its sequence number is still delivered,
+            the gap being timed from when it was first seen and not from the age of the changes after it
+        """
+        self.create_order()
+        cursor = self.last_sequence()
+        OrderChange.objects.create(sequence=cursor + 2, purchase_order_id=1, action=OrderChange.UPDATED, version=2)
+        OrderChange.objects.update(changed_at=timezone.now() - timedelta(minutes=5))
+
+        response = self.client.get(self.url, {'after': cursor})
+        self.assertEqual(response.data['changes'], [])
+
+        # The long transaction commits below the changes already visible
+        OrderChange.objects.create(sequence=cursor + 1, purchase_order_id=1, action=OrderChange.UPDATED, version=1)
+        response = self.client.get(self.url, {'after': cursor})
+        self.assertEqual([change['sequence'] for change in response.data['changes']], [cursor + 1, cursor + 2])
+
+    def test_purge_order_changes_command(self):
+        """
+            This test checks that the command deletes the changes older than the given number of days
+        """
+        self.create_order()
+        OrderChange.objects.update(changed_at=timezone.now() - timedelta(days=2))
+        self.create_order()
+        output = StringIO()
+        call_command('purge_order_changes', days=1, stdout=output)
+        self.assertIn("Deleted 1 expired order changes", output.getvalue())
+        self.assertEqual(OrderChange.objects.count(), 1)
+
+    @override_settings(PURCHASE_ORDER_CHANGE_FEED={'POLL_INTERVAL': 0.01})
+    async def test_async_long_poll(self):
+        """
+            This test checks that the long-poll returns the pending changes at once, or none after its timeout
+        """
+        purchase_order_id = await sync_to_async(self.create_order)()
+        response = await self.async_client.get(self.async_url, {'after': 0})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()['changes'][0]['purchase_order_id'], purchase_order_id)
+
+        response = await self.async_client.get(self.async_url, {'after': response.json()['cursor'], 'timeout': '0.05'})
+        self.assertEqual(response.json()['changes'], [])
+
+        response = await self.async_client.get(self.async_url, {'timeout': 'soon'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    @override_settings(PURCHASE_ORDER_CHANGE_FEED={'MAX_STREAM_DURATION': 0, 'BATCH_SIZE': 1})
+    async def test_async_event_stream(self):
+        """
+            This test checks that the SSE stream sends the changes as events, resumes after Last-Event-ID
+            and is refused once MAX_STREAMS are open
+        """
+        cursor = await sync_to_async(self.last_sequence)()
+        purchase_order_id = await sync_to_async(self.create_order)()
+        await sync_to_async(self.create_order)()
+
+        response = await self.async_client.get(self.async_url, {'after': cursor}, headers={'Accept': 'text/event-stream'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        content = b''.join([chunk async for chunk in response.streaming_content]).decode()
+        self.assertTrue(content.startswith('retry: '))
+        # One batch of BATCH_SIZE changes is sent before the stream ends
+        self.assertIn(f'id: {cursor + 1}\nevent: change\ndata: ', content)
+        self.assertIn(f'"purchase_order_id":{purchase_order_id}', content)
+        self.assertNotIn(f'id: {cursor + 2}\n', content)
+
+        response = await self.async_client.get(
+            self.async_url, {'after': cursor}, headers={'Accept': 'text/event-stream', 'Last-Event-ID': str(cursor + 1)},
+        )
+        content = b''.join([chunk async for chunk in response.streaming_content]).decode()
+        self.assertIn(f'id: {cursor + 2}\n', content)
+
+        with override_settings(PURCHASE_ORDER_CHANGE_FEED={'MAX_STREAMS': 0}):
+            response = await self.async_client.get(self.async_url, headers={'Accept': 'text/event-stream'})
+        self.assertEqual(response.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertIn('Retry-After', response)
+
+    @override_settings(PURCHASE_ORDER_CHANGE_FEED={'MAX_STREAM_DURATION': 0})
+    async def test_dropped_event_stream_holds_no_slot(self):
+        """
+            This test checks that a stream whose client went away before its first chunk does not keep a slot,
+            and that a started stream holds one until it ends
+        """
+        open_streams = change_streams.open
+        response = await self.async_client.get(self.async_url, headers={'Accept': 'text/event-stream'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(change_streams.open, open_streams)
+
+        content = aiter(response.streaming_content)
+        await anext(content)
+        self.assertEqual(change_streams.open, open_streams + 1)
+        async for _ in content:
+            pass
+        self.assertEqual(change_streams.open, open_streams)
+
+
+class ArchiveOrdersTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.supplier = Supplier.objects.create(name="Supplier 1", email="supplier@email.com")
+        self.order_ids = []
+        for index in range(5):
+            data = {
+                "supplier": {"id": self.supplier.id, "name": self.supplier.name, "email": self.supplier.email},
+                "line_items": [
+                    {"item_name": f"Product {index}", "quantity": index + 1, "price_without_tax": "10.00", "tax_name": "GST 5%", "tax_amount": "0.50"},
+                    {"item_name": "Common Product", "quantity": 1, "price_without_tax": "1.00", "tax_name": "GST 5%", "tax_amount": "0.05"},
+                ],
+            }
+            response = self.client.post(reverse('purchase-order-list-create'), data=json.dumps(data), content_type='application/json')
+            self.order_ids.append(response.data['id'])
+        # The first three orders are older than PURCHASE_ORDER_ARCHIVE_AFTER_DAYS
+        for age, order_id in zip((300, 200, 100, 10, 1), self.order_ids):
+            PurchaseOrder.objects.filter(pk=order_id).update(order_time=timezone.now() - timedelta(days=age))
+        rebuild_spend_rollup()
+
+    def archive(self, *args):
+        output = StringIO()
+        call_command('archive_orders', *args, stdout=output)
+        return output.getvalue()
+
+    def list_ids(self, url, **params):
+        ids = []
+        url = url + '?' + urlencode(params)
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            ids += [order['id'] for order in response.data['results']]
+            url = response.data['next']
+        return ids
+
+    def test_archive_orders_command(self):
+        """
+            This test checks that the old orders and their line items are moved to the archive in batches,
+            unchanged and still counted by the spend rollup
+        """
+        detail = self.client.get(reverse('purchase-order-details', args=[self.order_ids[0]])).data
+
+        self.assertIn("3 orders and 6 line items would be archived", self.archive('--dry-run'))
+        self.assertEqual(PurchaseOrder.objects.count(), 5)
+
+        self.assertIn("Archived 3 orders and 6 line items", self.archive('--batch-size', '2'))
+        self.assertEqual(sorted(PurchaseOrder.objects.values_list('id', flat=True)), self.order_ids[3:])
+        self.assertEqual(sorted(ArchivedPurchaseOrder.objects.values_list('id', flat=True)), self.order_ids[:3])
+        self.assertEqual(ArchivedLineItem.objects.count(), 6)
+        self.assertEqual(LineItem.objects.count(), 4)
+        self.assertEqual(rebuild_spend_rollup(dry_run=True), {'created': 0, 'updated': 0, 'deleted': 0})
+
+        response = self.client.get(reverse('purchase-order-details', args=[self.order_ids[0]]))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, detail)
+
+        self.assertIn("Archived 1 orders and 2 line items", self.archive('--days', '5'))
+        self.assertIn("Archived 0 orders", self.archive('--days', '5'))
+
+    def test_detail_falls_back_to_archive(self):
+        """
+            This test checks that archived orders are returned by the detail endpoints with their validators,
+            and cannot be changed
+        """
+        url = reverse('purchase-order-details', args=[self.order_ids[0]])
+        before = self.client.get(url)
+        self.archive()
+
+        response = self.client.get(url)
+        self.assertEqual(response.data, before.data)
+        self.assertEqual(response['ETag'], before['ETag'])
+        response = self.client.get(url, {'fields': 'order_number', 'expand': 'line_items'})
+        self.assertEqual(len(response.data['line_items']), 2)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=before['ETag'])
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        response = self.client.put(url, data=json.dumps({"supplier": {"id": self.supplier.id}, "line_items": []}), content_type='application/json')
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        response = self.client.delete(url)
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertTrue(ArchivedPurchaseOrder.objects.filter(pk=self.order_ids[0]).exists())
+
+        # Renaming the supplier changes the representation of its archived orders
+        Supplier.objects.filter(pk=self.supplier.pk).update(name="Renamed Supplier")
+        touch_supplier_orders(self.supplier.pk)
+        response = self.client.get(url)
+        self.assertNotEqual(response['ETag'], before['ETag'])
+        self.assertEqual(response.data['supplier']['name'], "Renamed Supplier")
+
+    def test_list_reads_archive_on_request(self):
+        """
+            This test checks that the list only returns the archived orders with ?include_archived=1,
+            merged into the pages in the requested ordering
+        """
+        self.archive()
+        url = reverse('purchase-order-list-create')
+        self.assertEqual(self.list_ids(url), self.order_ids[:2:-1])
+        self.assertEqual(self.list_ids(url, include_archived=1, page_size=2), self.order_ids[::-1])
+        self.assertEqual(self.list_ids(url, include_archived=1, page_size=2, ordering='order_time'), self.order_ids)
+        self.assertEqual(self.list_ids(url, include_archived=1, page_size=3, ordering='-total_amount'), self.order_ids[::-1])
+        self.assertEqual(self.list_ids(url, include_archived=1, item_name='Product 1'), [self.order_ids[1]])
+        self.assertEqual(self.list_ids(url, include_archived=1, expand='line_items', fields='id'), self.order_ids[::-1])
+
+        response = self.client.get(url, {'include_archived': 1, 'page_size': 5})
+        self.assertEqual([len(order['line_items']) for order in response.data['results']], [2] * 5)
+        response = self.client.get(url, {'include_archived': 'yes'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_order_numbers_continue_after_archive(self):
+        """
+            This test checks that order numbers are not reused once the newest orders are archived
+        """
+        self.archive('--days', '0')
+        OrderNumberCounter.objects.all().delete()
+        purchase_order = PurchaseOrder.objects.create(supplier=self.supplier)
+        self.assertEqual(purchase_order.order_number, ArchivedPurchaseOrder.objects.count() + 1)
+
+    async def test_async_views_read_archive(self):
+        """
+            This test checks the archive fallback of the async detail view and ?include_archived=1 of the async list
+        """
+        await sync_to_async(self.archive)()
+        client = AsyncClient()
+        response = await client.get(reverse('async-purchase-order-details', args=[self.order_ids[0]]))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.json()['line_items']), 2)
+        response = await client.delete(reverse('async-purchase-order-details', args=[self.order_ids[0]]))
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+
+        url = reverse('async-purchase-order-list-create')
+        response = await client.get(url, {'include_archived': 1})
+        sync_response = await sync_to_async(self.client.get)(reverse('purchase-order-list-create'), {'include_archived': 1})
+        self.assertEqual(response.json()['results'], json.loads(sync_response.content)['results'])
+        self.assertEqual(len(response.json()['results']), 5)
+
+
+class PrecomputedSchemaTestCase(SimpleTestCase):
+    def setUp(self):
+        self.url = reverse('schema')
+        with open(schema_file(), 'rb') as file:
+            self.schema_yaml = file.read()
+
+    def test_schema_matches_code(self):
+        """
+            This test fails when the checked in schema.yml drifts from the views and serializers,
+            regenerate it with `python manage.py spectacular --file schema.yml`
+        """
+        self.assertEqual(get_schema().drift(), [])
+
+    def test_schema_served_from_memory(self):
+        """
+            This test checks that the schema file is served as is, without introspecting the views
+        """
+        with mock.patch('purchase_order.schema.generate_schema') as generate_schema:
+            response = self.client.get(self.url)
+            self.client.get(self.url)
+        generate_schema.assert_not_called()
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Type'], 'application/vnd.oai.openapi; charset=utf-8')
+        self.assertEqual(response.content, self.schema_yaml)
+
+        response = self.client.get(self.url, {'format': 'json'})
+        self.assertEqual(response.json(), yaml.safe_load(self.schema_yaml))
+        response = self.client.get(self.url, HTTP_ACCEPT='application/vnd.oai.openapi+json')
+        self.assertEqual(response['Content-Type'], 'application/vnd.oai.openapi+json; charset=utf-8')
+
+    def test_schema_gzip_and_etag(self):
+        """
+            This test checks that gzipped and plain responses have their own ETag and are revalidated with 304
+        """
+        response = self.client.get(self.url, HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(response.content), self.schema_yaml)
+        self.assertIn('Accept-Encoding', response['Vary'])
+        gzipped_etag = response['ETag']
+
+        plain = self.client.get(self.url)
+        self.assertNotIn('Content-Encoding', plain)
+        self.assertNotEqual(plain['ETag'], gzipped_etag)
+
+        response = self.client.get(self.url, HTTP_ACCEPT_ENCODING='gzip', HTTP_IF_NONE_MATCH=gzipped_etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response['ETag'], gzipped_etag)
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=gzipped_etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_schema_drift_check(self):
+        """
+            This test checks that the deploy check fails when the schema file no longer matches the code,
+            and that the schema is generated when the file is missing
+        """
+        schema = yaml.safe_load(self.schema_yaml)
+        del schema['paths']['/api/purchase/orders/changes/']
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'schema.yml')
+            with open(path, 'w') as file:
+                yaml.safe_dump(schema, file)
+            with override_settings(PURCHASE_ORDER_SCHEMA_FILE=path):
+                with self.assertRaisesMessage(SystemCheckError, 'paths: /api/purchase/orders/changes/'):
+                    call_command('check', deploy=True, tags=['schema'], stdout=StringIO(), stderr=StringIO())
+
+            with override_settings(PURCHASE_ORDER_SCHEMA_FILE=os.path.join(directory, 'missing.yml')):
+                response = self.client.get(self.url, {'format': 'json'})
+                self.assertIn('/api/purchase/orders/changes/', response.json()['paths'])
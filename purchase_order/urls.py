@@ -1,7 +1,25 @@
 from django.urls import path
-from .views import PurchaseOrderListCreateView, PurchaseOrderDetailsView
+from .views import (
+    PurchaseOrderListCreateView, PurchaseOrderDetailsView, PurchaseOrderBulkCreateView,
+    PurchaseOrderBulkDeleteView, PurchaseOrderChangesView, PurchaseOrderExportView, PurchaseOrderSearchView, PurchaseOrderCacheStatsView, SpendReportView,
+    JobCreateView, JobDetailsView, JobResultView,
+)
+from .async_views import AsyncPurchaseOrderListCreateView, AsyncPurchaseOrderDetailsView, AsyncPurchaseOrderChangesView
 
 urlpatterns = [
     path('purchase/orders/', PurchaseOrderListCreateView.as_view(), name='purchase-order-list-create'),
+    path('purchase/orders/bulk/', PurchaseOrderBulkCreateView.as_view(), name='purchase-order-bulk-create'),
+    path('purchase/orders/bulk-delete/', PurchaseOrderBulkDeleteView.as_view(), name='purchase-order-bulk-delete'),
+    path('purchase/orders/export/', PurchaseOrderExportView.as_view(), name='purchase-order-export'),
+    path('purchase/orders/search/', PurchaseOrderSearchView.as_view(), name='purchase-order-search'),
+    path('purchase/orders/changes/', PurchaseOrderChangesView.as_view(), name='purchase-order-changes'),
+    path('purchase/orders/cache-stats/', PurchaseOrderCacheStatsView.as_view(), name='purchase-order-cache-stats'),
     path('purchase/orders/<int:id>/', PurchaseOrderDetailsView.as_view(), name='purchase-order-details'),
+    path('purchase/reports/spend/', SpendReportView.as_view(), name='spend-report'),
+    path('purchase/jobs/', JobCreateView.as_view(), name='job-create'),
+    path('purchase/jobs/<int:id>/', JobDetailsView.as_view(), name='job-details'),
+    path('purchase/jobs/<int:id>/result/', JobResultView.as_view(), name='job-result'),
+    path('async/purchase/orders/', AsyncPurchaseOrderListCreateView.as_view(), name='async-purchase-order-list-create'),
+    path('async/purchase/orders/changes/', AsyncPurchaseOrderChangesView.as_view(), name='async-purchase-order-changes'),
+    path('async/purchase/orders/<int:id>/', AsyncPurchaseOrderDetailsView.as_view(), name='async-purchase-order-details'),
 ]
@@ -1,10 +1,88 @@
+import logging
+
+from django.conf import settings
+from django.http import FileResponse, StreamingHttpResponse
+from django.urls import reverse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
-from .models import Supplier, LineItem, PurchaseOrder
-from .serializers import SupplierSerializer, LineItemSerializer, PurchaseOrderSerializer
+from rest_framework.exceptions import ValidationError
+from rest_framework.fields import BooleanField
+from .models import Supplier, LineItem, PurchaseOrder, ArchivedLineItem, ArchivedPurchaseOrder, Job, VERSION_FIELDS
+from .serializers import LineItemSerializer, PurchaseOrderSerializer, JobSerializer, bulk_create_purchase_orders, bulk_delete_purchase_orders
+from .pagination import PurchaseOrderCursorPagination, parse_ordering
+from .filters import filter_purchase_orders, filter_selected_orders, include_archived
+from .search import search_purchase_orders
+from .cache import get_response_cache
+from .exports import EXPORTERS
+from .renderers import NDJSONRenderer, CSVRenderer
+from .read_serializers import FIELDS, order_rows, selected_fields, serialize_order_rows
+from .idempotency import idempotent
+from .suppliers import resolve_supplier
+from .reporting import spend_report, spend_report_params
+from .jobs import JOB_TYPES, clean_job, result_path
+from .changes import CursorExpired, log_bounds, parse_cursor, parse_limit, read_changes, serialize_change, start_cursor
+from drf_spectacular.types import OpenApiTypes
 from drf_spectacular.utils import extend_schema, extend_schema_view
 
+logger = logging.getLogger(__name__)
+
+ARCHIVED_ORDER_ERROR = "Archived purchase orders cannot be changed."
+
+
+def create_purchase_order(request, data):
+    """
+        Creates a PurchaseOrder from the data of a request, shared by the sync and async views
+    """
+    serializer = PurchaseOrderSerializer(data=data)
+    
+    if serializer.is_valid():
+        supplier_data = serializer.validated_data.get('supplier', {})
+        
+        supplier_id = supplier_data.get('id')
+        
+        if supplier_id is not None:
+            supplier_instance = Supplier.objects.filter(id=supplier_id).first()
+            
+            if not supplier_instance:
+                return Response({"error": "Supplier with provided id does not exist."}, status=status.HTTP_400_BAD_REQUEST)
+        else:
+            # If no supplier id is provided, use the supplier with that email, creating it if needed
+            supplier_instance = resolve_supplier(supplier_data['name'], supplier_data['email'])
+            
+        serializer.validated_data['supplier'] = supplier_instance
+        
+        purchase_order_instance = serializer.save()
+        
+        response_serializer = PurchaseOrderSerializer(purchase_order_instance)
+        return Response(response_serializer.data, status=status.HTTP_201_CREATED)
+    else:
+        logger.info("Invalid purchase order data", extra={'path': request.path, 'errors': serializer.errors})
+        return Response({"error": "Invalid purchase order data."}, status=status.HTTP_400_BAD_REQUEST)
+
+
+def update_purchase_order(request, id, data):
+    """
+        Updates the PurchaseOrder with given id from the data of a request, shared by the sync and async views
+    """
+    try:
+        purchase_order = PurchaseOrder.objects.select_related('supplier').get(pk=id)
+    except PurchaseOrder.DoesNotExist:
+        if ArchivedPurchaseOrder.objects.filter(pk=id).exists():
+            return Response({'error': ARCHIVED_ORDER_ERROR}, status=status.HTTP_409_CONFLICT)
+        return Response({'error': 'Purchase Order not found'}, status=status.HTTP_404_NOT_FOUND)
+
+    serializer = PurchaseOrderSerializer(instance=purchase_order, data=data)
+    if serializer.is_valid():
+        purchase_order_instance = serializer.save()
+        headers = validator_headers(purchase_order_instance.id, purchase_order_instance.version, purchase_order_instance.updated_at)
+        return Response(dict(serializer.data, changes=serializer.changes), status=status.HTTP_200_OK, headers=headers)
+    else:
+        logger.info("Invalid purchase order data", extra={'path': request.path, 'purchase_order_id': id, 'errors': serializer.errors})
+        return Response({"error": "Invalid purchase order data."}, status=status.HTTP_400_BAD_REQUEST)
+
 
 @extend_schema_view(
     get=extend_schema(summary="List all purchase orders", operation_id="list_purchase_orders"),
@@ -12,59 +90,189 @@ from drf_spectacular.utils import extend_schema, extend_schema_view
 )
 class PurchaseOrderListCreateView(APIView):
     serializer_class = PurchaseOrderSerializer 
+    pagination_class = PurchaseOrderCursorPagination
 
     def get(self, request, *args, **kwargs):
         """
-            This method gets all the PurchaseOrders 
+            This method gets the PurchaseOrders matching the filters one page at a time in the ?ordering= order,
+            with only the fields selected by ?fields= and ?expand=. The archived orders are only read
+            with ?include_archived=1.
         """
-        queryset = PurchaseOrder.objects.all()
-
-        supplier_name = self.request.query_params.get('supplier_name', None)
-        item_name = self.request.query_params.get('item_name', None)
+        try:
+            fields = selected_fields(self.request.query_params)
+            ordering = parse_ordering(self.request.query_params)
+            queryset = filter_purchase_orders(PurchaseOrder.objects.all(), self.request.query_params)
+            archived_queryset = None
+            if include_archived(self.request.query_params):
+                archived_queryset = filter_purchase_orders(ArchivedPurchaseOrder.objects.all(), self.request.query_params)
+        except ValueError as error:
+            return Response({"error": str(error)}, status=status.HTTP_400_BAD_REQUEST)
 
-        if supplier_name:
-            queryset = queryset.filter(supplier__name__icontains=supplier_name)
+        paginator = self.pagination_class()
+        # The rows carry the ordering column, which positions the cursor
+        rows = order_rows(queryset, ordering[0].lstrip('-'), fields=fields)
+        if archived_queryset is None:
+            page = paginator.paginate_queryset(rows, request, view=self)
+            line_item_models = (LineItem,)
+        else:
+            archived_rows = order_rows(archived_queryset, ordering[0].lstrip('-'), fields=fields)
+            page = paginator.paginate_querysets([rows, archived_rows], request, view=self)
+            line_item_models = (LineItem, ArchivedLineItem)
+        return paginator.get_paginated_response(
+            serialize_order_rows(page, using=queryset.db, fields=fields, line_item_models=line_item_models)
+        )
 
-        if item_name:
-            queryset = queryset.filter(line_items__item_name__icontains=item_name)
+    @idempotent
+    def post(self, request, *args, **kwargs):
+        """
+            This method creates new PurchaseOrder
+        """
+        return create_purchase_order(request, request.data)
+    
 
-        serializer = PurchaseOrderSerializer(queryset, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+@extend_schema_view(
+    post=extend_schema(summary="Create many purchase orders", operation_id="bulk_create_purchase_orders")
+)
+class PurchaseOrderBulkCreateView(APIView):
+    serializer_class = PurchaseOrderSerializer
 
     def post(self, request, *args, **kwargs):
         """
-            This method creates new PurchaseOrder
+            This method creates a list of PurchaseOrders in one transaction,
+            the orders that fail validation are reported by index without failing the others
         """
-        serializer = PurchaseOrderSerializer(data=request.data)
-        
-        if serializer.is_valid():
-            supplier_data = serializer.validated_data.get('supplier', {})
-            
-            supplier_id = supplier_data.get('id')
-            
-            if supplier_id is not None:
-                supplier_instance = Supplier.objects.filter(id=supplier_id).first()
-                
-                if not supplier_instance:
-                    return Response({"error": "Supplier with provided id does not exist."}, status=status.HTTP_400_BAD_REQUEST)
+        if not isinstance(request.data, list) or not request.data:
+            return Response({"error": "Expected a non empty list of purchase orders."}, status=status.HTTP_400_BAD_REQUEST)
+
+        max_size = getattr(settings, 'PURCHASE_ORDER_MAX_BULK_SIZE', 1000)
+        if len(request.data) > max_size:
+            return Response({"error": f"At most {max_size} purchase orders can be created at once."}, status=status.HTTP_400_BAD_REQUEST)
+
+        validated_orders = []
+        errors = {}
+        for index, order_data in enumerate(request.data):
+            serializer = PurchaseOrderSerializer(data=order_data)
+            if serializer.is_valid():
+                validated_orders.append((index, serializer.validated_data))
             else:
-                # If no supplier id is provided, create a new supplier
-                supplier_serializer = SupplierSerializer(data=supplier_data)
-                if supplier_serializer.is_valid():
-                    supplier_instance = supplier_serializer.save()
-                else:
-                    return Response({"error": "Invalid supplier data."}, status=status.HTTP_400_BAD_REQUEST)
-                
-            serializer.validated_data['supplier'] = supplier_instance
-            
-            purchase_order_instance = serializer.save()
-            
-            response_serializer = PurchaseOrderSerializer(purchase_order_instance)
-            return Response(response_serializer.data, status=status.HTTP_201_CREATED)
-        else:
-            print(serializer.errors)
-            return Response({"error": "Invalid purchase order data."}, status=status.HTTP_400_BAD_REQUEST)
-    
+                errors[index] = serializer.errors
+
+        orders, creation_errors = bulk_create_purchase_orders(validated_orders)
+        errors.update(creation_errors)
+
+        response_data = {
+            "created": [
+                {"index": index, "id": purchase_order.id, "order_number": purchase_order.order_number}
+                for index, purchase_order in orders.items()
+            ],
+            "errors": [{"index": index, "errors": errors[index]} for index in sorted(errors)],
+        }
+        response_status = status.HTTP_207_MULTI_STATUS if errors else status.HTTP_201_CREATED
+        return Response(response_data, status=response_status)
+
+
+SELECTION_PARAMS = ('supplier_name', 'item_name', 'supplier', 'ids', 'order_time_after', 'order_time_before')
+
+
+@extend_schema_view(
+    post=extend_schema(
+        summary="Delete the purchase orders matching filters", operation_id="bulk_delete_purchase_orders",
+        request=OpenApiTypes.OBJECT, responses=OpenApiTypes.OBJECT,
+    )
+)
+class PurchaseOrderBulkDeleteView(APIView):
+
+    def post(self, request, *args, **kwargs):
+        """
+            This method deletes the PurchaseOrders matching the list filters, ids and order_time range of the body
+            in one transaction, or only counts them with "dry_run": true
+        """
+        if not isinstance(request.data, dict):
+            return Response({"error": "Expected an object of filters."}, status=status.HTTP_400_BAD_REQUEST)
+        if not any(request.data.get(param) not in (None, '') for param in SELECTION_PARAMS):
+            return Response(
+                {"error": f"At least one of {', '.join(SELECTION_PARAMS)} is required."}, status=status.HTTP_400_BAD_REQUEST
+            )
+        try:
+            queryset = filter_selected_orders(PurchaseOrder.objects.all(), request.data)
+        except ValueError as error:
+            return Response({"error": str(error)}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            dry_run = BooleanField().to_internal_value(request.data.get('dry_run', False))
+        except ValidationError:
+            return Response({"error": "dry_run must be a boolean."}, status=status.HTTP_400_BAD_REQUEST)
+
+        if dry_run:
+            orders = queryset.count()
+            line_items = LineItem.objects.filter(purchase_order__in=queryset).count()
+            return Response({"dry_run": True, "orders": orders, "line_items": line_items}, status=status.HTTP_200_OK)
+
+        max_count = getattr(settings, 'PURCHASE_ORDER_MAX_BULK_DELETE', 10000)
+        try:
+            orders, line_items = bulk_delete_purchase_orders(queryset, max_count)
+        except ValueError as error:
+            return Response({"error": str(error)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({"dry_run": False, "orders": orders, "line_items": line_items}, status=status.HTTP_200_OK)
+
+
+@extend_schema_view(
+    get=extend_schema(
+        summary="Export purchase orders as ndjson or csv", operation_id="export_purchase_orders",
+        responses={(200, 'application/x-ndjson'): OpenApiTypes.STR, (200, 'text/csv'): OpenApiTypes.STR},
+    )
+)
+class PurchaseOrderExportView(APIView):
+    renderer_classes = [NDJSONRenderer, CSVRenderer]
+
+    def get(self, request, *args, **kwargs):
+        """
+            This method streams all the PurchaseOrders matching the list filters, selected with ?format=ndjson|csv
+        """
+        exporter, content_type = EXPORTERS[request.accepted_renderer.format]
+        try:
+            queryset = filter_purchase_orders(PurchaseOrder.objects.all(), self.request.query_params)
+        except ValueError as error:
+            return Response({"error": str(error)}, status=status.HTTP_400_BAD_REQUEST)
+
+        response = StreamingHttpResponse(exporter(queryset), content_type=content_type)
+        response['Content-Disposition'] = f'attachment; filename="purchase_orders.{request.accepted_renderer.format}"'
+        return response
+
+
+@extend_schema_view(
+    get=extend_schema(summary="Search purchase orders by supplier or item name", operation_id="search_purchase_orders")
+)
+class PurchaseOrderSearchView(APIView):
+    serializer_class = PurchaseOrderSerializer
+
+    def get(self, request, *args, **kwargs):
+        """
+            This method returns the PurchaseOrders whose supplier or line item names contain ?q=, most relevant first
+        """
+        term = self.request.query_params.get('q', '').strip()
+        if not term:
+            return Response({"error": "Search term q is required."}, status=status.HTTP_400_BAD_REQUEST)
+
+        max_limit = getattr(settings, 'PURCHASE_ORDER_MAX_SEARCH_RESULTS', 100)
+        try:
+            limit = min(int(self.request.query_params.get('limit', max_limit)), max_limit)
+        except ValueError:
+            return Response({"error": "limit must be an integer."}, status=status.HTTP_400_BAD_REQUEST)
+
+        queryset = search_purchase_orders(PurchaseOrder.objects.all(), term)[:max(limit, 0)]
+        return Response({"results": serialize_order_rows(order_rows(queryset), using=queryset.db)}, status=status.HTTP_200_OK)
+
+
+def validator_headers(purchase_order_id, version, updated_at):
+    """
+        Returns the ETag and Last-Modified headers of the given version of a purchase order
+    """
+    return {
+        'ETag': quote_etag(f'{purchase_order_id}-{version}'),
+        'Last-Modified': http_date(updated_at.timestamp()),
+    }
+
 
 @extend_schema_view(
     get=extend_schema(summary="Retrieve a purchase order", operation_id="retrieve_purchase_order"),
@@ -76,43 +284,206 @@ class PurchaseOrderDetailsView(APIView):
 
     def get(self, request, id, *args, **kwargs):
         """
-            This method returns the specific purchase order with given id 
+            This method returns the specific purchase order with given id, from the archive when it was archived.
+            Only the version of the order is read when the client already has it (304)
+            or when its serialized form is in the response cache.
+            Only the fields selected by ?fields= and ?expand= are read and returned.
         """
         try:
-            purchase_order = PurchaseOrder.objects.get(pk=id)
-        except PurchaseOrder.DoesNotExist:
+            fields = selected_fields(self.request.query_params)
+        except ValueError as error:
+            return Response({"error": str(error)}, status=status.HTTP_400_BAD_REQUEST)
+
+        order_model, line_item_model = PurchaseOrder, LineItem
+        version = PurchaseOrder.objects.filter(pk=id).values('version', 'updated_at').first()
+        if version is None:
+            order_model, line_item_model = ArchivedPurchaseOrder, ArchivedLineItem
+            version = ArchivedPurchaseOrder.objects.filter(pk=id).values('version', 'updated_at').first()
+        if version is None:
             return Response({'error': 'Purchase Order not found'}, status=status.HTTP_404_NOT_FOUND)
 
-        serializer = PurchaseOrderSerializer(purchase_order)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        headers = validator_headers(id, **version)
+        not_modified = get_conditional_response(
+            request, etag=headers['ETag'], last_modified=int(version['updated_at'].timestamp())
+        )
+        if not_modified is not None:
+            for header, value in headers.items():
+                not_modified[header] = value
+            return not_modified
+
+        # Only the full representation is cached
+        response_cache = get_response_cache() if fields == FIELDS else None
+        data = response_cache and response_cache.get(id, (version['version'], version['updated_at']))
+        if data is None:
+            queryset = order_model.objects.filter(pk=id)
+            row = order_rows(queryset, *VERSION_FIELDS, fields=fields).first()
+            if row is None:
+                return Response({'error': 'Purchase Order not found'}, status=status.HTTP_404_NOT_FOUND)
+
+            [data] = serialize_order_rows([row], using=queryset.db, fields=fields, line_item_models=(line_item_model,))
+            headers = validator_headers(id, row['version'], row['updated_at'])
+            if response_cache is not None:
+                response_cache.set(id, (row['version'], row['updated_at']), data)
+
+        return Response(data, status=status.HTTP_200_OK, headers=headers)
     
+    @idempotent
     def put(self, request, id, *args, **kwargs):
         """
             This method updates a specific purchase order with given id 
         """
-        try:
-            purchase_order = PurchaseOrder.objects.get(pk=id)
-        except PurchaseOrder.DoesNotExist:
-            return Response({'error': 'Purchase Order not found'}, status=status.HTTP_404_NOT_FOUND)
-
-        serializer = PurchaseOrderSerializer(instance=purchase_order, data=request.data)
-        if serializer.is_valid():
-            purchase_order_instance = serializer.save()
-            return Response(serializer.data, status=status.HTTP_200_OK)
-        else:
-            print("this error: ",serializer.errors)
-            return Response({"error": "Invalid purchase order data."}, status=status.HTTP_400_BAD_REQUEST)
+        return update_purchase_order(request, id, request.data)
     
     def delete(self, request, id, *args, **kwargs):
         """
-            This method deletes a specific purchase order with givenid 
+            This method deletes a specific purchase order with given id and its line items
         """
-        try:
-            purchase_order = PurchaseOrder.objects.get(pk=id)
-        except PurchaseOrder.DoesNotExist:
+        deleted, _ = bulk_delete_purchase_orders(PurchaseOrder.objects.filter(pk=id), max_count=1)
+        if not deleted:
+            if ArchivedPurchaseOrder.objects.filter(pk=id).exists():
+                return Response({'error': ARCHIVED_ORDER_ERROR}, status=status.HTTP_409_CONFLICT)
             return Response({"detail": "Purchase Order with given ID does not exist"}, status=status.HTTP_404_NOT_FOUND)
 
-        serializer = PurchaseOrderSerializer(purchase_order)
-        serializer.destroy(serializer.data)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+@extend_schema_view(
+    get=extend_schema(
+        summary="Changes to the purchase orders since a cursor", operation_id="list_purchase_order_changes",
+        responses=OpenApiTypes.OBJECT,
+    )
+)
+class PurchaseOrderChangesView(APIView):
+
+    def get(self, request, *args, **kwargs):
+        """
+            This method returns up to ?limit= changes logged after the ?after= sequence number and the cursor to
+            pass as ?after= next. Without ?after= no change is returned, only the cursor of the end of the log.
+        """
+        try:
+            after = parse_cursor(request.query_params.get('after'))
+            limit = parse_limit(request.query_params.get('limit'))
+            after = start_cursor(after, log_bounds())
+        except ValueError as error:
+            return Response({"error": str(error)}, status=status.HTTP_400_BAD_REQUEST)
+        except CursorExpired as error:
+            return Response({"error": str(error)}, status=status.HTTP_410_GONE)
+
+        changes, cursor = read_changes(after, limit)
+        return Response({"changes": [serialize_change(change) for change in changes], "cursor": cursor}, status=status.HTTP_200_OK)
+
+
+@extend_schema_view(
+    get=extend_schema(
+        summary="Purchase order response cache statistics", operation_id="purchase_order_cache_stats",
+        responses=OpenApiTypes.OBJECT,
+    )
+)
+class PurchaseOrderCacheStatsView(APIView):
+
+    def get(self, request, *args, **kwargs):
+        """
+            This method returns the hit and miss counters of the purchase order response cache of this process
+        """
+        return Response(get_response_cache().get_stats(), status=status.HTTP_200_OK)
+
+
+@extend_schema_view(
+    get=extend_schema(summary="Spend per supplier by day or month", operation_id="spend_report", responses=OpenApiTypes.OBJECT)
+)
+class SpendReportView(APIView):
+
+    def get(self, request, *args, **kwargs):
+        """
+            This method returns the order count, quantity, spend and tax of each supplier per ?period=day|month,
+            read from the spend rollup and optionally limited to ?start= and ?end= days and ?supplier= ids
+        """
+        try:
+            params = spend_report_params(self.request.query_params)
+        except ValueError as error:
+            return Response({"error": str(error)}, status=status.HTTP_400_BAD_REQUEST)
+
+        rows = spend_report(**params)
+        results = [
+            {
+                'period': row['period'].isoformat(),
+                'supplier': {'id': row['supplier_id'], 'name': row['supplier__name']},
+                'order_count': row['order_count'],
+                'total_quantity': row['total_quantity'],
+                'total_amount': row['total_amount'],
+                'total_tax': row['total_tax'],
+            }
+            for row in rows
+        ]
+        return Response({"period": params['period'], "results": results}, status=status.HTTP_200_OK)
+
+
+@extend_schema_view(
+    post=extend_schema(summary="Submit an export or report job", operation_id="create_job", responses={202: JobSerializer})
+)
+class JobCreateView(APIView):
+    serializer_class = JobSerializer
+
+    @idempotent
+    def post(self, request, *args, **kwargs):
+        """
+            This method queues a job of the given job_type (order_export or spend_report) for the run_workers command
+        """
+        if not isinstance(request.data, dict):
+            return Response({"error": "Expected a job object."}, status=status.HTTP_400_BAD_REQUEST)
+        job_type = request.data.get('job_type')
+        try:
+            params = clean_job(job_type, request.data.get('params'))
+        except ValueError as error:
+            return Response({"error": str(error)}, status=status.HTTP_400_BAD_REQUEST)
+
+        job = Job.objects.create(job_type=job_type, params=params)
+        serializer = JobSerializer(job, context={'request': request})
+        headers = {'Location': request.build_absolute_uri(reverse('job-details', args=[job.id]))}
+        return Response(serializer.data, status=status.HTTP_202_ACCEPTED, headers=headers)
+
+
+@extend_schema_view(
+    get=extend_schema(summary="Retrieve the status and progress of a job", operation_id="retrieve_job")
+)
+class JobDetailsView(APIView):
+    serializer_class = JobSerializer
+
+    def get(self, request, id, *args, **kwargs):
+        """
+            This method returns the status of the job with given id, with its result_url once it has succeeded
+        """
+        try:
+            job = Job.objects.get(id=id)
+        except Job.DoesNotExist:
+            return Response({"error": "Job not found."}, status=status.HTTP_404_NOT_FOUND)
+        return Response(JobSerializer(job, context={'request': request}).data, status=status.HTTP_200_OK)
+
+
+@extend_schema_view(
+    get=extend_schema(
+        summary="Download the result file of a job", operation_id="download_job_result",
+        responses={(200, 'application/octet-stream'): OpenApiTypes.BINARY},
+    )
+)
+class JobResultView(APIView):
+
+    def get(self, request, id, *args, **kwargs):
+        """
+            This method streams the result file of the job with given id
+        """
+        try:
+            job = Job.objects.get(id=id)
+        except Job.DoesNotExist:
+            return Response({"error": "Job not found."}, status=status.HTTP_404_NOT_FOUND)
+        if job.status != Job.SUCCEEDED:
+            return Response({"error": f"Job is {job.status}, it has no result."}, status=status.HTTP_409_CONFLICT)
+        try:
+            file = open(result_path(job), 'rb')
+        except FileNotFoundError:
+            return Response({"error": "The result file of this job was deleted."}, status=status.HTTP_410_GONE)
 
-        return Response(status=status.HTTP_204_NO_CONTENT)
\ No newline at end of file
+        return FileResponse(
+            file, as_attachment=True, content_type=job.result_content_type,
+            filename=JOB_TYPES[job.job_type].file_name(job.params),
+        )
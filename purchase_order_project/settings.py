@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/5.0/ref/settings/
 """
 
 from pathlib import Path
+import os
 import sys
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -43,6 +44,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'purchase_order.middleware.InstrumentationMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -50,6 +52,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'purchase_order.middleware.ReplicaRoutingMiddleware',
 ]
 
 ROOT_URLCONF = 'purchase_order_project.urls'
@@ -97,6 +100,28 @@ DATABASES = {
 if 'test' in sys.argv:
     DATABASES['default'] = DATABASES['test']
 
+# Read replicas of the default database, with the same keys as a DATABASES entry.
+# GET requests read the purchase orders from them, see purchase_order.routers.PrimaryReplicaRouter.
+# To try it locally with SQLite, copy db.sqlite3 to replica.sqlite3 and use
+# READ_REPLICAS = {'replica': {'ENGINE': 'django.db.backends.sqlite3', 'NAME': BASE_DIR / 'replica.sqlite3'}}
+READ_REPLICAS = {}
+
+for alias, replica in READ_REPLICAS.items():
+    DATABASES[alias] = dict(replica, TEST={'MIRROR': 'default'})
+
+PURCHASE_ORDER_READ_REPLICAS = list(READ_REPLICAS)
+
+# Seconds during which a client keeps reading from the primary after a write
+PURCHASE_ORDER_REPLICA_STICKY_SECONDS = 5
+
+# Persistent connections: seconds to keep a connection open (0 closes it after each request, None keeps it forever),
+# and whether to check it is still usable before reusing it
+for database in DATABASES.values():
+    database.setdefault('CONN_MAX_AGE', int(os.environ.get('DB_CONN_MAX_AGE', 0)))
+    database.setdefault('CONN_HEALTH_CHECKS', os.environ.get('DB_CONN_HEALTH_CHECKS', '1') == '1')
+
+DATABASE_ROUTERS = ['purchase_order.routers.PrimaryReplicaRouter']
+
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators
 
@@ -117,6 +142,81 @@ AUTH_PASSWORD_VALIDATORS = [
 
 REST_FRAMEWORK = {
     'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',
+    'DEFAULT_RENDERER_CLASSES': [
+        'purchase_order.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+}
+
+# Requests slower than this are logged with their slowest SQL queries
+PURCHASE_ORDER_SLOW_REQUEST_MS = 500
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'structured': {'()': 'purchase_order.instrumentation.StructuredFormatter'},
+    },
+    'handlers': {
+        'structured_console': {'class': 'logging.StreamHandler', 'formatter': 'structured'},
+    },
+    'loggers': {
+        'purchase_order': {'handlers': ['structured_console'], 'level': 'INFO', 'propagate': False},
+    },
+}
+
+# Default and maximum number of purchase orders returned per page of the list endpoint
+PURCHASE_ORDER_PAGE_SIZE = 50
+PURCHASE_ORDER_MAX_PAGE_SIZE = 500
+
+# Maximum number of purchase orders returned by the search endpoint
+PURCHASE_ORDER_MAX_SEARCH_RESULTS = 100
+
+# Maximum number of purchase orders accepted by one bulk create request
+PURCHASE_ORDER_MAX_BULK_SIZE = 1000
+
+# Maximum number of purchase orders deleted by one bulk delete request
+PURCHASE_ORDER_MAX_BULK_DELETE = 10000
+
+# Cache of serialized purchase orders used by the detail endpoint.
+# Use 'purchase_order.cache.DjangoResponseCache' with an 'ALIAS' of CACHES to share it between processes.
+PURCHASE_ORDER_RESPONSE_CACHE = {
+    'BACKEND': 'purchase_order.cache.LocalMemoryResponseCache',
+    'MAX_ENTRIES': 10000,
+}
+
+# Seconds the response of a request sent with an Idempotency-Key header is replayed for.
+# Expired keys are deleted by the purge_idempotency_keys command.
+PURCHASE_ORDER_IDEMPOTENCY_KEY_TTL = 24 * 60 * 60
+
+# Background jobs run by the run_workers command: directory of the result files, seconds without a progress
+# heartbeat after which a running job is given to another worker, attempts before it is failed, and seconds
+# a finished job and its result file are kept for
+PURCHASE_ORDER_JOB_RESULTS_DIR = BASE_DIR / 'job_results'
+PURCHASE_ORDER_JOB_TIMEOUT = 300
+PURCHASE_ORDER_JOB_MAX_ATTEMPTS = 3
+PURCHASE_ORDER_JOB_RESULT_TTL = 7 * 24 * 60 * 60
+
+# OpenAPI schema served at /schema/, regenerate it with `python manage.py spectacular --file schema.yml`
+PURCHASE_ORDER_SCHEMA_FILE = BASE_DIR / 'schema.yml'
+
+# Age in days after which the archive_orders command moves purchase orders to the archive tables
+PURCHASE_ORDER_ARCHIVE_AFTER_DAYS = 90
+
+# Change feed of the purchase orders: changes per batch, seconds between two polls of the log, seconds a missing
+# sequence number holds back the changes after it once first seen (longer than the longest write transaction),
+# longest long-poll, seconds between SSE keepalives, seconds an SSE stream stays open, concurrent SSE streams per
+# process, and days the changes are kept.
+# Expired changes are deleted by the purge_order_changes command.
+PURCHASE_ORDER_CHANGE_FEED = {
+    'BATCH_SIZE': 500,
+    'POLL_INTERVAL': 1.0,
+    'GAP_TIMEOUT': 10,
+    'LONG_POLL_TIMEOUT': 25,
+    'HEARTBEAT_INTERVAL': 15,
+    'MAX_STREAM_DURATION': 300,
+    'MAX_STREAMS': 100,
+    'RETENTION_DAYS': 7,
 }
 
 